@@ -0,0 +1,83 @@
+import click
+from flask.cli import with_appcontext
+
+from .schema import upgrade_schema
+
+
+def register_commands(app):
+    app.cli.add_command(upgrade_schema_command)
+    app.cli.add_command(migrate_project_files_command)
+    app.cli.add_command(backfill_annotation_offsets_command)
+    app.cli.add_command(migrate_labels_command)
+    app.cli.add_command(rebuild_statistics_command)
+    app.cli.add_command(train_tagger_command)
+
+
+@click.command('upgrade-schema')
+@with_appcontext
+def upgrade_schema_command():
+    """Adds the tables, columns and indexes introduced since the database was created."""
+    upgrade_schema()
+    print("Schema is up to date")
+
+
+@click.command('migrate-project-files')
+@with_appcontext
+@click.option('--batch-size', default=50, show_default=True)
+def migrate_project_files_command(batch_size):
+    """Moves inline projects.file_text into the compressed blob store."""
+    from .services.project_service import migrate_project_files
+
+    migrated = migrate_project_files(batch_size)
+    print(f"Done, {migrated} projects migrated")
+
+
+@click.command('backfill-annotation-offsets')
+@with_appcontext
+@click.option('--batch-size', default=500, show_default=True, help='sentences per transaction')
+def backfill_annotation_offsets_command(batch_size):
+    """Computes start/end offsets for annotations stored before offsets were recorded."""
+    from .services.annotation_service import backfill_annotation_offsets
+
+    updated = backfill_annotation_offsets(batch_size)
+    print(f"Done, {updated} annotations updated")
+
+
+@click.command('migrate-labels')
+@with_appcontext
+@click.option('--batch-size', default=10000, show_default=True, help='annotation ids per transaction')
+def migrate_labels_command(batch_size):
+    """Fills annotations.label_id from the free-text labels of existing annotations."""
+    from .services.label_service import migrate_annotation_labels
+
+    updated = migrate_annotation_labels(batch_size)
+    print(f"Done, {updated} annotations labeled")
+
+
+@click.command('rebuild-statistics')
+@with_appcontext
+def rebuild_statistics_command():
+    """Recomputes the annotation_stats rollup from the annotations table."""
+    from .services.statistics_service import rebuild_statistics
+
+    rows = rebuild_statistics()
+    print(f"Done, {rows} statistics rows")
+
+
+@click.command('train-tagger')
+@with_appcontext
+@click.option('--language', required=True, help='projects.language to train on')
+@click.option('--epochs', default=None, type=int, help='passes over the data (default TAGGER_EPOCHS)')
+@click.option('--batch-size', default=1000, show_default=True, help='sentences per database read')
+def train_tagger_command(language, epochs, batch_size):
+    """Trains the suggestion tagger of a language on its annotated sentences."""
+    from .services.tagger_service import train_tagger
+
+    summary = train_tagger(language, epochs, batch_size)
+    if summary is None:
+        print(f"No annotated sentences with offsets and labels for {language}")
+        return
+    scores = summary['held_out']
+    print(f"Done, {summary['sentences']} sentences, {len(summary['labels'])} labels, {summary['features']} features "
+          f"in {summary['seconds']}s; held-out F1 {scores['f1']} (P {scores['precision']}, R {scores['recall']}) "
+          f"-> {summary['path']}")
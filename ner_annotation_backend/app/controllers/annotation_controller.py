@@ -1,11 +1,18 @@
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, current_app, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .. import db
 from ..models.annotation_model import Annotation
 from ..models.sentence_model import Sentence
 from ..schemas.annotation_schema import annotations_schema
-from ..services.annotation_service import  search_annotations, search_sentences_by_annotation, upload_annotated_xml, upload_annotations, get_annotations, get_project_annotations, \
-    generate_annotations_xml, generate_annotations_txt
+from ..services.agreement_service import get_project_agreement
+from ..services.annotation_service import  apply_annotation_changes, fuzzy_search_annotations, search_annotations, search_sentences_by_annotation, upload_annotated_xml, upload_annotations, get_annotations
+from ..services.export_service import EXPORTERS, export_project, get_exporter, list_exporters
+from ..services.label_service import get_label_counts
+from ..services.statistics_service import apply_stat_changes, count_annotations, get_statistics
+from ..services.suggestion_service import get_sentence_suggestions, pre_annotate_project
+from ..services.tagger_service import suggest_annotations
+from ..services.fuzzy_index import MAX_EDIT_DISTANCE
+from ..services.export_cache import bump_project_version, export_etag, get_cached_export, get_project_version, iter_and_cache, iter_file
 
 annotation_blueprint = Blueprint('annotation_blueprint', __name__)
 
@@ -18,6 +25,14 @@ def upload_annotation_route():
     return upload_annotations(annotation_data, current_user)
 
 
+@annotation_blueprint.route("/update_annotations", methods=['PATCH'])
+@jwt_required()
+def update_annotations_route():
+    current_user = get_jwt_identity()
+    result, status = apply_annotation_changes(request.json or {}, current_user)
+    return jsonify(result), status
+
+
 @annotation_blueprint.route("/get_annotations", methods=['POST'])
 @jwt_required()
 def get_annotations_route():
@@ -36,43 +51,76 @@ def clear_annotations_route():
     if not sentence_id or not project_id:
         return jsonify({'message': 'sentence_id and project_id are required'}), 400
 
-    Annotation.query.filter_by(sentence_id=sentence_id, project_id=project_id).delete()
+    cleared = (Annotation.sentence_id == sentence_id, Annotation.project_id == project_id)
+    apply_stat_changes(removed=count_annotations(*cleared))
+    Annotation.query.filter(*cleared).delete()
 
     sentence = Sentence.query.get(sentence_id)
     if sentence:
         sentence.is_annotated = False
         db.session.add(sentence)
 
+    bump_project_version([project_id])
     db.session.commit()
     return jsonify({'message': 'Annotations cleared successfully'}), 200
 
 
 
-@annotation_blueprint.route('/download_annotations_xml', methods=['POST'])
+@annotation_blueprint.route('/export_formats', methods=['GET'])
 @jwt_required()
-def download_annotations_xml():
-    project_id = request.json['project_id']
-    sentences = get_project_annotations(project_id)
-    xml_content = generate_annotations_xml(sentences)
+def export_formats_route():
+    return jsonify(list_exporters()), 200
 
-    response = Response(xml_content, mimetype='application/xml')
-    response.headers['Content-Disposition'] = f'attachment; filename=project_{project_id}_annotations.xml'
 
-    return response
+@annotation_blueprint.route('/download_annotations/<export_format>', methods=['POST'])
+@jwt_required()
+def download_annotations(export_format):
+    exporter = get_exporter(export_format)
+    if exporter is None:
+        return jsonify({'message': f'Unknown export format: {export_format}', 'formats': sorted(EXPORTERS)}), 400
+    return export_response(request.json['project_id'], exporter)
 
 
-@annotation_blueprint.route('/download_annotations_text', methods=['POST'])
+@annotation_blueprint.route('/download_annotations_xml', methods=['POST'])
 @jwt_required()
-def download_annotations_text():
-    project_id = request.json['project_id']
-    sentences = get_project_annotations(project_id)
-    txt_content = generate_annotations_txt(sentences)
+def download_annotations_xml():
+    return export_response(request.json['project_id'], get_exporter('xml'))
 
-    # Create a response with the TXT content and appropriate headers
-    # to trigger download on the client side
-    response = Response(txt_content, mimetype='text/plain')
-    response.headers['Content-Disposition'] = f'attachment; filename=project_{project_id}_annotations.txt'
 
+@annotation_blueprint.route('/download_annotations_text', methods=['POST'])
+@jwt_required()
+def download_annotations_text():
+    return export_response(request.json['project_id'], get_exporter('txt'))
+
+
+def export_response(project_id, exporter):
+    version = get_project_version(project_id)
+    if version is None:
+        chunks = export_project(project_id, exporter)
+        response = Response(stream_with_context(chunks), mimetype=exporter.mimetype)
+    else:
+        etag = export_etag(project_id, exporter, version)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        cached_path = get_cached_export(project_id, exporter, version)
+        if cached_path and request.accept_encodings['gzip']:
+            # The artifact is already gzip, so it is sent as it is on disk
+            response = Response(iter_file(cached_path), mimetype=exporter.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        elif cached_path:
+            response = Response(iter_file(cached_path, decompress=True), mimetype=exporter.mimetype)
+        else:
+            # Streamed batch by batch, so the first bytes go out before the whole project is read
+            chunks = iter_and_cache(project_id, exporter, version, export_project(project_id, exporter))
+            response = Response(stream_with_context(chunks), mimetype=exporter.mimetype)
+        response.set_etag(etag, weak=True)
+        response.headers['Vary'] = 'Accept-Encoding'
+
+    suffix = '' if exporter.name in ('xml', 'txt') else f'_{exporter.name}'
+    response.headers['Content-Disposition'] = f'attachment; filename=project_{project_id}_annotations{suffix}.{exporter.extension}'
     return response
 
 
@@ -103,8 +151,19 @@ def search_annotations_route():
     if not word_phrase:
         return jsonify({'message': 'word_phrase is required'}), 400
 
+    # Paging is opt-in: with a limit the response is a page with next_after_id and total_estimate
+    try:
+        limit = int(data['limit']) if data.get('limit') is not None else None
+        after_id = int(data['after_id']) if data.get('after_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'message': 'limit and after_id should be integers'}), 400
+    if limit is not None and not 1 <= limit <= 1000:
+        return jsonify({'message': 'limit should be between 1 and 1000'}), 400
+
     # Call the service method
-    results = search_annotations(word_phrase)
+    results = search_annotations(word_phrase, limit=limit, after_id=after_id)
+    if limit is not None:
+        return jsonify(results), 200
 
     if not results:
         return jsonify({'message': 'No annotations found matching the criteria'}), 404
@@ -112,6 +171,29 @@ def search_annotations_route():
     return jsonify(results), 200
 
 
+@annotation_blueprint.route("/fuzzy_search_annotations", methods=['POST'])
+@jwt_required()
+def fuzzy_search_annotations_route():
+    data = request.json or {}
+
+    word_phrase = data.get("word_phrase")
+    if not word_phrase:
+        return jsonify({'message': 'word_phrase is required'}), 400
+
+    try:
+        max_distance = int(data.get('max_distance', 1))
+        limit = int(data.get('limit', 50))
+        project_id = int(data['project_id']) if data.get('project_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'message': 'max_distance, limit and project_id should be integers'}), 400
+    if not 0 <= max_distance <= MAX_EDIT_DISTANCE:
+        return jsonify({'message': f'max_distance should be between 0 and {MAX_EDIT_DISTANCE}'}), 400
+    if not 1 <= limit <= 1000:
+        return jsonify({'message': 'limit should be between 1 and 1000'}), 400
+
+    return jsonify(fuzzy_search_annotations(word_phrase, max_distance, project_id, limit)), 200
+
+
 @annotation_blueprint.route("/search_sentences_by_annotation", methods=['POST'])
 @jwt_required()
 def search_sentences_by_annotation_route():
@@ -129,3 +211,77 @@ def search_sentences_by_annotation_route():
 
     results = search_sentences_by_annotation(annotation_text, project_title)
     return jsonify(results), 200
+
+
+@annotation_blueprint.route("/label_counts", methods=['POST'])
+@jwt_required()
+def label_counts_route():
+    data = request.json or {}
+    return jsonify(get_label_counts(data.get('project_id'))), 200
+
+
+@annotation_blueprint.route("/statistics", methods=['POST'])
+@jwt_required()
+def statistics_route():
+    data = request.json or {}
+    try:
+        project_id = int(data['project_id']) if data.get('project_id') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'message': 'project_id should be an integer'}), 400
+    return jsonify(get_statistics(project_id)), 200
+
+
+@annotation_blueprint.route("/agreement", methods=['POST'])
+@jwt_required()
+def agreement_route():
+    data = request.json or {}
+    try:
+        project_id = int(data['project_id'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'project_id is required and should be an integer'}), 400
+
+    result, status = get_project_agreement(project_id, reference=data.get('reference'))
+    return jsonify(result), status
+
+
+@annotation_blueprint.route("/pre_annotate", methods=['POST'])
+@jwt_required()
+def pre_annotate_route():
+    data = request.json or {}
+    try:
+        project_id = int(data['project_id'])
+        sentence_ids = [int(sentence_id) for sentence_id in data['sentence_ids']] \
+            if data.get('sentence_ids') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'project_id is required; project_id and sentence_ids should be integers'}), 400
+
+    result, status = pre_annotate_project(project_id, sentence_ids)
+    return jsonify(result), status
+
+
+@annotation_blueprint.route("/get_suggestions", methods=['POST'])
+@jwt_required()
+def get_suggestions_route():
+    data = request.json or {}
+    if not data.get('sentence_id'):
+        return jsonify({'message': 'sentence_id is required'}), 400
+
+    suggestions = get_sentence_suggestions(data['sentence_id'])
+    if suggestions is None:
+        return jsonify({'message': 'Sentence not found'}), 404
+    return jsonify(suggestions), 200
+
+
+@annotation_blueprint.route("/model_suggestions", methods=['POST'])
+@jwt_required()
+def model_suggestions_route():
+    data = request.json or {}
+    try:
+        sentence_ids = [int(sentence_id) for sentence_id in data['sentence_ids']]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'message': 'sentence_ids should be a list of integers'}), 400
+
+    max_sentences = current_app.config.get('TAGGER_MAX_SENTENCES', 500)
+    if len(sentence_ids) > max_sentences:
+        return jsonify({'message': f'At most {max_sentences} sentences per request'}), 400
+    return jsonify(suggest_annotations(sentence_ids)), 200
@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..services.project_service import assign_user_to_project, create_project, delete_project,get_projects_with_annotation_counts_for_user, get_projects_with_annotation_counts, is_user_assigned_to_project, update_project_title, send_assignment_email
+from ..services.project_service import assign_user_to_project, create_project, create_project_from_xml_stream, delete_project, get_original_file,get_projects_with_annotation_counts_for_user, get_projects_with_annotation_counts, is_user_assigned_to_project, update_project_title, send_assignment_email
 from ..schemas.project_schema import project_schema, projects_schema
+from ..services.batch_import_service import batch_create_projects
+from ..services.import_job_service import submit_import_job, get_import_job_status
 from ..services.user_service import get_user_language, get_user_role,get_user_id, get_user_organisation
 from ..models.user_model import User
 from ..models.project_model import Project
@@ -55,11 +57,15 @@ def add_project():
         filename = file.filename.lower()
         if not (filename.endswith('.txt') or filename.endswith('.xml')):
             return jsonify({'message': 'Invalid file format. Please upload a .txt or .xml file.'}), 400
-        
+
+        # XML uploads are parsed straight from the upload stream unless streaming=false is sent
+        if filename.endswith('.xml') and data.get('streaming', 'true').lower() != 'false':
+            project = create_project_from_xml_stream(data, file.stream, current_user)
+            return project_created_response(project)
+
         # Extract the content from the file
         try:
             file_content = file.read().decode('utf-8')
-            print("File Content Read:", file_content)  # Debugging
 
             # Add the file content to the data dictionary
             data['file_text'] = file_content
@@ -71,12 +77,13 @@ def add_project():
     # Ensure 'file_text' is present before passing to create_project
     if 'file_text' not in data:
         return jsonify({'message': 'Missing file_text in request'}), 400
-    
-    print("Data before project creation:", data)  # Debugging
 
     # Process the file (text or XML)
     project = create_project(data, current_user)  
+    return project_created_response(project)
 
+
+def project_created_response(project):
     # Handle error responses from create_project
     if isinstance(project, tuple):  # Means create_project returned (jsonify({...}), status_code)
         return project
@@ -86,11 +93,88 @@ def add_project():
         "message": "Project created successfully!",
         "project_id": project.id,
         "title": project.title,
-        "language": project.language
+        "language": project.language,
+        "ingest": project.ingest_stats
     }), 201
 
 
 
+@project_blueprint.route('/add_project_async', methods=['POST'])
+@jwt_required()
+def add_project_async():
+    """
+    Queues the upload as a background import job and returns the job id straight away.
+    Progress is polled through /import_status/<job_id>.
+    """
+    current_user = get_jwt_identity()
+    data = request.form.to_dict()
+
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return jsonify({'message': 'No file selected for uploading'}), 400
+
+    filename = file.filename.lower()
+    if not (filename.endswith('.txt') or filename.endswith('.xml')):
+        return jsonify({'message': 'Invalid file format. Please upload a .txt or .xml file.'}), 400
+
+    job = submit_import_job(file, data, current_user)
+    return jsonify({
+        "message": "Project import queued",
+        "job_id": job.id,
+        "status_url": f"/project/import_status/{job.id}"
+    }), 202
+
+
+@project_blueprint.route('/batch_add_projects', methods=['POST'])
+@jwt_required()
+def batch_add_projects():
+    """
+    Creates one project per file from several .txt/.xml uploads and/or .zip archives,
+    sent as 'files'. title (used as a prefix), description and language apply to all.
+    """
+    current_user = get_jwt_identity()
+    data = request.form.to_dict()
+    files = request.files.getlist('files')
+
+    if not files:
+        return jsonify({'message': 'No files in the request'}), 400
+
+    summary = batch_create_projects(files, data, current_user)
+    status_code = 201 if summary['created'] else 400
+    return jsonify(summary), status_code
+
+
+@project_blueprint.route('/import_status/<int:job_id>', methods=['GET'])
+@jwt_required()
+def import_status_route(job_id):
+    current_user = get_jwt_identity()
+    result, status_code = get_import_job_status(job_id, current_user)
+    return jsonify(result), status_code
+
+
+@project_blueprint.route('/original_file/<int:project_id>', methods=['GET'])
+@jwt_required()
+def original_file_route(project_id):
+    """
+    Streams back the file a project was created from. It is only read from the
+    blob store here, never when projects are listed.
+    """
+    project, chunks = get_original_file(project_id)
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+
+    first_chunk = next(chunks, b'')
+    extension = 'xml' if first_chunk.lstrip().startswith(b'<') else 'txt'
+
+    def generate():
+        yield first_chunk
+        yield from chunks
+
+    response = Response(stream_with_context(generate()), mimetype=f'application/{extension}' if extension == 'xml' else 'text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=project_{project_id}_original.{extension}'
+    return response
+
+
 @project_blueprint.route('/delete_project/<int:project_id>', methods=['DELETE'])
 @jwt_required()
 def delete_project_route(project_id):
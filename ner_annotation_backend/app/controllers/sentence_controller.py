@@ -1,13 +1,14 @@
 from flask_mail import Message
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_mail import Mail
 from ..models.user_model import User
-from ..schemas.sentence_schema import sentences_schema
 from ..models.sentence_model import Sentence
 from .. import db
 from ..models.project_model import Project
-from ..services.sentence_service import get_sentences
+from ..services.id_encoding import ENCODINGS, assigned_sentence_ids, encode_ids, project_sentence_ids, project_sentence_status
+from ..services.sentence_service import DEFAULT_SENTENCE_FIELDS, MAX_PAGE_SIZE, SENTENCE_FIELDS, get_sentences, search_sentences
+from ..services.work_queue_service import next_sentences, release_sentences
 
 sentence_blueprint = Blueprint('sentence_blueprint', __name__)
 mail = Mail()
@@ -15,30 +16,90 @@ mail = Mail()
 @sentence_blueprint.route('/get_sentences', methods=['POST'])
 @jwt_required()
 def get_sentence():
+    """
+    Sentences of a project. Without limit/after_id the whole project is returned as a
+    list (the original response); with them, one page and the cursor of the next:
+    {"project_id", "after_id", "limit", "fields", "status", "assigned_to_me"}.
+    """
     current_user = get_jwt_identity()
-    data = request.json
-    sentences = get_sentences(data)
-    return sentences_schema.jsonify(sentences), 200
+    data = request.json or {}
+    if not data.get("project_id"):
+        return jsonify({"message": "Project ID is required"}), 400
+
+    try:
+        project_id = int(data["project_id"])
+        after_id = int(data["after_id"]) if data.get("after_id") is not None else None
+        limit = min(MAX_PAGE_SIZE, max(1, int(data["limit"]))) if data.get("limit") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"message": "project_id, after_id and limit should be integers"}), 400
+    if after_id is not None and limit is None:
+        limit = MAX_PAGE_SIZE
+
+    fields = tuple(dict.fromkeys(data.get("fields") or DEFAULT_SENTENCE_FIELDS))
+    unknown = [field for field in fields if field not in SENTENCE_FIELDS]
+    if unknown:
+        return jsonify({"message": f"Unknown fields {unknown}, expected some of {list(SENTENCE_FIELDS)}"}), 400
+
+    status = data.get("status")
+    if status not in (None, "all", "annotated", "unannotated"):
+        return jsonify({"message": "status should be 'all', 'annotated' or 'unannotated'"}), 400
+
+    user_id = None
+    if data.get("assigned_to_me"):
+        user = User.query.filter_by(email=current_user).first()
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+        user_id = user.id
+
+    return jsonify(get_sentences(project_id, fields, after_id, limit, status, user_id)), 200
+
+@sentence_blueprint.route('/search_sentences', methods=['POST'])
+@jwt_required()
+def search_sentences_route():
+    data = request.json or {}
+    query_text = data.get("query")
+    if not query_text:
+        return jsonify({"message": "query is required"}), 400
+
+    try:
+        page = max(1, int(data.get("page", 1)))
+        per_page = min(100, max(1, int(data.get("per_page", 20))))
+        project_id = int(data["project_id"]) if data.get("project_id") else None
+    except (TypeError, ValueError):
+        return jsonify({"message": "page, per_page and project_id should be integers"}), 400
+
+    return jsonify(search_sentences(query_text, project_id, page, per_page)), 200
+
+def requested_encoding(value):
+    """The id encoding a request asked for (see docs/sentence_id_encoding.md), None when unknown."""
+    encoding = value or "list"
+    return encoding if encoding in ENCODINGS else None
+
+
+def is_empty(encoded):
+    return not encoded if isinstance(encoded, list) else encoded["count"] == 0
+
 
 @sentence_blueprint.route('/get_sentence_ids', methods=['POST'])
 @jwt_required()
 def get_sentence_ids():
     """
-    Fetches only the sentence IDs of a project.
+    Fetches only the sentence IDs of a project, as a list or range/bitmap encoded ("encoding").
     """
-    data = request.json
+    data = request.json or {}
     project_id = data.get("project_id")
 
     if not project_id:
         return jsonify({"message": "Project ID is required"}), 400
+    encoding = requested_encoding(data.get("encoding"))
+    if encoding is None:
+        return jsonify({"message": f"encoding should be one of {list(ENCODINGS)}"}), 400
 
-    sentences = Sentence.query.with_entities(Sentence.id).filter_by(project_id=project_id).all()
+    sentence_ids = encode_ids(project_sentence_ids(project_id), encoding)
 
-    if not sentences:
+    if is_empty(sentence_ids):
         return jsonify({"message": "No sentences found for this project"}), 404
 
-    sentence_ids = [sentence.id for sentence in sentences]
-
     return jsonify({"sentence_ids": sentence_ids}), 200
 
 
@@ -46,20 +107,22 @@ def get_sentence_ids():
 @jwt_required()
 def get_sentence_status():
     """
-    Fetches assigned and unassigned sentences for a project.
+    Fetches assigned and unassigned sentences for a project, as lists or range/bitmap encoded ("encoding").
     """
-    data = request.get_json()
+    data = request.get_json() or {}
     project_id = data.get("project_id")
 
     if not project_id:
         return jsonify({"message": "Project ID is required"}), 400
+    encoding = requested_encoding(data.get("encoding"))
+    if encoding is None:
+        return jsonify({"message": f"encoding should be one of {list(ENCODINGS)}"}), 400
 
-    assigned_sentences = Sentence.query.filter(Sentence.project_id == project_id, Sentence.user_id.isnot(None)).all()
-    unassigned_sentences = Sentence.query.filter(Sentence.project_id == project_id, Sentence.user_id.is_(None)).all()
+    assigned_sentences, unassigned_sentences = project_sentence_status(project_id)
 
     return jsonify({
-        "assigned_sentences": [sentence.id for sentence in assigned_sentences],
-        "unassigned_sentences": [sentence.id for sentence in unassigned_sentences]
+        "assigned_sentences": encode_ids(assigned_sentences, encoding),
+        "unassigned_sentences": encode_ids(unassigned_sentences, encoding)
     }), 200
 
 
@@ -67,26 +130,76 @@ def get_sentence_status():
 @jwt_required()
 def get_assigned_sentences():
     """
-    Fetches the sentence IDs assigned to the current user.
+    Fetches the sentence IDs assigned to the current user, as a list or range/bitmap encoded (?encoding=).
     """
     current_user_email = get_jwt_identity()
     user = User.query.filter_by(email=current_user_email).first()
 
     if not user:
         return jsonify({"message": "User not found"}), 404
+    encoding = requested_encoding(request.args.get("encoding"))
+    if encoding is None:
+        return jsonify({"message": f"encoding should be one of {list(ENCODINGS)}"}), 400
 
-    # Fetching sentences assigned to the user
-    assigned_sentences = Sentence.query.filter(Sentence.user_id == user.id).all()
-
+    # Fetching the ids of the sentences assigned to the user
+    sentence_ids = encode_ids(assigned_sentence_ids(user.id), encoding)
 
-    if not assigned_sentences:
+    if is_empty(sentence_ids):
         return jsonify({"message": "No sentences assigned to the user"}), 200
 
-    sentence_ids = [sentence.id for sentence in assigned_sentences]
-
     return jsonify({"assigned_sentence_ids": sentence_ids}), 200
 
 
+@sentence_blueprint.route('/next_sentences', methods=['POST'])
+@jwt_required()
+def next_sentences_route():
+    """
+    Leases the current user their next unannotated sentences of a project (see
+    work_queue_service.next_sentences); "count" defaults to WORK_QUEUE_PREFETCH.
+    """
+    data = request.get_json() or {}
+    try:
+        project_id = int(data["project_id"])
+        count = int(data["count"]) if data.get("count") is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"message": "project_id is required; project_id and count should be integers"}), 400
+
+    max_count = current_app.config.get("WORK_QUEUE_MAX_PREFETCH", 100)
+    if count is not None and not 1 <= count <= max_count:
+        return jsonify({"message": f"count should be between 1 and {max_count}"}), 400
+
+    user = User.query.filter_by(email=get_jwt_identity()).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    if not Project.query.get(project_id):
+        return jsonify({"message": "Project not found"}), 404
+
+    return jsonify(next_sentences(project_id, user.id, count)), 200
+
+
+@sentence_blueprint.route('/release_sentences', methods=['POST'])
+@jwt_required()
+def release_sentences_route():
+    """
+    Gives back the current user's leases on "sentence_ids", or on all their sentences of "project_id".
+    """
+    data = request.get_json() or {}
+    try:
+        sentence_ids = [int(sentence_id) for sentence_id in data["sentence_ids"]] \
+            if data.get("sentence_ids") is not None else None
+        project_id = int(data["project_id"]) if data.get("project_id") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"message": "sentence_ids and project_id should be integers"}), 400
+    if sentence_ids is None and project_id is None:
+        return jsonify({"message": "sentence_ids or project_id is required"}), 400
+
+    user = User.query.filter_by(email=get_jwt_identity()).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify({"released": release_sentences(user.id, sentence_ids, project_id)}), 200
+
+
 @sentence_blueprint.route('/assign_sentences', methods=['POST'])
 @jwt_required()
 def assign_sentences():
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from .. import db
+from .label_model import Label
 
 
 class Annotation(db.Model):
@@ -8,8 +9,13 @@ class Annotation(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     word_phrase = db.Column(db.String(120), nullable=False)
+    # Character offsets of word_phrase in Sentence.content (content[start_offset:end_offset])
+    start_offset = db.Column(db.Integer, nullable=True)
+    end_offset = db.Column(db.Integer, nullable=True)
     annotation = db.Column(db.Text, nullable=False)
+    # Dictionary id of the label text above, for integer filters and counts
+    label_id = db.Column(db.SmallInteger, db.ForeignKey('labels.id'), nullable=True, index=True)
     annotated_by = db.Column(db.Text, nullable=False)
     annotated_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'), nullable=False)
+    sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'), nullable=False, index=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
@@ -0,0 +1,15 @@
+from .. import db
+
+
+class AnnotationStat(db.Model):
+    """
+    Rollup of annotations per project, label and annotator, kept in step by every write
+    to annotations (see statistics_service), so dashboards never scan annotations.
+    Annotations without a label_id are not counted until `flask migrate-labels` fills it.
+    """
+    __tablename__ = 'annotation_stats'
+
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), primary_key=True)
+    label_id = db.Column(db.SmallInteger, db.ForeignKey('labels.id'), primary_key=True)
+    annotated_by = db.Column(db.Text, primary_key=True)
+    annotation_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from .. import db
+
+
+class AnnotationSuggestion(db.Model):
+    """
+    A span proposed by pre-annotation (the language gazetteer), kept apart from
+    annotations until an annotator accepts it with add_annotations/update_annotations.
+    """
+    __tablename__ = 'annotation_suggestions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sentence_id = db.Column(db.Integer, db.ForeignKey('sentences.id'), nullable=False, index=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    word_phrase = db.Column(db.String(120), nullable=False)
+    start_offset = db.Column(db.Integer, nullable=False)
+    end_offset = db.Column(db.Integer, nullable=False)
+    label_id = db.Column(db.SmallInteger, db.ForeignKey('labels.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False, default='gazetteer')
+    created_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
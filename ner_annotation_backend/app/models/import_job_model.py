@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from .. import db
+
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    phase = db.Column(db.String(50), nullable=False, default='queued')
+    filename = db.Column(db.String(255), nullable=False)
+    spool_path = db.Column(db.Text, nullable=False)
+    params = db.Column(db.Text, nullable=False)  # JSON encoded title/description/language
+    sentences_processed = db.Column(db.Integer, nullable=False, default=0)
+    annotations_processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=True)
+    created_by = db.Column(db.Text, nullable=False)
+    created_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_on = db.Column(db.DateTime, nullable=True)
+    finished_on = db.Column(db.DateTime, nullable=True)
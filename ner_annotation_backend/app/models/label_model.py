@@ -0,0 +1,17 @@
+from .. import db
+
+
+class Label(db.Model):
+    __tablename__ = 'labels'
+
+    # SMALLSERIAL on PostgreSQL; SQLite only auto-numbers INTEGER primary keys
+    id = db.Column(db.SmallInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    type = db.Column(db.String(50), nullable=False)  # ENAMEX, NUMEX, TIMEX (or a free-text label)
+    subtype = db.Column(db.String(100), nullable=False, default='')  # PERSON, LOCATION, ...
+
+    __table_args__ = (db.UniqueConstraint('type', 'subtype', name='unique_label_type_subtype'),)
+
+    @property
+    def name(self):
+        """The label as stored in Annotation.annotation, e.g. 'ENAMEX (PERSON)'."""
+        return f"{self.type} ({self.subtype})" if self.subtype else self.type
@@ -0,0 +1,13 @@
+from datetime import datetime
+
+from .. import db
+
+
+class ProjectBlob(db.Model):
+    __tablename__ = 'project_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)  # hash of the uncompressed upload
+    codec = db.Column(db.String(10), nullable=False)  # 'zstd' or 'gzip'
+    size = db.Column(db.BigInteger, nullable=False)  # uncompressed size in bytes
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
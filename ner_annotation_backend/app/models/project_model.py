@@ -1,5 +1,6 @@
 from datetime import datetime
 from .. import db
+from .project_blob_model import ProjectBlob
 
 class Project(db.Model):
     __tablename__ = 'projects'
@@ -8,10 +9,16 @@ class Project(db.Model):
     title = db.Column(db.String(120), nullable=False)
     description = db.Column(db.Text, nullable=False)
     language = db.Column(db.String(50), nullable=False)
-    file_text = db.Column(db.Text, nullable=False)
+    # Legacy inline copy of the upload, only read lazily; new uploads live in project_blobs
+    file_text = db.deferred(db.Column(db.Text, nullable=True))
+    file_blob_hash = db.Column(db.String(64), db.ForeignKey('project_blobs.sha256'), nullable=True)
     uploaded_by = db.Column(db.Text, nullable=False)
     uploaded_on = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     assigned_to = db.Column(db.Integer, nullable=True)  # ✅ Change from String to Integer
     is_assigned = db.Column(db.Boolean, nullable=False, default=False)  # Boolean flag
+    # Bumped by every write that changes the exported content; keys the export cache
+    change_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by writes that insert sentences or change their text; keys the sentence search index
+    sentence_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     sentences = db.relationship('Sentence', backref='project', lazy=True)
     annotations = db.relationship('Annotation', backref='project', lazy=True)
@@ -10,6 +10,18 @@ class Sentence(db.Model):
     is_annotated = db.Column(db.Boolean, default=False, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True) 
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    # Work queue lease (work_queue_service): who is annotating the sentence, and until when
+    leased_to = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
     annotations = db.relationship('Annotation', backref='sentence', lazy=True)
 
-    __table_args__ = (db.UniqueConstraint('id', 'project_id', name='unique_sentence_per_project'),)
\ No newline at end of file
+    __table_args__ = (
+        db.UniqueConstraint('id', 'project_id', name='unique_sentence_per_project'),
+        # Keyset pages of a project (get_sentences) and per-project batches
+        db.Index('ix_sentences_project_id_id', 'project_id', 'id'),
+        # Sentence ids assigned to a user (check_assigned_sentences)
+        db.Index('ix_sentences_user_id_id', 'user_id', 'id'),
+        # The work queue's candidates: unannotated sentences of a project in id order
+        db.Index('ix_sentences_unannotated', 'project_id', 'id',
+                 postgresql_where=db.text('NOT is_annotated'), sqlite_where=db.text('NOT is_annotated')),
+    )
\ No newline at end of file
@@ -0,0 +1,79 @@
+from sqlalchemy import inspect, text
+
+from . import db
+from .services.search_index import WORD_CHARACTERS
+from .services.statistics_service import rebuild_statistics
+
+# Columns added to tables that already exist in deployed databases. db.create_all()
+# only creates missing tables, so these are added here on startup (or `flask upgrade-schema`).
+ADDED_COLUMNS = [
+    ('projects', 'file_blob_hash', 'VARCHAR(64) REFERENCES project_blobs (sha256)'),
+    ('annotations', 'start_offset', 'INTEGER'),
+    ('annotations', 'end_offset', 'INTEGER'),
+    ('projects', 'change_version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('annotations', 'label_id', 'SMALLINT REFERENCES labels (id)'),
+    ('projects', 'sentence_version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('sentences', 'leased_to', 'INTEGER REFERENCES users (id)'),
+    ('sentences', 'lease_expires_at', 'TIMESTAMP'),
+]
+
+# Indexes added since the tables were created (create_all() only indexes tables it creates)
+ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_annotations_label_id ON annotations (label_id)",
+    # Per-sentence reads and the set-based replace in upload_annotations
+    "CREATE INDEX IF NOT EXISTS ix_annotations_sentence_id ON annotations (sentence_id)",
+    "CREATE INDEX IF NOT EXISTS ix_sentences_project_id_id ON sentences (project_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_sentences_user_id_id ON sentences (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_sentences_unannotated ON sentences (project_id, id) WHERE NOT is_annotated",
+]
+
+POSTGRES_STATEMENTS = [
+    "ALTER TABLE projects ALTER COLUMN file_text DROP NOT NULL",
+]
+
+# Run one by one, and a failure only warns: CREATE EXTENSION needs privileges the app
+# user may not have, and substring searches still work without the index, only slower.
+POSTGRES_OPTIONAL_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_annotations_word_phrase_trgm ON annotations USING gin (word_phrase gin_trgm_ops)",
+    # Sentence full-text search (PostgreSQL 12+). Words are split with the same character class
+    # as search_index.tokenize and used as lexemes as they are: PostgreSQL's own parser breaks
+    # Indic words at vowel signs, and there is no stemmer for these languages anyway.
+    "ALTER TABLE sentences ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+    f"(array_to_tsvector(array_remove(regexp_split_to_array(lower(content), '[^{WORD_CHARACTERS}]+'), ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_sentences_search_vector ON sentences USING gin (search_vector)",
+]
+
+
+def upgrade_schema():
+    # The rollup is filled once when it is created; every write keeps it up to date after that
+    statistics_missing = not inspect(db.engine).has_table('annotation_stats')
+    db.create_all()
+    inspector = inspect(db.engine)
+    is_postgres = db.engine.dialect.name == 'postgresql'
+
+    with db.engine.begin() as connection:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                print(f"Adding column {table}.{column}")
+                if_not_exists = "IF NOT EXISTS " if is_postgres else ""
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {ddl}"))
+
+        for statement in ADDED_INDEXES:
+            connection.execute(text(statement))
+
+        if is_postgres:
+            for statement in POSTGRES_STATEMENTS:
+                connection.execute(text(statement))
+
+    if is_postgres:
+        for statement in POSTGRES_OPTIONAL_STATEMENTS:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(statement))
+            except Exception as e:
+                print(f"Skipping '{statement}': {str(e)}")
+
+    if statistics_missing:
+        print(f"Filled annotation_stats with {rebuild_statistics()} rows")
@@ -3,7 +3,7 @@ from .. import ma
 
 class AnnotationSchema(ma.Schema):
     class Meta:
-        fields = ('word_phrase', 'annotation', 'sentence_id', 'project_id')
+        fields = ('word_phrase', 'start_offset', 'end_offset', 'annotation', 'sentence_id', 'project_id')
 
 
 annotation_schema = AnnotationSchema()
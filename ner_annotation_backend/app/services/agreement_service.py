@@ -0,0 +1,249 @@
+import numpy as np
+from sqlalchemy import func, select
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.label_model import Label
+
+# Category 0 of a unit is "not annotated by this annotator"; label codes are shifted by one
+NO_LABEL = 0
+
+
+def build_units(sentences, annotators, labels, starts, ends, annotator_count):
+    """
+    Turns annotation arrays (one element per annotation) into a units x annotators
+    matrix of categories.
+
+    A unit is a (sentence, start, end) span that at least one annotator labeled. Each
+    annotator who annotated the sentence gets the label code + 1 they gave the span,
+    or NO_LABEL; annotators who did not annotate the sentence at all get -1 (missing).
+    """
+    sentence_values, sentence_of_row = np.unique(sentences, return_inverse=True)
+    sentence_of_row = sentence_of_row.reshape(-1).astype(np.int64)
+
+    # One int64 key per span sorts several times faster than np.unique(axis=0) on rows
+    offset_range = int(max(starts.max(), ends.max())) + 1
+    if len(sentence_values) * offset_range ** 2 < 2 ** 62:
+        keys = (sentence_of_row * offset_range + starts) * offset_range + ends
+        unit_keys, unit_of_row = np.unique(keys, return_inverse=True)
+        sentence_of_unit = unit_keys // (offset_range * offset_range)
+    else:
+        unit_spans, unit_of_row = np.unique(np.stack([sentence_of_row, starts, ends], axis=1), axis=0, return_inverse=True)
+        sentence_of_unit = unit_spans[:, 0]
+    unit_of_row = unit_of_row.reshape(-1)
+
+    covered = np.zeros((len(sentence_values), annotator_count), dtype=bool)
+    covered[sentence_of_row, annotators] = True
+
+    ratings = np.where(covered[sentence_of_unit], NO_LABEL, -1).astype(np.int32)
+    ratings[unit_of_row, annotators] = labels + 1
+    return ratings
+
+
+def cohen_kappa(first, second, category_count):
+    """Cohen's kappa of two equally long category arrays (nan when chance agreement is 1)."""
+    if not len(first):
+        return float('nan')
+    confusion = np.bincount(first * category_count + second, minlength=category_count ** 2) \
+        .reshape(category_count, category_count).astype(np.float64)
+    total = confusion.sum()
+    observed = np.trace(confusion) / total
+    expected = (confusion.sum(axis=1) @ confusion.sum(axis=0)) / total ** 2
+    return float((observed - expected) / (1 - expected)) if expected < 1 else float('nan')
+
+
+def category_counts(ratings, category_count):
+    """units x categories matrix of how many annotators chose each category, for units with 2+ raters."""
+    rated = ratings >= 0
+    units = np.flatnonzero(rated.sum(axis=1) >= 2)
+    unit_index, annotator_index = np.nonzero(rated[units])
+    categories = ratings[units][unit_index, annotator_index]
+    return np.bincount(unit_index * category_count + categories, minlength=len(units) * category_count) \
+        .reshape(len(units), category_count)
+
+
+def fleiss_kappa(counts):
+    """Fleiss' kappa from a units x categories count matrix; units may have different numbers of raters."""
+    raters = counts.sum(axis=1).astype(np.float64)
+    if not len(raters):
+        return float('nan')
+    per_unit = ((counts.astype(np.float64) ** 2).sum(axis=1) - raters) / (raters * (raters - 1))
+    proportions = counts.sum(axis=0) / raters.sum()
+    expected = float((proportions ** 2).sum())
+    return (float(per_unit.mean()) - expected) / (1 - expected) if expected < 1 else float('nan')
+
+
+def fleiss_kappa_per_category(counts):
+    """
+    Fleiss' kappa of each category against all others (a binary split per column),
+    for every column at once.
+    """
+    counts = counts.astype(np.float64)
+    raters = counts.sum(axis=1, keepdims=True)
+    if not len(raters):
+        return np.full(counts.shape[1], np.nan)
+    per_unit = (counts ** 2 + (raters - counts) ** 2 - raters) / (raters * (raters - 1))
+    proportions = counts.sum(axis=0) / raters.sum()
+    expected = proportions ** 2 + (1 - proportions) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expected < 1, (per_unit.mean(axis=0) - expected) / (1 - expected), np.nan)
+
+
+def compute_agreement(sentences, annotators, labels, starts, ends, annotator_count, label_count, reference=None):
+    """
+    Agreement between annotators over the sentences several of them annotated.
+
+    Arguments are equally long integer arrays, one element per annotation, with
+    annotators and labels as codes in range(annotator_count) / range(label_count).
+
+    Returns the overall and per-label Fleiss' kappa, and for every annotator pair
+    Cohen's kappa and exact-span precision/recall/F1 of the second annotator against
+    the first (the reference one, when given), plus the per-label span counts pooled
+    over the pairs. Pairs only compare units in sentences both annotated, where at
+    least one of the two labeled the span.
+    """
+    category_count = label_count + 1
+    ratings = build_units(sentences, annotators, labels, starts, ends, annotator_count)
+    counts = category_counts(ratings, category_count)
+
+    if reference is None:
+        pairs = [(first, second) for first in range(annotator_count) for second in range(first + 1, annotator_count)]
+    else:
+        pairs = [(reference, other) for other in range(annotator_count) if other != reference]
+
+    matched = np.zeros(category_count, dtype=np.int64)
+    reference_spans = np.zeros(category_count, dtype=np.int64)
+    predicted_spans = np.zeros(category_count, dtype=np.int64)
+    pair_results = []
+    for first, second in pairs:
+        first_ratings, second_ratings = ratings[:, first], ratings[:, second]
+        shared = (first_ratings >= 0) & (second_ratings >= 0) & ((first_ratings > 0) | (second_ratings > 0))
+        first_ratings, second_ratings = first_ratings[shared], second_ratings[shared]
+        if not len(first_ratings):
+            continue
+
+        agreed = first_ratings[(first_ratings == second_ratings) & (first_ratings > 0)]
+        pair_matched = np.bincount(agreed, minlength=category_count)
+        pair_reference = np.bincount(first_ratings, minlength=category_count)
+        pair_predicted = np.bincount(second_ratings, minlength=category_count)
+        matched += pair_matched
+        reference_spans += pair_reference
+        predicted_spans += pair_predicted
+
+        pair_results.append(dict(
+            annotators=(first, second),
+            units=int(len(first_ratings)),
+            cohen_kappa=cohen_kappa(first_ratings, second_ratings, category_count),
+            **span_scores(pair_matched[1:].sum(), pair_reference[1:].sum(), pair_predicted[1:].sum()),
+        ))
+
+    label_kappas = fleiss_kappa_per_category(counts)
+    return {
+        'units': int(len(ratings)),
+        'rated_units': int(len(counts)),
+        'fleiss_kappa': fleiss_kappa(counts),
+        'pairs': pair_results,
+        'labels': [
+            dict(
+                label=label,
+                units=int(counts[:, label + 1].astype(bool).sum()),
+                fleiss_kappa=float(label_kappas[label + 1]),
+                **span_scores(matched[label + 1], reference_spans[label + 1], predicted_spans[label + 1]),
+            )
+            for label in range(label_count)
+        ],
+    }
+
+
+def span_scores(matched, reference_spans, predicted_spans):
+    def ratio(numerator, denominator):
+        return float(numerator) / float(denominator) if denominator else float('nan')
+
+    return {
+        'matched': int(matched),
+        'precision': ratio(matched, predicted_spans),
+        'recall': ratio(matched, reference_spans),
+        'f1': ratio(2 * matched, reference_spans + predicted_spans),
+    }
+
+
+def load_project_annotations(project_id):
+    """
+    Column arrays of the labeled, located annotations of sentences that more than one
+    annotator annotated, in one query.
+    """
+    shared_sentences = select(Annotation.sentence_id).where(Annotation.project_id == project_id) \
+        .group_by(Annotation.sentence_id).having(func.count(func.distinct(Annotation.annotated_by)) > 1)
+    rows = db.session.execute(
+        select(Annotation.sentence_id, Annotation.annotated_by, Annotation.label_id,
+               Annotation.start_offset, Annotation.end_offset)
+        .where(Annotation.project_id == project_id, Annotation.sentence_id.in_(shared_sentences),
+               Annotation.label_id.isnot(None), Annotation.start_offset.isnot(None))
+    ).all()
+    if not rows:
+        return None
+
+    sentence_ids, annotated_by, label_ids, starts, ends = zip(*rows)
+    annotator_names, annotators = np.unique(np.array(annotated_by, dtype=object), return_inverse=True)
+    label_values, labels = np.unique(np.array(label_ids, dtype=np.int64), return_inverse=True)
+    return {
+        'sentences': np.array(sentence_ids, dtype=np.int64),
+        'annotators': annotators.reshape(-1),
+        'labels': labels.reshape(-1),
+        'starts': np.array(starts, dtype=np.int64),
+        'ends': np.array(ends, dtype=np.int64),
+        'annotator_names': [str(name) for name in annotator_names],
+        'label_ids': [int(label_id) for label_id in label_values],
+    }
+
+
+def _number(value):
+    # nan (undefined, e.g. no chance disagreement) is not valid JSON
+    return None if np.isnan(value) else round(value, 4)
+
+
+def get_project_agreement(project_id, reference=None):
+    """Inter-annotator agreement of a project, overall, per annotator pair and per label."""
+    missing_offsets = db.session.query(func.count(Annotation.id)).filter(
+        Annotation.project_id == project_id, Annotation.start_offset.is_(None)
+    ).scalar()
+    data = load_project_annotations(project_id)
+    if data is None:
+        return {'project_id': project_id, 'message': 'No sentences were annotated by more than one annotator',
+                'annotations_without_offsets': missing_offsets}, 404
+
+    names = data['annotator_names']
+    reference_code = None
+    if reference is not None:
+        if reference not in names:
+            return {'message': f'{reference} did not annotate any shared sentence'}, 400
+        reference_code = names.index(reference)
+
+    result = compute_agreement(
+        data['sentences'], data['annotators'], data['labels'], data['starts'], data['ends'],
+        len(names), len(data['label_ids']), reference=reference_code,
+    )
+
+    labels = {label.id: label.name for label in Label.query.filter(Label.id.in_(data['label_ids']))}
+    scores = ('precision', 'recall', 'f1')
+    return {
+        'project_id': project_id,
+        'sentences': int(len(np.unique(data['sentences']))),
+        'annotations': int(len(data['sentences'])),
+        'annotations_without_offsets': missing_offsets,
+        'annotators': names,
+        'units': result['units'],
+        'fleiss_kappa': _number(result['fleiss_kappa']),
+        'pairs': [
+            dict({key: _number(pair[key]) for key in scores + ('cohen_kappa',)},
+                 reference=names[pair['annotators'][0]], annotator=names[pair['annotators'][1]],
+                 units=pair['units'], matched=pair['matched'])
+            for pair in result['pairs']
+        ],
+        'labels': [
+            dict({key: _number(label[key]) for key in scores + ('fleiss_kappa',)},
+                 label_id=data['label_ids'][label['label']], label=labels.get(data['label_ids'][label['label']]),
+                 units=label['units'], matched=label['matched'])
+            for label in result['labels']
+        ],
+    }, 200
@@ -1,55 +1,273 @@
+import bisect
 import datetime
-from flask import jsonify
+import json
+import time
+from collections import Counter
+from flask import current_app, jsonify
 import xml.etree.ElementTree as ET
-from sqlalchemy import or_
+from itertools import groupby
+from sqlalchemy import and_, delete, exists, func, insert, or_, text, update
+from sqlalchemy.orm import selectinload
 from app.models.project_model import Project
 import xml.etree.ElementTree as ET
-import html
-import re
 import datetime
 
 from .. import db
 from ..models.annotation_model import Annotation
 from ..models.sentence_model import Sentence
+from .export_cache import bump_project_version
+from .fuzzy_index import fuzzy_search
+from .ingest_service import iterparse_elements
+from .inline_markup import locate_phrases, parse_inline_markup, span_label
+from .label_service import find_label_ids, get_label_ids, has_unlabeled_annotations
+from .search_index import escape_like, search_phrase_index
+from .statistics_service import apply_stat_changes, count_annotations, count_rows
+
+
+REQUIRED_ANNOTATION_FIELDS = ('sentence_id', 'project_id', 'word_phrase', 'annotation')
+
+
+def locate_annotation_offsets(annotations_data, sentence_ids):
+    """
+    Returns (start_offset, end_offset) for each annotation dict, in one query for the
+    sentence texts. Offsets sent by the client are checked against the sentence,
+    missing ones are looked up.
+    """
+    sentence_contents = {str(sentence_id): content for sentence_id, content in db.session.query(
+        Sentence.id, Sentence.content
+    ).filter(Sentence.id.in_(sentence_ids))}
+    positions_by_sentence = {}
+    for position, annotation_data in enumerate(annotations_data):
+        positions_by_sentence.setdefault(str(annotation_data['sentence_id']), []).append(position)
+
+    offsets = [(None, None)] * len(annotations_data)
+    for sentence_id, positions in positions_by_sentence.items():
+        if sentence_id not in sentence_contents:
+            continue
+        located = locate_phrases(
+            sentence_contents[sentence_id],
+            [annotations_data[position]['word_phrase'] for position in positions],
+            [annotations_data[position].get('start_offset') for position in positions]
+        )
+        for position, span_offsets in zip(positions, located):
+            offsets[position] = span_offsets
+    return offsets
 
 
 def upload_annotations(annotations_data, user):
+    """
+    Replaces the annotations of every sentence in annotations_data, set-based: one
+    DELETE, one multi-row INSERT and one UPDATE of is_annotated, in one transaction
+    with the matching annotation_stats changes.
+    """
     if not annotations_data:
         return jsonify({'message': 'No input data provided'}), 400
     if not isinstance(annotations_data, list):
         return jsonify({'message': 'Input data should be a list of annotations'}), 400
+    for annotation_data in annotations_data:
+        if not isinstance(annotation_data, dict):
+            return jsonify({'message': 'Every annotation should be an object'}), 400
+        missing = [field for field in REQUIRED_ANNOTATION_FIELDS if field not in annotation_data]
+        if missing:
+            return jsonify({'message': f"Every annotation needs {', '.join(REQUIRED_ANNOTATION_FIELDS)}; missing {', '.join(missing)}"}), 400
 
-    # First, identify all unique sentence and project ID combinations
-    unique_sentence_project_ids = {(data['sentence_id'], data['project_id']) for data in annotations_data}
+    started = time.perf_counter()
+    timings = {}
 
-    # Delete existing annotations for these combinations
-    for sentence_id, project_id in unique_sentence_project_ids:
-        Annotation.query.filter_by(sentence_id=sentence_id, project_id=project_id).delete()
+    def lap(name, since):
+        now = time.perf_counter()
+        timings[f'{name}_seconds'] = round(now - since, 4)
+        return now
 
-    updated_sentence_ids = set()  # To keep track of sentence IDs that are updated
+    sentence_ids = {annotation_data['sentence_id'] for annotation_data in annotations_data}
+    project_ids = {annotation_data['project_id'] for annotation_data in annotations_data}
 
-    for annotation_data in annotations_data:
-        annotation = Annotation(
-            word_phrase=annotation_data['word_phrase'],
-            annotation=annotation_data['annotation'],
-            annotated_by=user,
-            annotated_on=datetime.datetime.now(),
-            sentence_id=annotation_data['sentence_id'],
-            project_id=annotation_data['project_id']
+    try:
+        offsets = locate_annotation_offsets(annotations_data, sentence_ids)
+        replaced = (Annotation.sentence_id.in_(sentence_ids), Annotation.project_id.in_(project_ids))
+        removed_stats = count_annotations(*replaced)
+        checkpoint = lap('lookup', started)
+
+        db.session.execute(delete(Annotation).where(*replaced).execution_options(synchronize_session=False))
+        checkpoint = lap('delete', checkpoint)
+
+        annotated_on = datetime.datetime.now()
+        label_ids = get_label_ids(annotation_data['annotation'] for annotation_data in annotations_data)
+        annotation_rows = [
+            {
+                'word_phrase': annotation_data['word_phrase'],
+                'start_offset': start_offset,
+                'end_offset': end_offset,
+                'annotation': annotation_data['annotation'],
+                'label_id': label_ids.get(annotation_data['annotation']),
+                'annotated_by': user,
+                'annotated_on': annotated_on,
+                'sentence_id': annotation_data['sentence_id'],
+                'project_id': annotation_data['project_id'],
+            }
+            for annotation_data, (start_offset, end_offset) in zip(annotations_data, offsets)
+        ]
+        db.session.execute(insert(Annotation), annotation_rows)
+        checkpoint = lap('insert', checkpoint)
+
+        db.session.execute(
+            update(Sentence)
+            .where(Sentence.id.in_(sentence_ids))
+            .values(is_annotated=True)
+            .execution_options(synchronize_session=False)
         )
-        db.session.add(annotation)
+        apply_stat_changes(count_rows(annotation_rows), removed_stats)
+        bump_project_version(project_ids)
+        checkpoint = lap('update', checkpoint)
 
-        # Check if this sentence ID has not been updated already in this session
-        if annotation_data['sentence_id'] not in updated_sentence_ids:
-            sentence = Sentence.query.get(annotation_data['sentence_id'])
-            if sentence:
-                sentence.is_annotated = True  # Set isAnnotated to True
-                db.session.add(sentence)  # Mark the sentence object as modified
-                updated_sentence_ids.add(annotation_data['sentence_id'])
+        db.session.commit()
+        lap('commit', checkpoint)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Saving annotations failed: {str(e)}")  # Debugging
+        return jsonify({'message': f'An error occurred: {str(e)}'}), 500
+
+    timings['total_seconds'] = round(time.perf_counter() - started, 4)
+    return jsonify({
+        'message': 'Annotation uploaded successfully',
+        'annotations': len(annotations_data),
+        'sentences': len(sentence_ids),
+        'timings': timings,
+    }), 201
+
+
+def apply_annotation_changes(data, user):
+    """
+    Applies a delta from the annotation UI instead of rewriting whole sentences:
+
+        {"project_id": 1,
+         "add": [{"sentence_id": 5, "word_phrase": "...", "annotation": "ENAMEX (PERSON)", "start_offset": 3}],
+         "remove": [12, 13],
+         "relabel": [{"id": 14, "annotation": "ENAMEX (LOCATION)"}]}
+
+    Rows that are not mentioned are left alone. Returns the ids of the added rows,
+    in the order of "add".
+    """
+    if not isinstance(data, dict):
+        return {'message': 'The request body should be an object with project_id, add, remove and relabel'}, 400
+    project_id = data.get('project_id')
+    additions = data.get('add') or []
+    removals = data.get('remove') or []
+    relabels = data.get('relabel') or []
+
+    if not project_id:
+        return {'message': 'project_id is required'}, 400
+    if not isinstance(additions, list) or not isinstance(removals, list) or not isinstance(relabels, list):
+        return {'message': 'add, remove and relabel should be lists'}, 400
+    if not all(isinstance(item, dict) for item in additions + relabels):
+        return {'message': 'Every item of add and relabel should be an object'}, 400
+    for addition in additions:
+        if not all(addition.get(field) for field in ('sentence_id', 'word_phrase', 'annotation')):
+            return {'message': 'Every added annotation needs sentence_id, word_phrase and annotation'}, 400
+    for relabel in relabels:
+        if not relabel.get('id') or not relabel.get('annotation'):
+            return {'message': 'Every relabel needs id and annotation'}, 400
+    try:
+        removals = [int(annotation_id) for annotation_id in removals]
+        relabels = [dict(relabel, id=int(relabel['id'])) for relabel in relabels]
+        additions = [dict(addition, sentence_id=int(addition['sentence_id'])) for addition in additions]
+    except (TypeError, ValueError):
+        return {'message': 'Annotation and sentence ids should be integers'}, 400
 
-    db.session.commit()
+    try:
+        # Removed and relabeled rows must exist in this project; nothing is written otherwise
+        touched_ids = set(removals) | {relabel['id'] for relabel in relabels}
+        existing = {}
+        if touched_ids:
+            existing = dict(db.session.query(Annotation.id, Annotation.sentence_id).filter(
+                Annotation.id.in_(touched_ids), Annotation.project_id == project_id
+            ))
+        unknown_ids = sorted(touched_ids - set(existing), key=str)
+        if unknown_ids:
+            return {'message': 'Annotations not found in this project', 'ids': unknown_ids}, 404
+
+        added_sentence_ids = {addition['sentence_id'] for addition in additions}
+        if added_sentence_ids:
+            found = db.session.query(Sentence.id).filter(
+                Sentence.id.in_(added_sentence_ids), Sentence.project_id == project_id
+            ).count()
+            if found != len(added_sentence_ids):
+                return {'message': 'Some sentences do not belong to this project'}, 400
+
+        now = datetime.datetime.now()
+        removed_stats = count_annotations(Annotation.id.in_(touched_ids)) if touched_ids else {}
+        removed_sentence_ids = {existing[annotation_id] for annotation_id in removals}
+        if removals:
+            db.session.execute(
+                delete(Annotation).where(Annotation.id.in_(removals)).execution_options(synchronize_session=False)
+            )
+
+        relabels = [relabel for relabel in relabels if relabel['id'] not in removals]  # removed wins
+        label_ids = get_label_ids([relabel['annotation'] for relabel in relabels] +
+                                  [addition['annotation'] for addition in additions])
+        if relabels:
+            db.session.execute(update(Annotation), [
+                {'id': relabel['id'], 'annotation': relabel['annotation'], 'label_id': label_ids.get(relabel['annotation']),
+                 'annotated_by': user, 'annotated_on': now}
+                for relabel in relabels
+            ])
+
+        added_stats = count_annotations(Annotation.id.in_([relabel['id'] for relabel in relabels])) if relabels else Counter()
+
+        added_ids = []
+        if additions:
+            offsets = locate_annotation_offsets(additions, added_sentence_ids)
+            added_rows = [
+                {
+                    'word_phrase': addition['word_phrase'],
+                    'start_offset': start_offset,
+                    'end_offset': end_offset,
+                    'annotation': addition['annotation'],
+                    'label_id': label_ids.get(addition['annotation']),
+                    'annotated_by': user,
+                    'annotated_on': now,
+                    'sentence_id': addition['sentence_id'],
+                    'project_id': project_id,
+                }
+                for addition, (start_offset, end_offset) in zip(additions, offsets)
+            ]
+            added_ids = db.session.scalars(
+                insert(Annotation).returning(Annotation.id, sort_by_parameter_order=True), added_rows
+            ).all()
+            added_stats.update(count_rows(added_rows))
+
+            db.session.execute(
+                update(Sentence).where(Sentence.id.in_(added_sentence_ids)).values(is_annotated=True)
+                .execution_options(synchronize_session=False)
+            )
+
+        # A sentence whose last annotation was removed is no longer annotated, as with clear_annotations
+        emptied_sentence_ids = removed_sentence_ids - added_sentence_ids
+        if emptied_sentence_ids:
+            db.session.execute(
+                update(Sentence)
+                .where(Sentence.id.in_(emptied_sentence_ids))
+                .values(is_annotated=exists().where(Annotation.sentence_id == Sentence.id))
+                .execution_options(synchronize_session=False)
+            )
+
+        apply_stat_changes(added_stats, removed_stats)
+        bump_project_version([project_id])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Applying annotation changes failed: {str(e)}")  # Debugging
+        return {'message': f'An error occurred: {str(e)}'}, 500
 
-    return jsonify({'message': 'Annotation uploaded successfully'}), 201
+    return {
+        'message': 'Annotations updated successfully',
+        'added': [
+            {'id': annotation_id, 'sentence_id': addition['sentence_id'], 'client_id': addition.get('client_id')}
+            for addition, annotation_id in zip(additions, added_ids)
+        ],
+        'removed': len(removals),
+        'relabeled': len(relabels),
+    }, 200
 
 
 def get_annotations(data):
@@ -63,31 +281,70 @@ def get_project_annotations(project_id):
     return sentences
 
 
-def generate_annotations_xml(sentences):
-    root = ET.Element("project")
-    sentences_elem = ET.SubElement(root, "sentences")
-
-    for sentence in sentences:
-        sentence_attr = {
-            "id": str(sentence.id),
-            "text": sentence.content,
-            "isAnnotated": str(sentence.is_annotated),
-            "project_id": str(sentence.project_id)
+def iter_project_sentence_batches(project_id, batch_size=None):
+    """
+    Yields the sentences of a project in id order, batch_size at a time (keyset
+    pagination on ix_sentences_project_id_id), with their annotations loaded by one
+    extra sentence_id IN (...) query per batch, which needs ix_annotations_sentence_id
+    (schema.py) to avoid a full scan of annotations per batch.
+    A batch is expunged from the session once the caller asks for the next one,
+    so memory stays flat however large the project is.
+    """
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    last_id = 0
+    while True:
+        batch = Sentence.query.options(selectinload(Sentence.annotations)).filter(
+            Sentence.project_id == project_id,
+            Sentence.id > last_id
+        ).order_by(Sentence.id).limit(batch_size).all()
+        if not batch:
+            return
+
+        yield batch
+
+        last_id = batch[-1].id
+        for sentence in batch:
+            for annotation in sentence.annotations:
+                db.session.expunge(annotation)
+            db.session.expunge(sentence)
+
+
+def sentence_xml_element(sentence):
+    sentence_attr = {
+        "id": str(sentence.id),
+        "text": sentence.content,
+        "isAnnotated": str(sentence.is_annotated),
+        "project_id": str(sentence.project_id)
+    }
+    sentence_elem = ET.Element("sentence", **sentence_attr)
+    annotations_elem = ET.SubElement(sentence_elem, "annotations")
+
+    for annotation in sentence.annotations:
+        annotation_attr = {
+            "id": str(annotation.id),
+            "word_phrase": annotation.word_phrase,
+            "annotation": annotation.annotation,
+            "annotated_by": annotation.annotated_by,
+            "annotated_on": annotation.annotated_on.strftime("%Y-%m-%d"),
         }
-        sentence_elem = ET.SubElement(sentences_elem, "sentence", **sentence_attr)
-        annotations_elem = ET.SubElement(sentence_elem, "annotations")
+        if annotation.start_offset is not None:
+            annotation_attr["start_offset"] = str(annotation.start_offset)
+            annotation_attr["end_offset"] = str(annotation.end_offset)
+        ET.SubElement(annotations_elem, "annotation", **annotation_attr)
 
-        for annotation in sentence.annotations:
-            annotation_attr = {
-                "id": str(annotation.id),
-                "word_phrase": annotation.word_phrase,
-                "annotation": annotation.annotation,
-                "annotated_by": annotation.annotated_by,
-                "annotated_on": annotation.annotated_on.strftime("%Y-%m-%d"),
-            }
-            ET.SubElement(annotations_elem, "annotation", **annotation_attr)
+    return sentence_elem
 
-    return ET.tostring(root, encoding='unicode', method='xml')
+
+def iter_annotations_xml(sentence_batches):
+    """Generator over the export document, one chunk per batch of sentences."""
+    yield '<project><sentences>'
+    for batch in sentence_batches:
+        yield ''.join(ET.tostring(sentence_xml_element(sentence), encoding='unicode') for sentence in batch)
+    yield '</sentences></project>'
+
+
+def generate_annotations_xml(sentences):
+    return ''.join(iter_annotations_xml([sentences]))
 
 
 def generate_annotations_txt(sentences):
@@ -101,96 +358,246 @@ def generate_annotations_txt(sentences):
     return "\n".join(lines)
 
 
-def upload_annotated_xml(file, user):
+def _parse_id(value):
     try:
-        # Parse the XML file
-        tree = ET.parse(file)
-        root = tree.getroot()
-    
-        for sentence_elem in root.findall(".//sentence"):
-            sentence_id = sentence_elem.get("id")
-            raw_text = sentence_elem.get("text")
-            is_annotated = sentence_elem.get("isAnnotated") == "True"
-            project_id = sentence_elem.get("project_id")
-
-            # Decode HTML entities in the raw sentence text
-            decoded_text = html.unescape(raw_text)
-
-            # Extract annotations (e.g., <ENAMEX>, <NUMEX>, etc.)
-            annotations = []
-            def annotation_extractor(match):
-                annotation_type = match.group(1)  # e.g., ENAMEX
-                attributes = match.group(2)      # e.g., ID="256" TYPE="FACILITIES"
-                annotated_word = html.unescape(match.group(3))  # Annotated text
-
-                # Parse annotation attributes (like ID, TYPE)
-                annotation_attrs = dict(re.findall(r'(\w+)="(.*?)"', attributes))
-                annotations.append({
-                    'type': annotation_type,
-                    'text': annotated_word,
-                    'attributes': annotation_attrs
-                })
-
-                # Return just the annotated word for the cleaned sentence text
-                return annotated_word
-
-            # Regex to match annotation tags (e.g., <ENAMEX ID="256" TYPE="FACILITIES">मंत्रा राजभाषा</ENAMEX>)
-            clean_text = re.sub(r'<(\w+)(.*?)>(.*?)</\1>', annotation_extractor, decoded_text)
-
-            # Save the cleaned sentence in the database
-            sentence = Sentence.query.get(sentence_id)
-            if not sentence:
-                sentence = Sentence(
-                    id=sentence_id,
-                    content=clean_text,  # Save cleaned sentence without tags
-                    is_annotated=is_annotated,
-                    project_id=project_id
-                )
-            else:
-                sentence.content = clean_text
-                sentence.is_annotated = is_annotated
-            db.session.add(sentence)
-
-            # Save annotations in the database
-            if is_annotated:
-                # Clear existing annotations for this sentence
-                Annotation.query.filter_by(sentence_id=sentence_id, project_id=project_id).delete()
-
-                for annotation in annotations:
-                    annotation_id = annotation['attributes'].get('ID')
-                    annotation_type = annotation['type']
-                    annotation_subtype = annotation['attributes'].get('TYPE', '')
-                    annotated_word = annotation['text']
-
-                    annotation_record = Annotation(
-                        id=annotation_id,
-                        word_phrase=annotated_word,
-                        annotation=f"{annotation_type} ({annotation_subtype})",
-                        annotated_by=user,
-                        annotated_on=datetime.datetime.now(),
-                        sentence_id=sentence_id,
-                        project_id=project_id
-                    )
-                    db.session.add(annotation_record)
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 
+def upload_annotated_xml(file, user):
+    """
+    Re-imports an inline-annotated export. Sentences are read one at a time and applied
+    in chunks of UPLOAD_CHUNK_SIZE, each in its own transaction with a handful of bulk
+    statements. Returns per-chunk progress; a failing chunk is rolled back and the
+    chunks before it stay committed, as the response reports.
+    """
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 1000)
+    chunks = []
+    next_numbers = {}  # project_id -> next free sentence_number, for sentences not in the database yet
+    records = []
+
+    def apply_chunk():
+        started = time.perf_counter()
+        stats = _apply_annotated_xml_chunk(records, user, next_numbers)
         db.session.commit()
-        return jsonify({'message': 'Annotated XML uploaded successfully'}), 201
+        stats.update(chunk=len(chunks) + 1, seconds=round(time.perf_counter() - started, 3))
+        chunks.append(stats)
+        print(f"Annotated XML chunk {stats['chunk']}: {stats['sentences']} sentences in {stats['seconds']}s")  # Debugging
+        records.clear()
+
+    try:
+        # Stream the XML file one <sentence> at a time instead of parsing the whole tree
+        for sentence_elem in iterparse_elements(file, "sentence"):
+            # Strip inline annotation tags (e.g., <ENAMEX ID="256" TYPE="FACILITIES">मंत्रा राजभाषा</ENAMEX>)
+            clean_text, spans = parse_inline_markup(sentence_elem.get("text") or "")
+            records.append({
+                'id': _parse_id(sentence_elem.get("id")),
+                'content': clean_text,
+                'is_annotated': sentence_elem.get("isAnnotated") == "True",
+                'project_id': _parse_id(sentence_elem.get("project_id")),
+                'spans': spans,
+            })
+            if len(records) >= chunk_size:
+                apply_chunk()
+        if records:
+            apply_chunk()
 
     except ET.ParseError:
-        return jsonify({'message': 'Invalid XML format'}), 400
+        db.session.rollback()
+        return jsonify({'message': 'Invalid XML format', 'committed_chunks': chunks}), 400
     except Exception as e:
-        return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-
-
-def search_annotations(word_phrase):
-    # Start the query for annotations filtered by word_phrase
-    query = Annotation.query.filter(Annotation.word_phrase.ilike(f"%{word_phrase}%"))
-
-    # Join Sentence and Project to fetch related data
-    query = query.join(Sentence).join(Project)
-
-    # Fetch the annotations
-    annotations = query.all()
+        db.session.rollback()
+        print(f"Annotated XML upload failed in chunk {len(chunks) + 1}: {str(e)}")  # Debugging
+        return jsonify({'message': f'An error occurred: {str(e)}', 'committed_chunks': chunks}), 500
+
+    return jsonify({
+        'message': 'Annotated XML uploaded successfully',
+        'sentences': sum(chunk['sentences'] for chunk in chunks),
+        'chunks': chunks,
+    }), 201
+
+
+def _apply_annotated_xml_chunk(records, user, next_numbers):
+    """
+    Diffs a chunk of uploaded sentences against the database (one query for the
+    sentences, one for their annotations) and writes only what changed.
+
+    An annotation whose inline ID is an annotation of the same sentence is updated
+    in place; other spans are inserted with new ids, and annotations missing from an
+    annotated sentence are deleted. Annotations of sentences not marked annotated
+    are left alone, as before.
+    """
+    sentence_ids = [record['id'] for record in records if record['id'] is not None]
+    existing_sentences = {row.id: row for row in db.session.query(
+        Sentence.id, Sentence.content, Sentence.is_annotated, Sentence.project_id
+    ).filter(Sentence.id.in_(sentence_ids))} if sentence_ids else {}
+
+    annotated_ids = [record['id'] for record in records if record['is_annotated'] and record['id'] in existing_sentences]
+    existing_annotations = {}  # sentence_id -> {annotation id: row}
+    if annotated_ids:
+        for row in db.session.query(
+            Annotation.id, Annotation.sentence_id, Annotation.word_phrase, Annotation.annotation,
+            Annotation.start_offset, Annotation.end_offset
+        ).filter(Annotation.sentence_id.in_(annotated_ids)):
+            existing_annotations.setdefault(row.sentence_id, {})[row.id] = row
+
+    now = datetime.datetime.now()
+    sentence_updates, sentence_inserts = [], []
+    annotation_updates, annotation_inserts, annotation_deletes = [], [], []
+    new_sentences = []  # (index into sentence_inserts, annotation rows) of sentences that get their id on insert
+    touched_projects = set()
+    sentence_projects = set()  # projects whose sentences were inserted or got new text
+
+    for record in records:
+        existing = existing_sentences.get(record['id'])
+        project_id = existing.project_id if existing else record['project_id']
+
+        if existing is None:
+            touched_projects.add(project_id)
+            sentence_projects.add(project_id)
+            sentence_inserts.append({
+                'content': record['content'],
+                'sentence_number': _next_sentence_number(project_id, next_numbers),
+                'is_annotated': record['is_annotated'],
+                'project_id': project_id,
+            })
+            if record['id'] is not None:
+                sentence_inserts[-1]['id'] = record['id']
+        elif existing.content != record['content'] or existing.is_annotated != record['is_annotated']:
+            touched_projects.add(project_id)
+            if existing.content != record['content']:
+                sentence_projects.add(project_id)
+            sentence_updates.append({'id': record['id'], 'content': record['content'], 'is_annotated': record['is_annotated']})
+
+        if not record['is_annotated']:
+            continue
+
+        stored = existing_annotations.get(record['id'], {}) if existing else {}
+        kept = set()
+        rows = []
+        for span in record['spans']:
+            values = {
+                'word_phrase': record['content'][span.start:span.end],
+                'start_offset': span.start,
+                'end_offset': span.end,
+                'annotation': span_label(span),
+            }
+            annotation_id = _parse_id(span.attrs.get('ID'))
+            current = stored.get(annotation_id)
+            if current is not None and annotation_id not in kept:
+                kept.add(annotation_id)
+                if any(getattr(current, key) != value for key, value in values.items()):
+                    touched_projects.add(project_id)
+                    annotation_updates.append(dict(values, id=annotation_id, annotated_by=user, annotated_on=now))
+                continue
+            rows.append(dict(values, annotated_by=user, annotated_on=now, project_id=project_id))
+
+        removed = [annotation_id for annotation_id in stored if annotation_id not in kept]
+        if rows or removed:
+            touched_projects.add(project_id)
+        annotation_deletes.extend(removed)
+        if existing is None and record['id'] is None:
+            new_sentences.append((len(sentence_inserts) - 1, rows))
+        else:
+            for row in rows:
+                row['sentence_id'] = record['id']
+            annotation_inserts.extend(rows)
+
+    if sentence_updates:
+        db.session.execute(update(Sentence), sentence_updates)
+    # An executemany takes its columns from the first row, so rows that bring their own
+    # id and rows that get one from the sequence go in separate statements
+    explicit_ids = [row for row in sentence_inserts if 'id' in row]
+    generated = [index for index, row in enumerate(sentence_inserts) if 'id' not in row]
+    if explicit_ids:
+        db.session.execute(insert(Sentence), explicit_ids)
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit ids do not advance the sequence; move it past them before it hands out more
+            db.session.execute(text(
+                "SELECT setval(pg_get_serial_sequence('sentences', 'id'), (SELECT MAX(id) FROM sentences))"
+            ))
+    if generated:
+        inserted_ids = dict(zip(generated, db.session.scalars(
+            insert(Sentence).returning(Sentence.id, sort_by_parameter_order=True),
+            [sentence_inserts[index] for index in generated]
+        ).all()))
+        for index, rows in new_sentences:
+            for row in rows:
+                row['sentence_id'] = inserted_ids[index]
+                annotation_inserts.append(row)
+    updated_ids = [row['id'] for row in annotation_updates]
+    removed_stats = count_annotations(Annotation.id.in_(annotation_deletes + updated_ids)) \
+        if annotation_deletes or updated_ids else {}
+    if annotation_deletes:
+        db.session.execute(
+            delete(Annotation).where(Annotation.id.in_(annotation_deletes)).execution_options(synchronize_session=False)
+        )
+    label_ids = get_label_ids(row['annotation'] for row in annotation_updates + annotation_inserts)
+    for row in annotation_updates + annotation_inserts:
+        row['label_id'] = label_ids.get(row['annotation'])
+    if annotation_updates:
+        db.session.execute(update(Annotation), annotation_updates)
+    if annotation_inserts:
+        db.session.execute(insert(Annotation), annotation_inserts)
+
+    added_stats = count_rows(annotation_inserts)
+    if updated_ids:
+        added_stats.update(count_annotations(Annotation.id.in_(updated_ids)))
+    apply_stat_changes(added_stats, removed_stats)
+    bump_project_version(touched_projects - sentence_projects)
+    bump_project_version(sentence_projects, sentences=True)
+
+    return {
+        'sentences': len(records),
+        'inserted_sentences': len(sentence_inserts),
+        'updated_sentences': len(sentence_updates),
+        'inserted_annotations': len(annotation_inserts),
+        'updated_annotations': len(annotation_updates),
+        'deleted_annotations': len(annotation_deletes),
+    }
+
+
+def _next_sentence_number(project_id, next_numbers):
+    if project_id not in next_numbers:
+        highest = db.session.query(func.max(Sentence.sentence_number)).filter(Sentence.project_id == project_id).scalar()
+        next_numbers[project_id] = (highest or 0) + 1
+    number = next_numbers[project_id]
+    next_numbers[project_id] += 1
+    return number
+
+
+def search_annotations(word_phrase, limit=None, after_id=None):
+    """
+    Annotations whose word_phrase contains word_phrase (case-insensitive), ordered by id,
+    with sentence text and project title loaded in the same query.
+
+    PostgreSQL answers the ILIKE from the pg_trgm GIN index; other databases use the
+    in-process trigram index. Without a limit every match is returned as a list, as
+    before. With a limit a page is returned: {"results", "next_after_id", "total_estimate"},
+    and the next page is requested with after_id=next_after_id.
+    """
+    query = db.session.query(Annotation, Sentence.content, Project.title) \
+        .join(Sentence, Annotation.sentence_id == Sentence.id) \
+        .join(Project, Annotation.project_id == Project.id)
+
+    if db.engine.dialect.name == 'postgresql':
+        query = query.filter(Annotation.word_phrase.ilike(f"%{escape_like(word_phrase)}%", escape='!'))
+        total_estimate = estimate_row_count(query) if limit else None
+        if after_id:
+            query = query.filter(Annotation.id > after_id)
+        query = query.order_by(Annotation.id)
+        rows = query.limit(limit + 1).all() if limit else query.all()
+    else:
+        matching_ids = search_phrase_index(word_phrase)
+        total_estimate = len(matching_ids)
+        if after_id:
+            matching_ids = matching_ids[bisect.bisect_right(matching_ids, after_id):]
+        if limit:
+            matching_ids = matching_ids[:limit + 1]
+        rows = []
+        for start in range(0, len(matching_ids), 5000):  # stay under SQLite's bound parameter limit
+            rows.extend(query.filter(Annotation.id.in_(matching_ids[start:start + 5000])).order_by(Annotation.id).all())
 
     results = [
         {
@@ -199,42 +606,120 @@ def search_annotations(word_phrase):
             "annotation": annotation.annotation,
             "annotated_by": annotation.annotated_by,
             "annotated_on": annotation.annotated_on.strftime("%Y-%m-%d"),
-            "sentence_text": annotation.sentence.content,  # Fetch sentence text
+            "sentence_text": sentence_text,
             "sentence_id": annotation.sentence_id,
             "project_id": annotation.project_id,
-            "project_title": annotation.project.title
+            "project_title": project_title
         }
-        for annotation in annotations
+        for annotation, sentence_text, project_title in rows
     ]
 
-    return results
+    if not limit:
+        return results
+
+    has_more = len(results) > limit
+    results = results[:limit]
+    return {
+        "results": results,
+        "next_after_id": results[-1]["id"] if has_more else None,
+        "total_estimate": total_estimate,
+    }
+
+
+def estimate_row_count(query):
+    """Planner row estimate for a query (PostgreSQL), instead of an exact COUNT(*)."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def fuzzy_search_annotations(word_phrase, max_distance=1, project_id=None, limit=50):
+    """
+    Annotated phrases within max_distance edits of word_phrase (spelling variants such
+    as a missing nukta or a different matra), with how many annotations use each.
+    Answered from the in-process bigram index, which is refreshed per changed project
+    (projects.change_version).
+    """
+    results, vocabulary_size = fuzzy_search(word_phrase, max_distance, project_id=project_id, limit=limit)
+    return {"results": results, "vocabulary_size": vocabulary_size}
 
 
 def search_sentences_by_annotation(annotation_text, project_title=None):
-    # Start the query for annotations that match the annotation text
-    query = Annotation.query \
-        .join(Sentence) \
-        .join(Project) \
-        .filter(Annotation.annotation.ilike(f"%{annotation_text}%"))
+    # Labels matching the text are resolved in the (small) label dictionary, so the
+    # annotations are filtered on the indexed integer label_id
+    label_filter = Annotation.label_id.in_(find_label_ids(annotation_text))
+    if has_unlabeled_annotations():
+        # Rows from before the label dictionary (see `flask migrate-labels`) still match on text
+        label_filter = or_(label_filter, and_(
+            Annotation.label_id.is_(None),
+            Annotation.annotation.ilike(f"%{escape_like(annotation_text)}%", escape='!')
+        ))
+
+    query = db.session.query(Annotation, Sentence.content, Project.title) \
+        .join(Sentence, Annotation.sentence_id == Sentence.id) \
+        .join(Project, Annotation.project_id == Project.id) \
+        .filter(label_filter)
 
     # If project_title is provided and not set to "All", filter by project title
-    if project_title and project_title.lower() != "All":
+    if project_title and project_title.lower() != "all":
         query = query.filter(Project.title.ilike(f"%{project_title}%"))
 
-    # Fetch matching annotations
-    annotations = query.all()
-
     # Format results
     results = [
         {
             "word_phrase": annotation.word_phrase,
             "annotation": annotation.annotation,
-            "sentence_text": annotation.sentence.content,
+            "sentence_text": sentence_text,
             "sentence_id": annotation.sentence_id,
             "project_id": annotation.project_id,
-            "project_title": annotation.project.title,
+            "project_title": title,
         }
-        for annotation in annotations
+        for annotation, sentence_text, title in query.all()
     ]
 
     return results
+
+
+def backfill_annotation_offsets(batch_size=500):
+    """
+    Fills start_offset/end_offset of existing annotations, batch_size sentences at a time.
+    Annotations whose phrase is not in the sentence text keep NULL offsets.
+    Returns the number of annotations updated.
+    """
+    updated = 0
+    last_sentence_id = 0
+    while True:
+        sentence_ids = [row.sentence_id for row in db.session.query(Annotation.sentence_id).filter(
+            Annotation.sentence_id > last_sentence_id,
+            Annotation.start_offset.is_(None)
+        ).distinct().order_by(Annotation.sentence_id).limit(batch_size)]
+        if not sentence_ids:
+            return updated
+
+        contents = dict(db.session.query(Sentence.id, Sentence.content).filter(Sentence.id.in_(sentence_ids)))
+        # All annotations of the sentence, so repeated phrases are spread over their occurrences
+        rows = db.session.query(
+            Annotation.id, Annotation.sentence_id, Annotation.word_phrase, Annotation.start_offset
+        ).filter(Annotation.sentence_id.in_(sentence_ids)).order_by(Annotation.sentence_id, Annotation.id).all()
+
+        values = []
+        for sentence_id, sentence_rows in groupby(rows, key=lambda row: row.sentence_id):
+            sentence_rows = list(sentence_rows)
+            located = locate_phrases(
+                contents.get(sentence_id) or '',
+                [row.word_phrase for row in sentence_rows],
+                [row.start_offset for row in sentence_rows]
+            )
+            for row, (start_offset, end_offset) in zip(sentence_rows, located):
+                if row.start_offset is None and start_offset is not None:
+                    values.append({'id': row.id, 'start_offset': start_offset, 'end_offset': end_offset})
+
+        if values:
+            db.session.execute(update(Annotation), values)
+        db.session.commit()
+
+        updated += len(values)
+        last_sentence_id = sentence_ids[-1]
+        print(f"Backfilled offsets for {updated} annotations (up to sentence {last_sentence_id})")
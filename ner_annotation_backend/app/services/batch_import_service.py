@@ -0,0 +1,140 @@
+import io
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+from .. import db
+from .blob_service import store_blob_bytes
+from .ingest_service import BulkSentenceWriter, iter_text_records, iter_xml_stream_records
+from .project_service import add_project_record
+from .segmentation import segment_text
+
+SUPPORTED_EXTENSIONS = ('.txt', '.xml')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=current_app.config.get('BATCH_IMPORT_PROCESSES') or os.cpu_count())
+    return _pool
+
+
+def parse_upload(filename, content, language, current_user):
+    """
+    Parses and segments one uploaded file into (content, is_annotated, annotations)
+    records. Runs in a worker process, so it must not touch the database.
+    """
+    started = time.perf_counter()
+    try:
+        if filename.lower().endswith('.xml'):
+            records = list(iter_xml_stream_records(io.BytesIO(content), current_user))
+        else:
+            text = content.decode('utf-8-sig')
+            records = list(iter_text_records(segment_text(text.strip(), language)))
+    except ET.ParseError as e:
+        return {'records': None, 'error': f'Invalid XML format: {str(e)}', 'parse_seconds': time.perf_counter() - started}
+    except Exception as e:
+        return {'records': None, 'error': str(e), 'parse_seconds': time.perf_counter() - started}
+
+    return {'records': records, 'error': None, 'parse_seconds': time.perf_counter() - started}
+
+
+def collect_uploads(files):
+    """
+    Flattens uploaded .txt/.xml files and .zip archives into (filename, bytes) pairs.
+    Returns (uploads, skipped filenames, failed results for archives that could not be read).
+    """
+    uploads = []
+    skipped = []
+    failed = []
+    for file in files:
+        filename = file.filename or ''
+        if filename.lower().endswith('.zip'):
+            # Members are kept only once the whole archive has been read
+            members, skipped_members = [], []
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    for member in archive.infolist():
+                        name = member.filename
+                        if member.is_dir() or name.startswith('__MACOSX/'):
+                            continue
+                        if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                            members.append((name, archive.read(member)))
+                        else:
+                            skipped_members.append(name)
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, OSError) as e:
+                failed.append({'filename': filename, 'status': 'failed', 'error': f'Invalid zip archive: {str(e)}'})
+                continue
+            uploads += members
+            skipped += skipped_members
+        elif filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            uploads.append((filename, file.read()))
+        elif filename:
+            skipped.append(filename)
+    return uploads, skipped, failed
+
+
+def batch_create_projects(files, data, current_user):
+    """
+    Creates one project per uploaded file. Parsing and segmentation run in parallel
+    on the process pool; this thread is the only writer and owns the DB session.
+    Each project is committed on its own, so one bad file does not undo the others.
+    """
+    uploads, skipped, failed = collect_uploads(files)
+    language = data.get('language', 'Unknown')
+    title_prefix = data.get('title')
+
+    pool = get_process_pool()
+    futures = [pool.submit(parse_upload, filename, content, language, current_user) for filename, content in uploads]
+
+    results = failed
+    for (filename, content), future in zip(uploads, futures):
+        parsed = future.result()
+        result = {
+            'filename': filename,
+            'parse_seconds': round(parsed['parse_seconds'], 3),
+        }
+        if parsed['error']:
+            result.update(status='failed', error=parsed['error'])
+            results.append(result)
+            continue
+
+        name = os.path.splitext(os.path.basename(filename))[0]
+        project_data = {
+            'title': f"{title_prefix} - {name}" if title_prefix else name,
+            'description': data.get('description', ''),
+            'language': language,
+        }
+        try:
+            new_project = add_project_record(project_data, current_user, store_blob_bytes(content))
+            writer = BulkSentenceWriter(new_project.id)
+            writer.add_records(parsed['records'])
+            stats = writer.close()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            result.update(status='failed', error=str(e))
+            results.append(result)
+            continue
+
+        result.update(status='created', project_id=new_project.id, title=project_data['title'],
+                      sentences=stats['sentences'], annotations=stats['annotations'],
+                      insert_seconds=stats['seconds'])
+        results.append(result)
+
+    return {
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'failed': sum(1 for result in results if result['status'] == 'failed'),
+        'skipped': skipped,
+        'files': results,
+    }
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import zlib
+
+from flask import current_app
+
+from .. import db
+from ..models.project_blob_model import ProjectBlob
+from ..models.project_model import Project
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=current_app.config.get('BLOB_ZSTD_LEVEL', 10)).compressobj()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def _preferred_codec():
+    codec = current_app.config.get('BLOB_CODEC', 'zstd')
+    if codec == 'zstd' and zstandard is None:
+        return 'gzip'
+    return codec
+
+
+def store_blob_stream(stream):
+    """
+    Compresses a binary stream into project_blobs and returns its sha256.
+
+    The stream is read in chunks, so only the compressed output is held in memory.
+    An upload that is already stored is not written again.
+    """
+    codec = _preferred_codec()
+    compressor = _compressor(codec)
+    digest = hashlib.sha256()
+    compressed = []
+    size = 0
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        compressed.append(compressor.compress(chunk))
+    compressed.append(compressor.flush())
+
+    sha256 = digest.hexdigest()
+    if db.session.get(ProjectBlob, sha256) is None:
+        db.session.add(ProjectBlob(sha256=sha256, codec=codec, size=size, data=b''.join(compressed)))
+        db.session.flush()
+    return sha256
+
+
+def store_blob_bytes(data):
+    return store_blob_stream(io.BytesIO(data))
+
+
+def iter_blob_chunks(sha256):
+    """Yields the decompressed blob in chunks, for streaming it back to the client."""
+    blob = db.session.get(ProjectBlob, sha256)
+    if blob is None:
+        return
+
+    decompressor = _decompressor(blob.codec)
+    data = blob.data
+    for start in range(0, len(data), CHUNK_SIZE):
+        chunk = decompressor.decompress(data[start:start + CHUNK_SIZE])
+        if chunk:
+            yield chunk
+    if blob.codec != 'zstd':
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def load_blob(sha256):
+    return b''.join(iter_blob_chunks(sha256))
+
+
+def delete_blob_if_unused(sha256):
+    if sha256 and not Project.query.with_entities(Project.id).filter_by(file_blob_hash=sha256).first():
+        ProjectBlob.query.filter_by(sha256=sha256).delete()
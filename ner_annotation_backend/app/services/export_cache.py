@@ -0,0 +1,142 @@
+import glob
+import os
+import uuid
+import zlib
+
+from flask import current_app
+from sqlalchemy import update
+
+from .. import db
+from ..models.project_model import Project
+
+CHUNK_SIZE = 256 * 1024
+
+
+def bump_project_version(project_ids, sentences=False):
+    """
+    Marks the exports of these projects as stale. Called in the same transaction as
+    every write that changes what an export contains (annotations, sentence text, clears).
+    Writes that insert sentences or change their text pass sentences=True, which also
+    bumps sentence_version (the in-process sentence search index is keyed on it).
+    """
+    project_ids = {int(project_id) for project_id in project_ids if project_id is not None}
+    if project_ids:
+        values = {'change_version': Project.change_version + 1}
+        if sentences:
+            values['sentence_version'] = Project.sentence_version + 1
+        db.session.execute(
+            update(Project)
+            .where(Project.id.in_(project_ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def get_project_version(project_id):
+    row = db.session.query(Project.change_version).filter(Project.id == project_id).first()
+    return row.change_version if row else None
+
+
+def export_etag(project_id, exporter, version):
+    # Sent as a weak ETag, since the same export goes out gzip-encoded or plain depending on the client
+    return f'project-{project_id}-v{version}-{exporter.name}'
+
+
+def _cache_dir():
+    cache_dir = current_app.config['EXPORT_CACHE_DIR']
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _cache_path(project_id, exporter_name, version):
+    return os.path.join(_cache_dir(), f"project_{project_id}_{exporter_name}_v{version}.gz")
+
+
+def get_cached_export(project_id, exporter, version):
+    """Returns the path of the gzip artifact for this version, or None on a miss."""
+    path = _cache_path(project_id, exporter.name, version)
+    try:
+        os.utime(path)  # mtime is the LRU clock
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def iter_file(path, decompress=False):
+    """Yields the artifact as stored (gzip) or decompressed, chunk by chunk."""
+    decompressor = zlib.decompressobj(31) if decompress else None
+    with open(path, 'rb') as artifact:
+        while True:
+            chunk = artifact.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        yield decompressor.flush()
+
+
+def iter_and_cache(project_id, exporter, version, chunks):
+    """
+    Passes the export chunks through to the client while writing them, gzip-compressed,
+    to a temporary file. The file only becomes the cached artifact once the whole
+    export was generated; an aborted download leaves nothing behind.
+    """
+    path = _cache_path(project_id, exporter.name, version)
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    completed = False
+
+    try:
+        with open(temporary_path, 'wb') as artifact:
+            for chunk in chunks:
+                data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                artifact.write(compressor.compress(data))
+                yield data
+            artifact.write(compressor.flush())
+        completed = True
+    finally:
+        if completed:
+            os.replace(temporary_path, path)
+            _remove_older_versions(project_id, exporter.name, path)
+            evict_exports(current_app.config.get('EXPORT_CACHE_MAX_BYTES'))
+        elif os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _remove_older_versions(project_id, exporter_name, current_path):
+    for path in glob.glob(os.path.join(_cache_dir(), f"project_{project_id}_{exporter_name}_v*.gz")):
+        if path != current_path:
+            _remove(path)
+
+
+def purge_project_exports(project_id):
+    for path in glob.glob(os.path.join(_cache_dir(), f"project_{project_id}_*.gz")):
+        _remove(path)
+
+
+def evict_exports(max_bytes):
+    """Deletes least recently used artifacts until the cache fits in max_bytes."""
+    if not max_bytes:
+        return
+
+    artifacts = []
+    for path in glob.glob(os.path.join(_cache_dir(), "project_*.gz")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        artifacts.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in artifacts)
+    for _, size, path in sorted(artifacts):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # removed concurrently by another worker
@@ -0,0 +1,161 @@
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from .annotation_service import generate_annotations_txt, iter_annotations_xml, iter_project_sentence_batches
+from .inline_markup import MARKUP_TYPES, Span, locate_phrases, render_inline_markup, split_label
+
+Exporter = namedtuple('Exporter', ['name', 'extension', 'mimetype', 'description', 'writer'])
+
+# Every writer is a generator over sentence batches (see iter_project_sentence_batches)
+# yielding text chunks, so all formats share one batched, eager-loaded pass over the project.
+EXPORTERS = {}
+
+TOKEN_PATTERN = re.compile(r'\S+')
+
+
+def register_exporter(name, extension, mimetype, description):
+    def decorator(writer):
+        EXPORTERS[name] = Exporter(name, extension, mimetype, description, writer)
+        return writer
+    return decorator
+
+
+def get_exporter(name):
+    return EXPORTERS.get((name or '').lower())
+
+
+def list_exporters():
+    return [
+        {'format': exporter.name, 'extension': exporter.extension, 'mimetype': exporter.mimetype,
+         'description': exporter.description}
+        for exporter in EXPORTERS.values()
+    ]
+
+
+def export_project(project_id, exporter, batch_size=None):
+    """Generator over the chunks of a project export in the given format."""
+    return exporter.writer(iter_project_sentence_batches(project_id, batch_size))
+
+
+def sentence_spans(sentence):
+    """
+    Returns [(Span, annotation)] for a sentence, ordered by start offset. Annotations
+    stored without offsets are located in the text; ones that cannot be found are skipped.
+    """
+    annotations = list(sentence.annotations)
+    missing = [annotation for annotation in annotations if annotation.start_offset is None]
+    located = dict(zip(
+        (annotation.id for annotation in missing),
+        locate_phrases(sentence.content, [annotation.word_phrase for annotation in missing])
+    ))
+
+    spans = []
+    for annotation in annotations:
+        start, end = located.get(annotation.id, (annotation.start_offset, annotation.end_offset))
+        if start is None:
+            continue
+        markup_type, subtype = split_label(annotation.annotation)
+        spans.append((Span(start, end, markup_type, subtype, {'ID': str(annotation.id), 'TYPE': subtype}), annotation))
+
+    spans.sort(key=lambda item: (item[0].start, -item[0].end))
+    return spans
+
+
+@register_exporter('xml', 'xml', 'application/xml', 'Sentences with an <annotations> list, as re-imported by create_project')
+def write_annotations_xml(sentence_batches):
+    return iter_annotations_xml(sentence_batches)
+
+
+@register_exporter('txt', 'txt', 'text/plain', 'Human-readable listing of sentences and annotations')
+def write_annotations_txt(sentence_batches):
+    for batch in sentence_batches:
+        yield generate_annotations_txt(batch) + "\n"
+
+
+@register_exporter('conll', 'conll', 'text/plain', 'One whitespace token per line with a BIO tag, blank line between sentences')
+def write_conll(sentence_batches):
+    for batch in sentence_batches:
+        lines = []
+        for sentence in batch:
+            spans = [span for span, _ in sentence_spans(sentence)]
+            for token, tag in bio_tokens(sentence.content, spans):
+                lines.append(f"{token}\t{tag}")
+            lines.append("")
+        yield "\n".join(lines) + "\n"
+
+
+def bio_tokens(text, spans):
+    """
+    Splits text on whitespace (and at span edges inside a token) and tags each token
+    B-/I-<subtype>, or O. Nested spans are tagged by the outermost one.
+    """
+    cuts = {offset for span in spans for offset in (span.start, span.end)}
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        start = match.start()
+        for cut in sorted(offset for offset in cuts if match.start() < offset < match.end()):
+            tokens.append((start, cut))
+            start = cut
+        tokens.append((start, match.end()))
+
+    tags = ['O'] * len(tokens)
+    covered_until = 0
+    for span in spans:  # ordered by start, outer spans first
+        if span.start < covered_until:
+            continue
+        label = span.subtype or span.type
+        inside = [index for index, (start, end) in enumerate(tokens) if start >= span.start and end <= span.end]
+        for position, index in enumerate(inside):
+            tags[index] = f"{'B' if position == 0 else 'I'}-{label}"
+        covered_until = span.end
+
+    return [(text[start:end], tag) for (start, end), tag in zip(tokens, tags)]
+
+
+@register_exporter('jsonl', 'jsonl', 'application/x-ndjson', 'One JSON object per sentence with character-offset spans')
+def write_jsonl(sentence_batches):
+    for batch in sentence_batches:
+        lines = []
+        for sentence in batch:
+            lines.append(json.dumps({
+                'id': sentence.id,
+                'sentence_number': sentence.sentence_number,
+                'text': sentence.content,
+                'is_annotated': sentence.is_annotated,
+                'spans': [
+                    {
+                        'id': annotation.id,
+                        'start': span.start,
+                        'end': span.end,
+                        'text': sentence.content[span.start:span.end],
+                        'label': annotation.annotation,
+                        'annotated_by': annotation.annotated_by,
+                        'annotated_on': annotation.annotated_on.strftime("%Y-%m-%d"),
+                    }
+                    for span, annotation in sentence_spans(sentence)
+                ],
+            }, ensure_ascii=False))
+        yield "\n".join(lines) + "\n"
+
+
+@register_exporter('inline_xml', 'xml', 'application/xml',
+                   'OLD inline ENAMEX/NUMEX/TIMEX format, as in 1_output.xml; re-imported by create_project')
+def write_inline_xml(sentence_batches):
+    # Labels that are not "<ENAMEX|NUMEX|TIMEX> (SUBTYPE)" have no inline form and are left out
+    yield '<project><sentences>'
+    for batch in sentence_batches:
+        chunk = []
+        for sentence in batch:
+            spans = [span for span, _ in sentence_spans(sentence) if span.type in MARKUP_TYPES]
+            sentence_elem = ET.Element("sentence", **{
+                "id": str(sentence.id),
+                "text": render_inline_markup(sentence.content, spans),
+                "isAnnotated": str(sentence.is_annotated),
+                "project_id": str(sentence.project_id)
+            })
+            ET.SubElement(sentence_elem, "annotations")
+            chunk.append(ET.tostring(sentence_elem, encoding='unicode'))
+        yield ''.join(chunk)
+    yield '</sentences></project>'
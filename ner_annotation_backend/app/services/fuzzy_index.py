@@ -0,0 +1,220 @@
+import threading
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import func
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.project_model import Project
+
+MAX_EDIT_DISTANCE = 3
+
+
+def normalize_phrase(phrase):
+    """
+    Key a phrase is indexed and matched by. NFC makes precomposed and combining-mark
+    spellings of the same letter equal; a nukta or matra that differs is one edit.
+    """
+    return unicodedata.normalize('NFC', ' '.join((phrase or '').split())).lower()
+
+
+def levenshtein(first, second, max_distance=None):
+    """
+    Edit distance (insertions, deletions, substitutions) between two strings. With
+    max_distance, any distance above it is returned as max_distance + 1 without
+    finishing the table.
+    """
+    if first == second:
+        return 0
+    if len(first) < len(second):
+        first, second = second, first
+    if max_distance is not None and len(first) - len(second) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        left = row
+        for column, second_char in enumerate(second):
+            # min() of the three moves, written out: this loop is the hot path of every search
+            cost = previous[column] if first_char == second_char else previous[column] + 1
+            if left + 1 < cost:
+                cost = left + 1
+            if previous[column + 1] + 1 < cost:
+                cost = previous[column + 1] + 1
+            current.append(cost)
+            left = cost
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    if max_distance is not None and previous[-1] > max_distance:
+        return max_distance + 1
+    return previous[-1]
+
+
+def padded_bigrams(term):
+    """Distinct bigrams of term with start/end markers, so every character is in two of them."""
+    padded = f'\x02{term}\x03'
+    return {padded[index:index + 2] for index in range(len(padded) - 1)}
+
+
+class EditDistanceIndex:
+    """
+    Terms indexed by padded bigram and by length, for lookups within a bounded edit
+    distance without comparing the query against the whole vocabulary.
+
+    An edit changes at most two bigrams, so a term within max_distance edits of the
+    query has all but at most 2 * max_distance of the query's distinct bigrams. Any
+    2 * max_distance + 1 of them therefore include one the term has; the rarest ones are
+    taken, their (short) posting sets are the candidates, and only candidates of a
+    length within max_distance are compared with levenshtein(). Queries with too few
+    bigrams for this take their candidates from the length buckets instead.
+    """
+
+    def __init__(self, terms=()):
+        self.postings = {}  # bigram -> set of terms
+        self.lengths = {}  # length -> set of terms
+        self.size = 0
+        for term in terms:
+            self.add(term)
+
+    def __contains__(self, term):
+        return term in self.lengths.get(len(term), ())
+
+    def add(self, term):
+        if term in self:
+            return False
+        self.lengths.setdefault(len(term), set()).add(term)
+        for gram in padded_bigrams(term):
+            self.postings.setdefault(gram, set()).add(term)
+        self.size += 1
+        return True
+
+    def remove(self, term):
+        if term not in self:
+            return False
+        self._discard(self.lengths, len(term), term)
+        for gram in padded_bigrams(term):
+            self._discard(self.postings, gram, term)
+        self.size -= 1
+        return True
+
+    @staticmethod
+    def _discard(buckets, key, term):
+        bucket = buckets[key]
+        bucket.discard(term)
+        if not bucket:
+            del buckets[key]
+
+    def candidates(self, query, max_distance):
+        grams = padded_bigrams(query)
+        if len(grams) > 2 * max_distance:
+            rarest = sorted((self.postings.get(gram, ()) for gram in grams), key=len)[:2 * max_distance + 1]
+            return set().union(*rarest)
+        return set().union(*(
+            self.lengths.get(length, ())
+            for length in range(len(query) - max_distance, len(query) + max_distance + 1)
+        ))
+
+    def search(self, query, max_distance):
+        """[(distance, term)] of the terms within max_distance of query."""
+        matches = []
+        for term in self.candidates(query, max_distance):
+            if abs(len(term) - len(query)) <= max_distance:
+                distance = levenshtein(query, term, max_distance)
+                if distance <= max_distance:
+                    matches.append((distance, term))
+        return matches
+
+
+class FuzzyPhraseIndex:
+    """
+    Distinct annotation phrases in an EditDistanceIndex, with how often each is used
+    per project. refresh() only re-reads the projects whose change_version moved since
+    the last call, adding phrases that became used and removing the ones no
+    annotation uses any more.
+    """
+
+    def __init__(self):
+        self.phrases = EditDistanceIndex()
+        self.counts = Counter()  # normalized phrase -> annotations, all projects
+        self.project_counts = {}  # project id -> Counter of normalized phrases
+        self.signatures = {}  # project id -> change_version
+        self.spellings = {}  # normalized phrase -> the phrase as first annotated
+
+    def refresh(self):
+        """Brings the index up to date with the annotations table; returns the projects re-read."""
+        # Every annotation write bumps its project's change_version (in the same
+        # transaction), so the small projects table alone tells which projects changed
+        signatures = dict(db.session.query(Project.id, Project.change_version).all())
+
+        for project_id in set(self.project_counts) - set(signatures):
+            self._replace_project(project_id, Counter())
+        changed = [project_id for project_id, version in signatures.items()
+                   if self.signatures.get(project_id) != version]
+        for project_id in changed:
+            self._replace_project(project_id, self._load_project(project_id))
+        self.signatures = signatures
+        return changed
+
+    def _load_project(self, project_id):
+        counts = Counter()
+        rows = db.session.query(Annotation.word_phrase, func.count(Annotation.id)) \
+            .filter(Annotation.project_id == project_id) \
+            .group_by(Annotation.word_phrase)
+        for word_phrase, count in rows:
+            phrase = normalize_phrase(word_phrase)
+            if phrase:
+                counts[phrase] += count
+                self.spellings.setdefault(phrase, word_phrase)
+        return counts
+
+    def _replace_project(self, project_id, counts):
+        previous = self.project_counts.pop(project_id, Counter())
+        self.counts.subtract(previous)
+        self.counts.update(counts)
+        for phrase in previous:
+            if self.counts[phrase] <= 0:
+                del self.counts[phrase]
+                del self.spellings[phrase]
+                self.phrases.remove(phrase)
+        for phrase in counts:
+            self.phrases.add(phrase)
+        if counts:
+            self.project_counts[project_id] = counts
+
+    def search(self, phrase, max_distance, project_id=None, limit=None):
+        """
+        [{"word_phrase", "distance", "annotation_count"}] of the phrases in use within
+        max_distance edits of phrase, closest and most used first.
+        """
+        counts = self.project_counts.get(project_id, Counter()) if project_id is not None else self.counts
+        matches = [
+            (distance, -counts[term], term)
+            for distance, term in self.phrases.search(normalize_phrase(phrase), max_distance)
+            if counts.get(term, 0) > 0
+        ]
+        matches.sort()
+        return [
+            {"word_phrase": self.spellings.get(term, term), "distance": distance, "annotation_count": -count}
+            for distance, count, term in matches[:limit]
+        ]
+
+
+_fuzzy_index = None
+_fuzzy_index_lock = threading.Lock()
+
+
+def fuzzy_search(phrase, max_distance, project_id=None, limit=None):
+    """
+    (matches, vocabulary size) from the shared FuzzyPhraseIndex, refreshed for the
+    projects that changed. The search runs under the lock too: a refresh in another
+    request changes the posting lists in place.
+    """
+    global _fuzzy_index
+    with _fuzzy_index_lock:
+        if _fuzzy_index is None:
+            _fuzzy_index = FuzzyPhraseIndex()
+        _fuzzy_index.refresh()
+        return _fuzzy_index.search(phrase, max_distance, project_id, limit), len(_fuzzy_index.counts)
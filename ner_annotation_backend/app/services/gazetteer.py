@@ -0,0 +1,204 @@
+import re
+import threading
+from collections import Counter, deque
+
+from sqlalchemy import func
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.project_model import Project
+from .search_index import WORD_CHARACTERS
+
+# Shorter phrases (single letters, digits) match everywhere and are not suggested
+MIN_PHRASE_LENGTH = 2
+
+WORD_CHARACTER = re.compile(f'[{WORD_CHARACTERS}]')
+
+
+def fold_case(text):
+    """Lowercases text when that keeps every offset in place (a few characters lowercase to two)."""
+    folded = text.lower()
+    return folded if len(folded) == len(text) else text
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a set of phrases: finds every occurrence of every
+    phrase in one pass over the text, however many phrases there are.
+
+    Phrases can be added after the automaton was built; the failure links are
+    recomputed (in memory, linear in the trie size) on the next search. Automata
+    shared between threads must be linked before they are published (see Gazetteer).
+    """
+
+    def __init__(self, phrases=()):
+        self.transitions = [{}]  # node -> {character: node}
+        self.depths = [0]
+        self.terminal = [False]  # a phrase ends at this node
+        self.failures = [0]
+        self.outputs = [0]  # nearest terminal node along the failure links, 0 for none
+        self.size = 0
+        self._stale = False
+        for phrase in phrases:
+            self.add(phrase)
+
+    def add(self, phrase):
+        node = 0
+        for character in phrase:
+            child = self.transitions[node].get(character)
+            if child is None:
+                child = len(self.transitions)
+                self.transitions.append({})
+                self.depths.append(self.depths[node] + 1)
+                self.terminal.append(False)
+                self.failures.append(0)
+                self.outputs.append(0)
+                self.transitions[node][character] = child
+            node = child
+        if self.terminal[node]:
+            return False
+        self.terminal[node] = True
+        self.size += 1
+        self._stale = True
+        return True
+
+    def _link(self):
+        queue = deque(self.transitions[0].values())
+        for child in queue:
+            self.failures[child] = 0
+            self.outputs[child] = 0
+        while queue:
+            node = queue.popleft()
+            for character, child in self.transitions[node].items():
+                failure = self.failures[node]
+                while failure and character not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                failure = self.transitions[failure].get(character, 0)
+                self.failures[child] = failure
+                self.outputs[child] = failure if self.terminal[failure] else self.outputs[failure]
+                queue.append(child)
+        self._stale = False
+
+    def iter_matches(self, text):
+        """Yields (start, end) of every phrase occurrence in text, overlapping ones included."""
+        if self._stale:
+            self._link()
+        transitions, failures, outputs, terminal, depths = \
+            self.transitions, self.failures, self.outputs, self.terminal, self.depths
+        node = 0
+        for end, character in enumerate(text, 1):
+            while node and character not in transitions[node]:
+                node = failures[node]
+            node = transitions[node].get(character, 0)
+            match = node if terminal[node] else outputs[node]
+            while match:
+                yield end - depths[match], end
+                match = outputs[match]
+
+
+class Gazetteer:
+    """
+    The annotated phrases of every project in one language, with the label each is
+    most often given, compiled into an AhoCorasick automaton.
+
+    refresh() re-reads only the projects whose change_version moved. When the set of
+    phrases changes, a new automaton is built and linked before it replaces the old
+    one, and labels is replaced rather than updated, so find() can run in other
+    threads on whatever automaton and labels it picked up, without a lock.
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.automaton = AhoCorasick()
+        self.project_phrases = {}  # project id -> Counter of (folded phrase, label id)
+        self.phrase_labels = {}  # folded phrase -> Counter of label ids
+        self.labels = {}  # folded phrase -> most frequent label id
+        self.signatures = {}  # project id -> change_version
+
+    def refresh(self):
+        # Every annotation write bumps its project's change_version in the same transaction
+        signatures = dict(db.session.query(Project.id, Project.change_version).filter(Project.language == self.language))
+
+        changed = {project_id for project_id, version in signatures.items()
+                   if self.signatures.get(project_id) != version}
+        changed |= set(self.project_phrases) - set(signatures)
+        touched = set()
+        for project_id in changed:
+            previous = self.project_phrases.pop(project_id, Counter())
+            current = self._load_project(project_id) if project_id in signatures else Counter()
+            for (phrase, label_id), count in previous.items():
+                self.phrase_labels[phrase][label_id] -= count
+            for (phrase, label_id), count in current.items():
+                self.phrase_labels.setdefault(phrase, Counter())[label_id] += count
+            if current:
+                self.project_phrases[project_id] = current
+            touched.update(phrase for phrase, _ in previous)
+            touched.update(phrase for phrase, _ in current)
+        self.signatures = signatures
+
+        if not touched:
+            return changed
+        labels = dict(self.labels)
+        for phrase in touched:
+            counts = +self.phrase_labels[phrase]  # unary + drops labels that reached zero
+            if counts:
+                self.phrase_labels[phrase] = counts
+                labels[phrase] = min(counts, key=lambda label_id: (-counts[label_id], label_id))
+            else:
+                del self.phrase_labels[phrase]
+                labels.pop(phrase, None)
+
+        if labels.keys() != self.labels.keys():
+            automaton = AhoCorasick(labels)
+            automaton._link()
+            self.automaton = automaton
+        self.labels = labels
+        return changed
+
+    def _load_project(self, project_id):
+        counts = Counter()
+        rows = db.session.query(Annotation.word_phrase, Annotation.label_id, func.count(Annotation.id)) \
+            .filter(Annotation.project_id == project_id, Annotation.label_id.isnot(None)) \
+            .group_by(Annotation.word_phrase, Annotation.label_id)
+        for word_phrase, label_id, count in rows:
+            phrase = fold_case((word_phrase or '').strip())
+            if len(phrase) >= MIN_PHRASE_LENGTH:
+                counts[(phrase, label_id)] += count
+        return counts
+
+    def find(self, text):
+        """
+        [(start, end, label id)] of the dictionary phrases in text that start and end at
+        word boundaries, leftmost-longest and not overlapping.
+        """
+        automaton, labels = self.automaton, self.labels  # refresh() replaces both, never changes them
+        folded = fold_case(text)
+        spans = []
+        last_end = 0
+        for start, end in sorted(automaton.iter_matches(folded), key=lambda match: (match[0], -match[1])):
+            if start < last_end:
+                continue
+            phrase = folded[start:end]
+            label_id = labels.get(phrase)
+            if label_id is None:
+                continue
+            if (start and WORD_CHARACTER.match(folded, start - 1) and WORD_CHARACTER.match(folded, start)) or \
+                    (end < len(folded) and WORD_CHARACTER.match(folded, end) and WORD_CHARACTER.match(folded, end - 1)):
+                continue  # inside a longer word
+            spans.append((start, end, label_id))
+            last_end = end
+        return spans
+
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+
+def get_gazetteer(language):
+    """The Gazetteer of a language, refreshed for the projects that changed since the last call."""
+    with _gazetteers_lock:
+        gazetteer = _gazetteers.get(language)
+        if gazetteer is None:
+            gazetteer = _gazetteers[language] = Gazetteer(language)
+        gazetteer.refresh()
+        return gazetteer
@@ -0,0 +1,84 @@
+import base64
+
+from sqlalchemy import select
+
+from .. import db
+from ..models.sentence_model import Sentence
+
+# Response formats of sentence id lists, see docs/sentence_id_encoding.md
+ENCODINGS = ('list', 'ranges', 'bitmap')
+
+
+def encode_ranges(ids):
+    """[[first, last], ...] inclusive runs of consecutive ids, for ids in ascending order."""
+    ranges = []
+    for sentence_id in ids:
+        if ranges and sentence_id == ranges[-1][1] + 1:
+            ranges[-1][1] = sentence_id
+        elif not ranges or sentence_id > ranges[-1][1]:
+            ranges.append([sentence_id, sentence_id])
+    return ranges
+
+
+def encode_bitmap(ids):
+    """(base, bitmap) for ids in ascending order: bit i of the bitmap (LSB first) is set when base + i is an id."""
+    base, bitmap = None, bytearray()
+    for sentence_id in ids:
+        if base is None:
+            base = sentence_id
+        offset = sentence_id - base
+        byte = offset >> 3
+        if byte >= len(bitmap):
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << (offset & 7)
+    return base, bitmap
+
+
+def encode_ids(ids, encoding='list'):
+    """ids (ascending) as a plain list, or as an {"encoding", "count", ...} object for the compact encodings."""
+    if encoding == 'list':
+        return list(ids)
+    if encoding == 'ranges':
+        ranges = encode_ranges(ids)
+        return {'encoding': 'ranges', 'count': sum(last - first + 1 for first, last in ranges), 'ranges': ranges}
+    base, bitmap = encode_bitmap(ids)
+    return {'encoding': 'bitmap', 'count': sum(bin(byte).count('1') for byte in bitmap), 'base': base,
+            'bitmap': base64.b64encode(bytes(bitmap)).decode('ascii')}
+
+
+def decode_ids(encoded):
+    """Inverse of encode_ids (the reference for the UI decoder)."""
+    if isinstance(encoded, list):
+        return encoded
+    if encoded['encoding'] == 'ranges':
+        return [sentence_id for first, last in encoded['ranges'] for sentence_id in range(first, last + 1)]
+    bitmap = base64.b64decode(encoded['bitmap'])
+    return [encoded['base'] + byte * 8 + bit
+            for byte, value in enumerate(bitmap) if value
+            for bit in range(8) if value >> bit & 1]
+
+
+def project_sentence_ids(project_id):
+    """Ids of a project's sentences, ascending, read from the (project_id, id) index only."""
+    return db.session.execute(
+        select(Sentence.id).where(Sentence.project_id == project_id).order_by(Sentence.id)
+    ).scalars()
+
+
+def assigned_sentence_ids(user_id):
+    """Ids of the sentences assigned to a user, ascending, read from the (user_id, id) index only."""
+    return db.session.execute(
+        select(Sentence.id).where(Sentence.user_id == user_id).order_by(Sentence.id)
+    ).scalars()
+
+
+def project_sentence_status(project_id):
+    """(assigned ids, unassigned ids) of a project's sentences, ascending, in one pass."""
+    assigned, unassigned = [], []
+    rows = db.session.execute(
+        select(Sentence.id, Sentence.user_id.isnot(None))
+        .where(Sentence.project_id == project_id).order_by(Sentence.id)
+    )
+    for sentence_id, is_assigned in rows:
+        (assigned if is_assigned else unassigned).append(sentence_id)
+    return assigned, unassigned
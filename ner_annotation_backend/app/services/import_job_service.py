@@ -0,0 +1,162 @@
+import datetime
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import update
+
+from .. import db
+from ..models.import_job_model import ImportJob
+from .blob_service import store_blob_stream
+from .ingest_service import BulkSentenceWriter, iter_text_records, iter_xml_stream_records
+from .project_service import add_project_record
+from .segmentation import segment_stream
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('IMPORT_WORKERS', 2),
+                thread_name_prefix='project-import'
+            )
+    return _executor
+
+
+def submit_import_job(file, data, current_user):
+    """
+    Spools the upload to disk, records an ImportJob and hands it to the worker pool.
+    Returns the job immediately; the import itself runs in the background.
+    """
+    spool_dir = current_app.config['IMPORT_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+
+    extension = os.path.splitext(file.filename.lower())[1]
+    spool_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}{extension}")
+    file.save(spool_path)
+
+    job = ImportJob(
+        filename=file.filename,
+        spool_path=spool_path,
+        params=json.dumps({key: data[key] for key in ('title', 'description', 'language') if key in data}),
+        created_by=current_user
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    get_executor().submit(run_import_job, current_app._get_current_object(), job.id)
+    return job
+
+
+def run_import_job(app, job_id):
+    with app.app_context():
+        try:
+            _run_import_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _run_import_job(job_id):
+    job = db.session.get(ImportJob, job_id)
+    data = json.loads(job.params)
+    current_user = job.created_by
+    spool_path = job.spool_path
+    is_xml = spool_path.endswith('.xml')
+    db.session.commit()  # end the read transaction before the job row is updated elsewhere
+
+    _update_job(job_id, status='running', phase='parsing', started_on=datetime.datetime.now())
+
+    # SQLite allows a single writer, so there the row is only updated between phases
+    live_progress = db.engine.dialect.name != 'sqlite'
+
+    def report_progress(stats):
+        if live_progress:
+            _update_job(job_id, phase='inserting', sentences_processed=stats['sentences'],
+                        annotations_processed=stats['annotations'])
+
+    try:
+        with open(spool_path, 'rb') as spool_file:
+            new_project = add_project_record(data, current_user, store_blob_stream(spool_file))
+            spool_file.seek(0)
+            writer = BulkSentenceWriter(new_project.id, on_flush=report_progress)
+
+            if is_xml:
+                writer.add_records(iter_xml_stream_records(spool_file, current_user))
+            else:
+                writer.add_records(iter_text_records(segment_stream(spool_file, new_project.language)))
+
+            stats = writer.close()
+
+        if live_progress:
+            _update_job(job_id, phase='committing')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Import job {job_id} failed: {str(e)}")  # Debugging
+        _update_job(job_id, status='failed', phase='failed', error=str(e), finished_on=datetime.datetime.now())
+        return
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+    _update_job(job_id, status='completed', phase='done', project_id=new_project.id,
+                sentences_processed=stats['sentences'], annotations_processed=stats['annotations'],
+                finished_on=datetime.datetime.now())
+
+
+def _update_job(job_id, **values):
+    # Separate connection, so progress is visible while the import transaction is still open
+    with db.engine.begin() as connection:
+        connection.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+
+
+def fail_interrupted_jobs():
+    """
+    Marks the jobs a previous process left queued or running as failed and removes
+    their spool files. Their worker threads died with that process, so nothing else
+    would ever finish them.
+    """
+    jobs = ImportJob.query.filter(ImportJob.status.in_(('queued', 'running'))).all()
+    for job in jobs:
+        if os.path.exists(job.spool_path):
+            os.remove(job.spool_path)
+        job.status = 'failed'
+        job.phase = 'failed'
+        job.error = 'Interrupted by a server restart, please upload the file again'
+        job.finished_on = datetime.datetime.now()
+    db.session.commit()
+    if jobs:
+        print(f"Marked {len(jobs)} interrupted import jobs as failed")  # Debugging
+    return len(jobs)
+
+
+def get_import_job_status(job_id, current_user):
+    # Only the uploader sees a job; anyone else gets the same 404 as for a missing one
+    job = ImportJob.query.filter_by(id=job_id, created_by=current_user).first()
+    if not job:
+        return {"error": "Import job not found"}, 404
+
+    elapsed = None
+    if job.started_on:
+        elapsed = ((job.finished_on or datetime.datetime.now()) - job.started_on).total_seconds()
+
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "phase": job.phase,
+        "sentences_processed": job.sentences_processed,
+        "annotations_processed": job.annotations_processed,
+        "sentences_per_second": round(job.sentences_processed / elapsed) if elapsed else None,
+        "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+        "project_id": job.project_id,
+        "error": job.error,
+        "created_on": job.created_on.strftime("%Y-%m-%d %H:%M:%S"),
+    }, 200
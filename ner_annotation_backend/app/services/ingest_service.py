@@ -0,0 +1,336 @@
+import datetime
+import io
+import re
+import time
+import xml.etree.ElementTree as ET
+
+from flask import current_app
+from sqlalchemy import insert, text
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.annotation_suggestion_model import AnnotationSuggestion
+from ..models.project_model import Project
+from ..models.sentence_model import Sentence
+from .export_cache import bump_project_version
+from .gazetteer import get_gazetteer
+from .label_service import get_label_ids
+from .inline_markup import locate_phrases, parse_inline_markup, span_label
+from .statistics_service import apply_stat_changes, count_rows
+from .suggestion_service import SUGGESTION_COLUMNS, suggestion_rows
+
+
+SENTENCE_COLUMNS = ('id', 'content', 'sentence_number', 'is_annotated', 'project_id')
+ANNOTATION_COLUMNS = ('word_phrase', 'start_offset', 'end_offset', 'annotation', 'label_id', 'annotated_by', 'annotated_on', 'sentence_id', 'project_id')
+# <TIMEX / <NUMEX in the file text, also behind any entity html.unescape turns into "<"
+OLD_FORMAT_MARKUP = re.compile(rb'(?:<|&(?:lt|LT);?|&#0*60;?|&#[xX]0*3[cC];?)(?:TIMEX|NUMEX)')
+
+
+def inline_sentence_record(sentence_elem, current_user):
+    """
+    Builds (content, is_annotated, annotations) for a <sentence> of the OLD XML format,
+    where annotations are inline TIMEX/NUMEX/ENAMEX tags inside the sentence text.
+    """
+    raw_text = sentence_elem.get("text", "").strip()
+    is_annotated = sentence_elem.get("isAnnotated") == "True"
+
+    clean_text, spans = parse_inline_markup(raw_text)
+
+    annotations = []
+    if is_annotated:
+        annotated_on = datetime.datetime.now()
+        for span in spans:
+            annotations.append({
+                'word_phrase': clean_text[span.start:span.end],
+                'start_offset': span.start,
+                'end_offset': span.end,
+                'annotation': span_label(span),
+                'annotated_by': current_user,
+                'annotated_on': annotated_on,
+            })
+
+    return clean_text, is_annotated, annotations
+
+
+def annotated_sentence_record(sentence_elem):
+    """
+    Builds (content, is_annotated, annotations) for a <sentence> of the NEW XML format
+    (<project><sentences><sentence><annotations>...), as written by the export.
+    """
+    raw_text = sentence_elem.get("text", "").strip()
+    is_annotated = sentence_elem.get("isAnnotated") == "True"
+
+    annotations = []
+    hints = []
+    annotations_elem = sentence_elem.find("annotations")
+    if annotations_elem is not None:
+        for annotation_elem in annotations_elem.findall("annotation"):
+            annotations.append({
+                'word_phrase': annotation_elem.get("word_phrase"),
+                'annotation': annotation_elem.get("annotation"),
+                'annotated_by': annotation_elem.get("annotated_by"),
+                'annotated_on': datetime.datetime.strptime(annotation_elem.get("annotated_on"), "%Y-%m-%d"),
+            })
+            start_offset = annotation_elem.get("start_offset", "")
+            hints.append(int(start_offset) if start_offset.isdigit() else None)
+
+    # Older exports have no offsets, so those are found in the sentence text
+    offsets = locate_phrases(raw_text, [annotation['word_phrase'] for annotation in annotations], hints)
+    for annotation, (start_offset, end_offset) in zip(annotations, offsets):
+        annotation['start_offset'] = start_offset
+        annotation['end_offset'] = end_offset
+
+    return raw_text, is_annotated, annotations
+
+
+def iter_inline_xml_records(root, current_user):
+    for sentence_elem in root.iter("sentence"):
+        yield inline_sentence_record(sentence_elem, current_user)
+
+
+def iter_annotated_xml_records(root):
+    sentences_root = root.find("./sentences")
+    if sentences_root is None:
+        raise ValueError("Invalid XML: <sentences> tag missing inside <project>.")
+
+    for sentence_elem in sentences_root.iter("sentence"):
+        yield annotated_sentence_record(sentence_elem)
+
+
+def iterparse_elements(source, tag, within=None):
+    """
+    Streams every <tag> element of an XML file with ET.iterparse.
+
+    Each element is complete when it is yielded and is cleared and detached from its
+    parent as soon as the caller moves on, so memory stays bounded by one element
+    no matter how large the file is.
+
+    With within, only the elements under a <within> child of the root are yielded
+    (as root.find("./within").iter(tag) would), and a file without one raises ValueError.
+    """
+    parents = []
+    root_tag = None
+    found_within = within is None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if not parents:
+                root_tag = elem.tag
+            elif len(parents) == 1 and elem.tag == within:
+                found_within = True
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        if elem.tag != tag:
+            continue
+
+        if within is None or (len(parents) > 1 and parents[1].tag == within):
+            yield elem
+
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+    if not found_within:
+        raise ValueError(f"Invalid XML: <{within}> tag missing inside <{root_tag}>.")
+
+
+def has_old_format_markup(source, chunk_size=1 << 20):
+    """
+    Whether an XML file has inline TIMEX/NUMEX tags (the OLD format), as create_project
+    decides it on the unescaped file text, read chunk by chunk from source.
+    """
+    tail = b''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return False
+        if OLD_FORMAT_MARKUP.search(tail + chunk):
+            return True
+        tail = chunk[-16:]
+
+
+def iter_xml_stream_records(source, current_user):
+    """
+    Streaming counterpart of iter_inline_xml_records / iter_annotated_xml_records.
+
+    As in create_project the format is decided for the whole file, so a first pass over
+    the (seekable) source looks for inline TIMEX/NUMEX markup. With it, every <sentence>
+    is read as the OLD format; without it, the <sentence>s of <project><sentences>.
+    """
+    start = source.tell()
+    is_old_format = has_old_format_markup(source)
+    source.seek(start)
+
+    if is_old_format:
+        for sentence_elem in iterparse_elements(source, "sentence"):
+            yield inline_sentence_record(sentence_elem, current_user)
+    else:
+        for sentence_elem in iterparse_elements(source, "sentence", within="sentences"):
+            yield annotated_sentence_record(sentence_elem)
+
+
+def iter_text_records(sentences):
+    """Yields (content, is_annotated, annotations) for already split plain text sentences."""
+    for sentence_text in sentences:
+        clean_text = sentence_text.strip()
+        if clean_text:
+            yield clean_text, False, []
+
+
+def _copy_value(value):
+    # Text format of PostgreSQL COPY: \N for NULL, backslash escapes for control characters
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class BulkSentenceWriter:
+    """
+    Buffers sentences and their annotations in memory and writes them in chunks.
+
+    Sentence ids are assigned for a whole chunk at once, so annotation rows can be
+    attached without flushing every sentence. On PostgreSQL the ids are reserved
+    from the sequence and both tables are loaded with COPY; on other databases a
+    multi-row INSERT ... RETURNING is used instead.
+
+    With pre_annotate (PRE_ANNOTATE_NEW_PROJECTS by default), every unannotated
+    sentence is also run through the gazetteer of the project's language while it
+    is still in memory, and the matches are stored as annotation_suggestions.
+    """
+
+    def __init__(self, project_id, batch_size=None, use_copy=None, on_flush=None, pre_annotate=None):
+        self.project_id = project_id
+        self.on_flush = on_flush  # called with stats() after every chunk
+        self.batch_size = batch_size or current_app.config.get('INGEST_BATCH_SIZE', 5000)
+        if use_copy is None:
+            use_copy = current_app.config.get('INGEST_USE_COPY', True)
+        self.use_copy = use_copy and db.engine.dialect.name == 'postgresql'
+        if pre_annotate is None:
+            pre_annotate = current_app.config.get('PRE_ANNOTATE_NEW_PROJECTS', False)
+        self.gazetteer = None
+        if pre_annotate:
+            language = db.session.query(Project.language).filter(Project.id == project_id).scalar()
+            self.gazetteer = get_gazetteer(language)
+
+        self.sentence_count = 0
+        self.annotation_count = 0
+        self.suggestion_count = 0
+        self._sentences = []
+        self._annotations = []  # (index into self._sentences, annotation row)
+        self._started = time.perf_counter()
+
+    def add(self, content, is_annotated=False, annotations=()):
+        self.sentence_count += 1
+        self._sentences.append({
+            'content': content,
+            'sentence_number': self.sentence_count,
+            'is_annotated': is_annotated,
+            'project_id': self.project_id,
+        })
+        index = len(self._sentences) - 1
+        for annotation in annotations:
+            self._annotations.append((index, annotation))
+
+        if len(self._sentences) >= self.batch_size:
+            self.flush()
+
+    def add_records(self, records):
+        for content, is_annotated, annotations in records:
+            self.add(content, is_annotated, annotations)
+
+    def flush(self):
+        if not self._sentences:
+            return
+
+        sentence_ids = self._write_sentences(self._sentences)
+
+        annotation_rows = []
+        for index, annotation in self._annotations:
+            row = dict(annotation)
+            row['sentence_id'] = sentence_ids[index]
+            row['project_id'] = self.project_id
+            annotation_rows.append(row)
+        if annotation_rows:
+            label_ids = get_label_ids(row['annotation'] for row in annotation_rows)
+            for row in annotation_rows:
+                row['label_id'] = label_ids.get(row['annotation'])
+            self._write_rows(Annotation, ANNOTATION_COLUMNS, annotation_rows)
+            apply_stat_changes(count_rows(annotation_rows))
+
+        self.annotation_count += len(annotation_rows)
+        # Callers may commit between chunks, so in-process indexes must see each one as a change
+        bump_project_version([self.project_id], sentences=True)
+        if self.gazetteer is not None and self.gazetteer.labels:
+            self._write_suggestions(sentence_ids)
+        self._sentences = []
+        self._annotations = []
+
+        if self.on_flush:
+            self.on_flush(self.stats())
+
+    def _write_suggestions(self, sentence_ids):
+        now = datetime.datetime.now()
+        rows = []
+        for sentence, sentence_id in zip(self._sentences, sentence_ids):
+            if not sentence['is_annotated']:
+                rows.extend(suggestion_rows(self.gazetteer, sentence_id, self.project_id, sentence['content'], now))
+        if rows:
+            self._write_rows(AnnotationSuggestion, SUGGESTION_COLUMNS, rows)
+        self.suggestion_count += len(rows)
+
+    def close(self):
+        self.flush()
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started
+        rows = self.sentence_count + self.annotation_count
+        return {
+            'sentences': self.sentence_count,
+            'annotations': self.annotation_count,
+            'suggestions': self.suggestion_count,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed > 0 else rows,
+            'method': 'copy' if self.use_copy else 'insert',
+        }
+
+    def _write_sentences(self, rows):
+        if self.use_copy:
+            sentence_ids = self._reserve_sentence_ids(len(rows))
+            for row, sentence_id in zip(rows, sentence_ids):
+                row['id'] = sentence_id
+            self._write_rows(Sentence, SENTENCE_COLUMNS, rows)
+            return sentence_ids
+
+        return db.session.scalars(
+            insert(Sentence).returning(Sentence.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+
+    def _reserve_sentence_ids(self, count):
+        result = db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence('sentences', 'id')) FROM generate_series(1, :count)"),
+            {'count': count}
+        )
+        return sorted(row[0] for row in result)
+
+    def _write_rows(self, model, columns, rows):
+        if not self.use_copy:
+            db.session.execute(insert(model), rows)
+            return
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(row.get(column)) for column in columns))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        # COPY runs on the session's own connection, so it is part of the same transaction
+        cursor = db.session.connection().connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
@@ -0,0 +1,147 @@
+import html
+import re
+from collections import namedtuple
+
+# start/end are character offsets into the cleaned sentence text
+Span = namedtuple('Span', ['start', 'end', 'type', 'subtype', 'attrs'])
+
+TAG_PATTERN = re.compile(r'<(/?)(ENAMEX|NUMEX|TIMEX)\b([^>]*)>')
+ATTRIBUTE_PATTERN = re.compile(r'(\w+)="(.*?)"')
+LABEL_PATTERN = re.compile(r'^\s*(\w+)\s*\((.*)\)\s*$')
+
+MARKUP_TYPES = ('ENAMEX', 'NUMEX', 'TIMEX')
+
+
+def parse_inline_markup(raw_text):
+    """
+    Strips inline ENAMEX/NUMEX/TIMEX markup from a sentence in one linear pass.
+
+    raw_text is the sentence as stored in the XML text attribute (entities may be
+    escaped once more). Returns (clean_text, spans), with spans ordered by start.
+    Nested tags produce nested spans; unbalanced tags are dropped from the text
+    without producing a span.
+    """
+    text = html.unescape(raw_text)
+    if '<' not in text:
+        return text, []
+
+    # split() yields text, closing slash, tag, attributes, text, ... in one C-level pass
+    pieces = TAG_PATTERN.split(text)
+    parts = []
+    spans = []
+    open_tags = []  # (type, attribute string, start offset)
+    offset = 0
+
+    for index in range(0, len(pieces), 4):
+        segment = pieces[index]
+        if segment:
+            if open_tags:
+                segment = html.unescape(segment)  # annotated words are unescaped twice, as before
+            parts.append(segment)
+            offset += len(segment)
+        if index + 1 == len(pieces):
+            break
+
+        tag = pieces[index + 2]
+        if not pieces[index + 1]:
+            open_tags.append((tag, pieces[index + 3], offset))
+        elif open_tags and open_tags[-1][0] == tag:
+            tag, attributes, start = open_tags.pop()
+            attrs = dict(ATTRIBUTE_PATTERN.findall(attributes))
+            spans.append(Span(start, offset, tag, attrs.get('TYPE', ''), attrs))
+
+    if len(spans) > 1:
+        spans.sort(key=lambda span: (span.start, -span.end))
+    return ''.join(parts), spans
+
+
+def locate_phrases(content, phrases, hints=None):
+    """
+    Returns a (start, end) pair per phrase, or (None, None) when it is not in content.
+
+    hints are start offsets sent along with the phrases; a hint is used when the phrase
+    really starts there. Otherwise a phrase that repeats takes the next occurrence, so
+    two annotations of the same word land on two different places in the sentence.
+    """
+    offsets = []
+    cursors = {}  # phrase -> where to look for its next occurrence
+    for index, phrase in enumerate(phrases):
+        if not phrase:
+            offsets.append((None, None))
+            continue
+
+        hint = hints[index] if hints else None
+        if isinstance(hint, int) and hint >= 0 and content.startswith(phrase, hint):
+            start = hint
+        else:
+            start = content.find(phrase, cursors.get(phrase, 0))
+            if start == -1 and phrase in cursors:
+                start = content.find(phrase)  # more annotations than occurrences
+            if start == -1:
+                offsets.append((None, None))
+                continue
+
+        end = start + len(phrase)
+        cursors[phrase] = max(cursors.get(phrase, 0), end)
+        offsets.append((start, end))
+    return offsets
+
+
+def has_inline_markup(raw_text):
+    return TAG_PATTERN.search(html.unescape(raw_text)) is not None
+
+
+def span_label(span):
+    """Label string stored in Annotation.annotation, e.g. 'ENAMEX (PERSON)'."""
+    return f"{span.type} ({span.subtype})"
+
+
+def split_label(label):
+    """'ENAMEX (PERSON)' -> ('ENAMEX', 'PERSON'); labels without a subtype -> (label, '')."""
+    match = LABEL_PATTERN.match(label or '')
+    if match:
+        return match.group(1), match.group(2).strip()
+    return (label or '').strip(), ''
+
+
+def render_inline_markup(clean_text, spans):
+    """
+    Inverse of parse_inline_markup: wraps the spans of clean_text in inline tags, so
+    parse_inline_markup(render_inline_markup(text, spans)) gives text and spans back.
+
+    Spans must have an ENAMEX/NUMEX/TIMEX type. A span that crosses the boundary of
+    an enclosing one cannot be written as nested tags and is left out.
+    """
+    parts = []
+    stack = []
+    position = 0
+
+    def write_text(end):
+        segment = html.escape(clean_text[position:end], quote=False)
+        if stack:
+            segment = html.escape(segment, quote=False)  # unescaped twice when read back
+        parts.append(segment)
+        return end
+
+    def close_tag():
+        span = stack[-1]
+        end = write_text(span.end)
+        stack.pop()
+        parts.append(f'</{span.type}>')
+        return end
+
+    for span in sorted(spans, key=lambda span: (span.start, -span.end)):
+        while stack and stack[-1].end <= span.start:
+            position = close_tag()
+        if stack and span.end > stack[-1].end:
+            continue
+
+        position = write_text(span.start)
+        attributes = ''.join(f' {name}="{value}"' for name, value in span.attrs.items())
+        parts.append(f'<{span.type}{attributes}>')
+        stack.append(span)
+
+    while stack:
+        position = close_tag()
+    write_text(len(clean_text))
+    return ''.join(parts)
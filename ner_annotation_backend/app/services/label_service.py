@@ -0,0 +1,84 @@
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.label_model import Label
+from ..models.project_model import Project
+from .inline_markup import split_label
+from .statistics_service import get_statistics, rebuild_statistics
+
+
+def get_label_ids(labels):
+    """
+    Maps label strings ('ENAMEX (PERSON)') to labels.id, adding the ones that are new.
+
+    The dictionary is small, so it is read whole (one query) rather than cached: an id
+    cached from a transaction that is later rolled back would point at nothing.
+    """
+    keys = {label: split_label(label) for label in set(labels) if label}
+    if not keys:
+        return {}
+
+    ids = {(label.type, label.subtype): label.id for label in Label.query.all()}
+    for key in set(keys.values()) - set(ids):
+        try:
+            with db.session.begin_nested():
+                label = Label(type=key[0], subtype=key[1])
+                db.session.add(label)
+            ids[key] = label.id
+        except IntegrityError:
+            # Added by a concurrent request in the meantime
+            ids[key] = Label.query.filter_by(type=key[0], subtype=key[1]).one().id
+
+    return {label: ids[key] for label, key in keys.items()}
+
+
+def find_label_ids(text):
+    """Ids of the labels whose name contains text, case-insensitively (what ilike('%text%') matched)."""
+    text = (text or '').lower()
+    return [label.id for label in Label.query.all() if text in label.name.lower()]
+
+
+def has_unlabeled_annotations():
+    return db.session.query(Annotation.id).filter(Annotation.label_id.is_(None)).first() is not None
+
+
+def get_label_counts(project_id=None):
+    """Annotation counts per label, read from the annotation_stats rollup."""
+    return get_statistics(project_id)['labels']
+
+
+def migrate_annotation_labels(batch_size=10000):
+    """
+    Fills annotations.label_id from the label text, in id ranges of batch_size rows,
+    one transaction each, then rebuilds annotation_stats, which only counts labeled
+    annotations. Returns the number of annotations updated.
+    """
+    texts = [row.annotation for row in db.session.query(Annotation.annotation).filter(
+        Annotation.label_id.is_(None)
+    ).distinct()]
+    if not texts:
+        return 0
+    label_ids = get_label_ids(texts)
+    db.session.commit()
+
+    updated = 0
+    max_id = db.session.query(func.max(Annotation.id)).scalar() or 0
+    for start in range(0, max_id + 1, batch_size):
+        result = db.session.execute(
+            update(Annotation)
+            .where(Annotation.id >= start, Annotation.id < start + batch_size, Annotation.label_id.is_(None))
+            .values(label_id=case(label_ids, value=Annotation.annotation))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        updated += result.rowcount
+        print(f"Labeled {updated} annotations (ids below {start + batch_size})")
+
+    # The gazetteers are built from labeled annotations; every project may have gained some
+    db.session.execute(update(Project).values(change_version=Project.change_version + 1)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    rebuild_statistics()
+    return updated
@@ -14,25 +14,38 @@ import html
 import re
 import datetime
 from ..models.sentence_model import Sentence
-
-def create_project(data, current_user):
-    print("Creating Project...")  # Debugging
-
+from ..models.import_job_model import ImportJob
+from .ingest_service import BulkSentenceWriter, iter_annotated_xml_records, iter_inline_xml_records, iter_text_records, \
+    iter_xml_stream_records
+from .segmentation import segment_text
+from .export_cache import purge_project_exports
+from .blob_service import delete_blob_if_unused, iter_blob_chunks, store_blob_bytes, store_blob_stream
+from .statistics_service import delete_project_stats
+from .suggestion_service import delete_project_suggestions
+
+def add_project_record(data, current_user, file_blob_hash=None):
     new_project = Project(
         title=data.get('title', 'Untitled Project'),
         description=data.get('description', ''),
         language=data.get('language', 'Unknown'),
-        file_text=data.get('file_text', ''),  # Storing the raw content
+        file_blob_hash=file_blob_hash,  # Raw content lives compressed in project_blobs
         uploaded_by=current_user,
         uploaded_on=datetime.datetime.now()
     )
 
     db.session.add(new_project)
     db.session.flush()  # Get new_project.id before committing
+    return new_project
+
+
+def create_project(data, current_user):
+    print("Creating Project...")  # Debugging
+
+    new_project = add_project_record(data, current_user, store_blob_bytes(data['file_text'].encode('utf-8')))
 
     file_text = data['file_text'].strip()
     is_xml = file_text.startswith("<") and file_text.endswith(">")
-    sentence_counter = 1  # Start numbering from 1 for this project
+    writer = BulkSentenceWriter(new_project.id)
 
     if is_xml:
         print("Detected XML input.")  # Debugging
@@ -45,106 +58,11 @@ def create_project(data, current_user):
 
             if contains_inline_annotations:
                 print("Detected inline annotations. Processing OLD XML format.")
-                for sentence_elem in root.findall(".//sentence"):
-                    raw_text = sentence_elem.get("text", "").strip()
-                    is_annotated = sentence_elem.get("isAnnotated") == "True"
-
-                    print(f"Processing Sentence {sentence_counter}: {raw_text}")
-
-                    decoded_text = html.unescape(raw_text)
-                    annotations = []
-
-                    def annotation_extractor(match):
-                        annotation_type = match.group(1)
-                        attributes = match.group(2)
-                        annotated_word = html.unescape(match.group(3))
-
-                        annotation_attrs = dict(re.findall(r'(\w+)="(.*?)"', attributes))
-                        annotations.append({
-                            'type': annotation_type,
-                            'text': annotated_word,
-                            'attributes': annotation_attrs
-                        })
-
-                        print(f"Extracted Annotation: {annotation_type} -> {annotated_word}")
-                        return annotated_word
-
-                    clean_text = re.sub(r'<(\w+)(.*?)>(.*?)</\1>', annotation_extractor, decoded_text)
-                    print(f"Cleaned Sentence {sentence_counter}: {clean_text}")
-
-                    sentence = Sentence(
-                        sentence_number=sentence_counter,
-                        content=clean_text,
-                        is_annotated=is_annotated,
-                        project_id=new_project.id
-                    )
-                    db.session.add(sentence)
-                    db.session.flush()
-
-                    if is_annotated:
-                        for annotation in annotations:
-                            annotation_id = annotation['attributes'].get('ID')
-                            annotation_type = annotation['type']
-                            annotation_subtype = annotation['attributes'].get('TYPE', '')
-                            annotated_word = annotation['text']
-
-                            print(f"Saving Annotation ID {annotation_id}: {annotation_type} ({annotation_subtype}) -> {annotated_word}")
-
-                            annotation_record = Annotation(
-                                word_phrase=annotated_word,
-                                annotation=f"{annotation_type} ({annotation_subtype})",
-                                annotated_by=current_user,
-                                annotated_on=datetime.datetime.now(),
-                                sentence_id=sentence.id,
-                                project_id=new_project.id
-                            )
-                            db.session.add(annotation_record)
-
-                    sentence_counter += 1  # Increment for next sentence
-            
+                writer.add_records(iter_inline_xml_records(root, current_user))
             else:
                 print("Processing NEW Annotated XML format.")  # Debugging
-                sentences_root = root.find("./sentences")
-                if sentences_root is None:
-                    raise ValueError("Invalid XML: <sentences> tag missing inside <project>.")
-                
-                for sentence_elem in sentences_root.findall(".//sentence"):
-                    raw_text = sentence_elem.get("text", "").strip()
-                    is_annotated = sentence_elem.get("isAnnotated") == "True"
-
-                    print(f"Processing Sentence {sentence_counter}: {raw_text}")
-                    
-                    sentence = Sentence(
-                        sentence_number=sentence_counter,
-                        content=raw_text,
-                        is_annotated=is_annotated,
-                        project_id=new_project.id
-                    )
-                    db.session.add(sentence)
-                    db.session.flush()
-
-                    annotations_elem = sentence_elem.find("annotations")
-                    if annotations_elem is not None:
-                        for annotation_elem in annotations_elem.findall("annotation"):
-                            annotation_id = annotation_elem.get("id")
-                            annotated_word = annotation_elem.get("word_phrase")
-                            annotation_type = annotation_elem.get("annotation")
-                            annotated_by = annotation_elem.get("annotated_by")
-                            annotated_on = annotation_elem.get("annotated_on")
-
-                            print(f"Saving Annotation ID {annotation_id}: {annotation_type} -> {annotated_word}")
-
-                            annotation_record = Annotation(
-                                word_phrase=annotated_word,
-                                annotation=annotation_type,
-                                annotated_by=annotated_by,
-                                annotated_on=datetime.datetime.strptime(annotated_on, "%Y-%m-%d"),
-                                sentence_id=sentence.id,
-                                project_id=new_project.id
-                            )
-                            db.session.add(annotation_record)
-                    
-                    sentence_counter += 1  # Increment for next sentence
+                writer.add_records(iter_annotated_xml_records(root))
+            stats = writer.close()
 
         except ET.ParseError as e:
             db.session.rollback()
@@ -158,29 +76,48 @@ def create_project(data, current_user):
     else:
         print("Detected Plain Text input.")  # Debugging
 
-        # Check if text contains Manipuri characters
-        if re.search(r'[\uABC0-\uABFF]', file_text):  # Manipuri Unicode range
-            sentences = split_manipuri_sentences(file_text)
-        else:
-            # Fallback to standard sentence splitting for other languages
-            sentences = re.split(r'[।|॥|\.|\?|!]\s*', file_text)
-
-        for sentence_text in sentences:
-            clean_text = sentence_text.strip()
-            if clean_text:
-                print(f"Saving Sentence {sentence_counter}: {clean_text}")
-
-                sentence = Sentence(
-                    sentence_number=sentence_counter,
-                    content=clean_text,
-                    is_annotated=False,
-                    project_id=new_project.id
-                )
-                db.session.add(sentence)
-                sentence_counter += 1
+        writer.add_records(iter_text_records(segment_text(file_text, new_project.language)))
+        stats = writer.close()
     
     db.session.commit()
-    print("Project Successfully Created!")  # Debugging
+    new_project.ingest_stats = stats
+    print(f"Project Successfully Created! {stats['sentences']} sentences, "
+          f"{stats['annotations']} annotations at {stats['rows_per_second']} rows/s")  # Debugging
+    return new_project
+
+
+def create_project_from_xml_stream(data, stream, current_user):
+    """
+    Streaming variant of create_project for XML uploads.
+
+    The upload is parsed with iterparse one <sentence> at a time and fed straight
+    into the bulk writer, so the document is never held as a tree or a string.
+    """
+    print("Creating Project from XML stream...")  # Debugging
+
+    new_project = add_project_record(data, current_user)
+    writer = BulkSentenceWriter(new_project.id)
+
+    try:
+        writer.add_records(iter_xml_stream_records(stream, current_user))
+        stats = writer.close()
+
+        # The raw upload is compressed chunk by chunk once parsing is done
+        stream.seek(0)
+        new_project.file_blob_hash = store_blob_stream(stream)
+    except ET.ParseError as e:
+        db.session.rollback()
+        print(f"XML Parsing Error: {str(e)}")  # Debugging
+        return jsonify({'message': 'Invalid XML format'}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Unexpected Error: {str(e)}")  # Debugging
+        return jsonify({'message': f'An error occurred: {str(e)}'}), 500
+
+    db.session.commit()
+    new_project.ingest_stats = stats
+    print(f"Project Successfully Created! {stats['sentences']} sentences, "
+          f"{stats['annotations']} annotations at {stats['rows_per_second']} rows/s")  # Debugging
     return new_project
 
 def delete_project(project_id):
@@ -196,11 +133,20 @@ def delete_project(project_id):
             Annotation.query.filter_by(sentence_id=sentence.id).delete()
 
         # Delete sentences associated with the project
+        delete_project_suggestions(project_id)
         Sentence.query.filter_by(project_id=project_id).delete()
+        delete_project_stats(project_id)
+
+        # Import jobs stay in the history, without the project they created
+        ImportJob.query.filter_by(project_id=project_id).update({'project_id': None}, synchronize_session=False)
 
-        # Finally, delete the project
+        # Finally, delete the project and its upload if no other project shares it
+        file_blob_hash = project.file_blob_hash
         db.session.delete(project)
+        db.session.flush()
+        delete_blob_if_unused(file_blob_hash)
         db.session.commit()
+        purge_project_exports(project_id)
         
         return {"message": "Project deleted successfully"}, 200
 
@@ -209,50 +155,45 @@ def delete_project(project_id):
         return {"error": str(e)}, 500
 
 
+def get_original_file(project_id):
+    """
+    Returns (project, chunk iterator) for the raw upload of a project, or (None, None).
+    Projects that were never migrated still have the upload inline in file_text.
+    """
+    project = Project.query.get(project_id)
+    if not project:
+        return None, None
 
-
-import re
-
+    if project.file_blob_hash:
+        return project, iter_blob_chunks(project.file_blob_hash)
+    return project, iter([(project.file_text or '').encode('utf-8')])
 
 
-def split_manipuri_sentences(text):
-    # Manipuri-specific delimiters including Chakhei (꯫) and others
-    delimiters = [
-        '\uABEB',  # Manipuri Chakhei (꯫)
-        '!',
-        '\?',
-        '।',       # Devanagari Danda
-        '॥',       # Devanagari Double Danda
-        '\n\n'     # Double newlines
-    ]
-    
-    # Create regex pattern that matches any delimiter followed by optional whitespace
-    pattern = '([' + ''.join(delimiters) + ']+\s*)'
-    
-    # Split text while keeping delimiters
-    parts = re.split(pattern, text)
-    
-    sentences = []
-    current_sentence = ''
-    
-    for part in parts:
-        if not part.strip():
-            continue
-            
-        # If part is a delimiter, finalize current sentence
-        if re.fullmatch(pattern, part):
-            if current_sentence:
-                sentences.append(current_sentence.strip())
-                current_sentence = ''
-        else:
-            current_sentence += part
-    
-    # Add any remaining text
-    if current_sentence.strip():
-        sentences.append(current_sentence.strip())
-    
-    return sentences
+def migrate_project_files(batch_size=50):
+    """
+    Moves file_text of existing projects into project_blobs, batch by batch.
+    Returns the number of projects migrated.
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        project_ids = [row.id for row in Project.query.with_entities(Project.id).filter(
+            Project.id > last_id,
+            Project.file_blob_hash.is_(None),
+            Project.file_text.isnot(None)
+        ).order_by(Project.id).limit(batch_size)]
+        if not project_ids:
+            return migrated
+
+        for project_id in project_ids:
+            project = Project.query.get(project_id)
+            project.file_blob_hash = store_blob_bytes(project.file_text.encode('utf-8'))
+            project.file_text = None
+            migrated += 1
 
+        db.session.commit()
+        last_id = project_ids[-1]
+        print(f"Migrated {migrated} project uploads to blob storage")
 
 
 def get_projects_by_language(language):
@@ -0,0 +1,174 @@
+import math
+import re
+import threading
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.project_model import Project
+from ..models.sentence_model import Sentence
+
+NGRAM_SIZE = 3
+
+# Word characters plus the Indic blocks (Devanagari to Sinhala, incl. Bengali script used for
+# Manipuri) and Meitei Mayek, so vowel signs, viramas and nuktas (combining marks that \w does
+# not match) stay inside their word. Dandas (U+0964/U+0965) and the Meitei Cheikhei (U+ABEB)
+# are punctuation. ZWJ/ZWNJ belong to the word they shape.
+WORD_CHARACTERS = '\\w\u0900-\u0963\u0966-\u0DFF\uA8E0-\uA8FF\uABC0-\uABEA\uABEC-\uABFF\u200C\u200D'
+WORD_PATTERN = re.compile(f'[{WORD_CHARACTERS}]+')
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+
+def iter_words(text):
+    """Yields (lowercased word, start, end) for the words of text."""
+    for match in WORD_PATTERN.finditer(text or ''):
+        yield match.group().lower(), match.start(), match.end()
+
+
+def tokenize(text):
+    return [word for word, _, _ in iter_words(text)]
+
+
+def escape_like(value):
+    """Escapes LIKE wildcards, for use with escape='!' (a backslash is read differently per dialect)."""
+    return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+class NgramIndex:
+    """
+    In-memory inverted index from character trigrams to row ids, for substring search
+    where the database has no trigram index (pg_trgm is PostgreSQL only).
+
+    A query is answered by intersecting the posting sets of its trigrams and then
+    checking the few candidates, instead of scanning every row.
+    """
+
+    def __init__(self, rows):
+        self.texts = {}
+        self.postings = {}
+        for row_id, text in rows:
+            text = (text or '').lower()
+            self.texts[row_id] = text
+            for gram in ngrams(text):
+                self.postings.setdefault(gram, set()).add(row_id)
+
+    def search(self, query):
+        """Sorted ids of the rows whose text contains query, case-insensitively."""
+        query = query.lower()
+        grams = ngrams(query)
+        if not grams:
+            # Shorter than a trigram: check every text, still without a database scan
+            return sorted(row_id for row_id, text in self.texts.items() if query in text)
+
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings)
+        return sorted(row_id for row_id in candidates if query in self.texts[row_id])
+
+
+class SentenceIndex:
+    """
+    In-memory inverted index from words to {sentence id: occurrences}, the fallback for
+    sentence search where PostgreSQL full-text search is not available.
+    """
+
+    def __init__(self, rows):
+        self.postings = {}
+        self.lengths = {}
+        self.projects = {}
+        for sentence_id, project_id, content in rows:
+            words = tokenize(content)
+            self.lengths[sentence_id] = len(words)
+            self.projects[sentence_id] = project_id
+            for word in words:
+                counts = self.postings.setdefault(word, {})
+                counts[sentence_id] = counts.get(sentence_id, 0) + 1
+
+    def search(self, terms, project_id=None):
+        """[(sentence id, rank)] of the sentences containing every term, best first."""
+        postings = sorted((self.postings.get(term, {}) for term in set(terms)), key=len)
+        if not postings:
+            return []
+
+        matches = set(postings[0]).intersection(*postings[1:])
+        if project_id is not None:
+            matches = {sentence_id for sentence_id in matches if self.projects[sentence_id] == project_id}
+
+        # Term frequency, damped for long sentences (like ts_rank normalization 1)
+        ranked = [
+            (sentence_id, sum(counts[sentence_id] for counts in postings) / (1 + math.log(self.lengths[sentence_id])))
+            for sentence_id in matches
+        ]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked
+
+
+class ProjectIndexes:
+    """
+    One in-memory index per project, built by load(project_id). refresh() rebuilds only
+    the projects whose version_column moved since the last call (one query on the
+    small projects table) and drops deleted ones. Indexes are replaced, never changed,
+    so the list returned by select() can be searched outside the lock.
+    """
+
+    def __init__(self, version_column, load):
+        self.version_column = version_column
+        self.load = load
+        self.indexes = {}  # project id -> index
+        self.versions = {}  # project id -> version the index was built at
+        self.lock = threading.Lock()
+
+    def select(self, project_id=None):
+        """The up-to-date indexes of every project, or of project_id only."""
+        with self.lock:
+            versions = dict(db.session.query(Project.id, self.version_column))
+            for deleted in set(self.indexes) - set(versions):
+                del self.indexes[deleted]
+            for changed, version in versions.items():
+                if self.versions.get(changed) != version:
+                    self.indexes[changed] = self.load(changed)
+            self.versions = versions
+            if project_id is None:
+                return list(self.indexes.values())
+            return [self.indexes[project_id]] if project_id in self.indexes else []
+
+
+def _load_sentence_index(project_id):
+    return SentenceIndex(
+        db.session.query(Sentence.id, Sentence.project_id, Sentence.content)
+        .filter(Sentence.project_id == project_id).yield_per(10000)
+    )
+
+
+# Keyed on sentence_version: annotation writes do not change what is indexed
+_sentence_indexes = ProjectIndexes(Project.sentence_version, _load_sentence_index)
+
+
+def search_sentence_index(terms, project_id=None):
+    """[(sentence id, rank)] of the sentences containing every term, best first, from the in-process indexes."""
+    ranked = []
+    for index in _sentence_indexes.select(project_id):
+        ranked.extend(index.search(terms))
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked
+
+
+def _load_phrase_index(project_id):
+    return NgramIndex(
+        db.session.query(Annotation.id, Annotation.word_phrase)
+        .filter(Annotation.project_id == project_id).yield_per(10000)
+    )
+
+
+# Every annotation write bumps its project's change_version in the same transaction
+_phrase_indexes = ProjectIndexes(Project.change_version, _load_phrase_index)
+
+
+def search_phrase_index(query):
+    """Sorted ids of the annotations whose word_phrase contains query, from the in-process indexes."""
+    matching_ids = []
+    for index in _phrase_indexes.select():
+        matching_ids.extend(index.search(query))
+    matching_ids.sort()
+    return matching_ids
@@ -0,0 +1,166 @@
+import codecs
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+MEITEI_RANGE = re.compile(r'[\uABC0-\uABFF]')  # Meitei Mayek block
+
+
+class RulePack:
+    """
+    Sentence boundary rules for one script, compiled once at import time.
+
+    Runs of terminators (plus trailing whitespace) end a sentence and are dropped
+    from it, as the old splitters did. A period is only a boundary when it is
+    followed by whitespace and does not close an abbreviation or a dotted acronym,
+    so "3.5", "आय.आय.टी." and, in packs with an abbreviation list, "Dr. Rao" or
+    "डॉ. राव" stay inside their sentence.
+    """
+
+    def __init__(self, name, terminators, newline_breaks=False, abbreviations=()):
+        self.name = name
+        self.abbreviations = frozenset(abbreviation.lower() for abbreviation in abbreviations)
+        self.checks_periods = '.' in terminators
+
+        characters = re.escape(''.join(terminators)) + ('\\n' if newline_breaks else '')
+        # Runs like "!!" leave empty pieces between delimiters, which are dropped
+        self.boundary = re.compile(f'[{characters}]\\s*')
+        # Capturing group: split() returns text, delimiter, text, delimiter, ..., text
+        self.splitter = re.compile(f'([{characters}]+\\s*)')
+
+    def iter_sentences(self, chunks):
+        """Yields stripped sentences from an iterable of text chunks."""
+        carry = ''
+        for chunk in chunks:
+            sentences, carry = self._split(carry + chunk, final=False)
+            yield from sentences
+
+        sentences, _ = self._split(carry, final=True)
+        yield from sentences
+
+    def _split(self, text, final):
+        """Returns (complete sentences, unfinished tail of text)."""
+        if not self.checks_periods or '.' not in text:
+            # Every delimiter is a boundary; a terminator run cut by a chunk edge only
+            # leaves an empty piece behind, which is dropped.
+            pieces = self.boundary.split(text)
+            tail = '' if final else pieces.pop()
+            sentences = [piece.strip() for piece in pieces]
+            return [sentence for sentence in sentences if sentence], tail
+
+        parts = self.splitter.split(text)
+
+        # A period at the very end of the text may turn out to be "3." of "3.5"
+        last = len(parts) - 1
+        if not final and last and not parts[last]:
+            last -= 2
+
+        sentences = []
+        current = []
+        for index in range(0, last, 2):
+            piece, delimiter = parts[index], parts[index + 1]
+            # "आय.आय.टी." - the piece continues a token glued to the previous period
+            glued = len(current) > 1 and not current[-1][-1:].isspace()
+            current.append(piece)
+            if self._is_boundary(piece, delimiter, parts[index + 2], glued):
+                sentence = ''.join(current).strip()
+                if sentence:
+                    sentences.append(sentence)
+                current = []
+            else:
+                current.append(delimiter)
+
+        tail = ''.join(current) + ''.join(parts[last:])
+        if final:
+            tail = tail.strip()
+            if tail:
+                sentences.append(tail)
+            tail = ''
+        return sentences, tail
+
+    def _is_boundary(self, piece, delimiter, next_piece, glued):
+        marks = delimiter.rstrip()
+        if marks.strip('.'):
+            return True  # '?', '!' or a danda in the run always ends the sentence
+        if len(marks) == len(delimiter) and next_piece:
+            return False  # no whitespace after the period: "3.5", "आय.आय.टी"
+
+        words = piece.rsplit(None, 1)
+        token = words[-1] if words else ''
+        if glued and len(words) == 1 and not piece[:1].isspace():
+            return False
+        return not ('.' in token or token.lower() in self.abbreviations)
+
+
+LATIN_ABBREVIATIONS = (
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'vs', 'etc', 'no', 'fig', 'vol',
+    'dept', 'govt', 'inc', 'ltd', 'co', 'corp', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul',
+    'aug', 'sep', 'sept', 'oct', 'nov', 'dec', 'e.g', 'i.e', 'approx', 'est', 'ref',
+)
+
+# Titles and short forms written with a period in Devanagari text
+DEVANAGARI_ABBREVIATIONS = (
+    'डॉ', 'श्री', 'श्रीमती', 'सुश्री', 'कु', 'प्रो', 'पं', 'स्व', 'मो', 'सं', 'पृ', 'क्र', 'रु',
+)
+
+RULE_PACKS = {
+    # Meitei Mayek: Cheikhei (꯫), dandas, ! and ?, and line breaks
+    'meitei': RulePack('meitei', '\uABEB!?।॥', newline_breaks=True),
+    # Devanagari and other Indic scripts: danda, double danda ('|' is often typed for it) and Latin punctuation
+    # (Latin abbreviations too, for mixed-script text)
+    'devanagari': RulePack('devanagari', '।॥|.?!', abbreviations=DEVANAGARI_ABBREVIATIONS + LATIN_ABBREVIATIONS),
+    'latin': RulePack('latin', '.?!', abbreviations=LATIN_ABBREVIATIONS),
+}
+
+LANGUAGE_PACKS = {
+    'manipuri': 'meitei',
+    'meitei': 'meitei',
+    'english': 'latin',
+}
+
+
+def get_rule_pack(language=None, sample=''):
+    """
+    Picks the rule pack for a project language, falling back to the script of the text.
+    Text containing Meitei Mayek always uses the Meitei rules, as before.
+    """
+    if sample and MEITEI_RANGE.search(sample):
+        return RULE_PACKS['meitei']
+    return RULE_PACKS[LANGUAGE_PACKS.get((language or '').strip().lower(), 'devanagari')]
+
+
+def segment_text(text, language=None):
+    """Generator over the sentences of an in-memory text."""
+    return get_rule_pack(language, text).iter_sentences([text])
+
+
+def segment_stream(stream, language=None, encoding='utf-8'):
+    """
+    Generator over the sentences of a binary stream (an upload or spool file),
+    decoded and segmented incrementally so sentences can be inserted as they come.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    def chunks():
+        while True:
+            data = stream.read(CHUNK_SIZE)
+            if not data:
+                break
+            yield decoder.decode(data)
+        yield decoder.decode(b'', final=True)
+
+    # The first few KB decide the rule pack
+    text_chunks = chunks()
+    first_chunk = ''
+    for chunk in text_chunks:
+        first_chunk += chunk
+        if len(first_chunk) >= 4096:
+            break
+    if first_chunk.startswith('\ufeff'):  # byte order mark
+        first_chunk = first_chunk[1:]
+
+    def all_chunks():
+        yield first_chunk
+        yield from text_chunks
+
+    return get_rule_pack(language, first_chunk).iter_sentences(all_chunks())
@@ -1,9 +1,144 @@
+import html
+
+from sqlalchemy import inspect, text
+
 from app.models.sentence_model import Sentence
+from .. import db
+from .search_index import iter_words, search_sentence_index, tokenize
+
+
+SENTENCE_FIELDS = ('id', 'content', 'is_annotated', 'sentence_number', 'user_id', 'project_id')
+DEFAULT_SENTENCE_FIELDS = ('id', 'content', 'is_annotated')  # what sentences_schema returns
+MAX_PAGE_SIZE = 1000
+
+
+def get_sentences(project_id, fields=DEFAULT_SENTENCE_FIELDS, after_id=None, limit=None, status=None, user_id=None):
+    """
+    Sentences of a project in id order as dicts of the requested fields, read with a
+    column-only query on the (project_id, id) index.
+
+    With a limit, returns one page ({"sentences", "next_after_id", "has_more"}): pass
+    next_after_id back as after_id for the next one. status is 'annotated' or
+    'unannotated'; user_id keeps the sentences assigned to that user.
+    """
+    columns = [getattr(Sentence, field) for field in fields]
+    if 'id' not in fields:
+        columns.append(Sentence.id)  # the cursor
+    query = db.session.query(*columns).filter(Sentence.project_id == project_id)
+    if after_id is not None:
+        query = query.filter(Sentence.id > after_id)
+    if status == 'annotated':
+        query = query.filter(Sentence.is_annotated.is_(True))
+    elif status == 'unannotated':
+        query = query.filter(Sentence.is_annotated.is_(False))
+    if user_id is not None:
+        query = query.filter(Sentence.user_id == user_id)
+    query = query.order_by(Sentence.id)
+
+    if limit is None:
+        return [{field: row[index] for index, field in enumerate(fields)} for row in query]
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "sentences": [{field: row[index] for index, field in enumerate(fields)} for row in rows],
+        "next_after_id": rows[-1].id if rows else after_id,
+        "has_more": has_more,
+    }
+
+
+def search_sentences(query_text, project_id=None, page=1, per_page=20):
+    """
+    Sentences containing every word of query_text, best ranked first, one page at a time.
+
+    PostgreSQL uses the search_vector GIN index (see schema.py); elsewhere, or when the
+    column could not be created, the in-process SentenceIndex answers the query.
+    """
+    terms = list(dict.fromkeys(tokenize(query_text)))
+    if not terms:
+        return {"results": [], "total": 0, "page": page, "per_page": per_page}
+
+    offset = (page - 1) * per_page
+    if has_search_vector():
+        ranked, total = _search_tsvector(terms, project_id, per_page, offset)
+    else:
+        matches = search_sentence_index(terms, project_id)
+        total = len(matches)
+        ranked = matches[offset:offset + per_page]
+
+    sentences = {sentence.id: sentence for sentence in Sentence.query.filter(
+        Sentence.id.in_([sentence_id for sentence_id, _ in ranked])
+    )} if ranked else {}
+
+    results = []
+    for sentence_id, rank in ranked:
+        sentence = sentences[sentence_id]
+        snippet, matches = highlight(sentence.content, terms)
+        results.append({
+            "sentence_id": sentence.id,
+            "project_id": sentence.project_id,
+            "sentence_number": sentence.sentence_number,
+            "is_annotated": sentence.is_annotated,
+            "rank": round(float(rank), 4),
+            "snippet": snippet,
+            "matches": matches,
+        })
+
+    return {"results": results, "total": total, "page": page, "per_page": per_page}
+
+
+def _search_tsvector(terms, project_id, limit, offset):
+    # Lexemes are quoted, so the words are matched exactly as tokenize() produced them
+    tsquery = ' & '.join("'" + term.replace('\\', '\\\\').replace("'", "''") + "'" for term in terms)
+    project_filter = "AND project_id = :project_id" if project_id is not None else ""
+    params = {'tsquery': tsquery, 'project_id': project_id, 'limit': limit, 'offset': offset}
+
+    rows = db.session.execute(text(f"""
+        SELECT id, ts_rank(search_vector, CAST(:tsquery AS tsquery), 1) AS rank
+        FROM sentences
+        WHERE search_vector @@ CAST(:tsquery AS tsquery) {project_filter}
+        ORDER BY rank DESC, id
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    total = db.session.execute(text(f"""
+        SELECT count(*) FROM sentences WHERE search_vector @@ CAST(:tsquery AS tsquery) {project_filter}
+    """), params).scalar()
+    return [(row.id, row.rank) for row in rows], total
+
+
+_has_search_vector = None
+
 
+def has_search_vector():
+    global _has_search_vector
+    if _has_search_vector is None:
+        _has_search_vector = db.engine.dialect.name == 'postgresql' and any(
+            column['name'] == 'search_vector' for column in inspect(db.engine).get_columns('sentences')
+        )
+    return _has_search_vector
 
-def get_sentences(data):
-    project_id = data['project_id']
-    sentences = Sentence.query.filter_by(project_id=project_id).order_by(Sentence.id).all()
-    return sentences
 
+def highlight(content, terms, width=160):
+    """
+    Returns (snippet, matches): a window of about width characters around the first hit,
+    HTML-escaped with hits wrapped in <mark>, and the [start, end] offsets of every hit.
+    """
+    terms = set(terms)
+    matches = [[start, end] for word, start, end in iter_words(content) if word in terms]
+    if not matches:
+        return html.escape(content[:width]), matches
 
+    window_start = max(0, matches[0][0] - width // 4)
+    window_end = min(len(content), window_start + width)
+    parts = ['…' if window_start > 0 else '']
+    position = window_start
+    for start, end in matches:
+        if start < position or end > window_end:
+            continue
+        parts.append(html.escape(content[position:start]))
+        parts.append(f"<mark>{html.escape(content[start:end])}</mark>")
+        position = end
+    parts.append(html.escape(content[position:window_end]))
+    parts.append('…' if window_end < len(content) else '')
+    return ''.join(parts), matches
@@ -0,0 +1,112 @@
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.annotation_stat_model import AnnotationStat
+from ..models.label_model import Label
+
+STAT_KEY_COLUMNS = ('project_id', 'label_id', 'annotated_by')
+
+
+def count_annotations(*criteria):
+    """Counter of (project_id, label_id, annotated_by) over the labeled annotations matching criteria."""
+    rows = db.session.query(
+        Annotation.project_id, Annotation.label_id, Annotation.annotated_by, func.count(Annotation.id)
+    ).filter(Annotation.label_id.isnot(None), *criteria) \
+        .group_by(Annotation.project_id, Annotation.label_id, Annotation.annotated_by)
+    return Counter({(project_id, label_id, annotated_by): count for project_id, label_id, annotated_by, count in rows})
+
+
+def count_rows(rows):
+    """The same Counter over annotation row dicts that are about to be inserted."""
+    return Counter(
+        (row['project_id'], row['label_id'], row['annotated_by'])
+        for row in rows if row.get('label_id') is not None
+    )
+
+
+def apply_stat_changes(added=(), removed=()):
+    """
+    Adds added and subtracts removed (Counters from count_annotations/count_rows) in
+    annotation_stats, in the caller's transaction. Each key is one INSERT ... ON CONFLICT
+    DO UPDATE row, so concurrent writers add up instead of overwriting each other.
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    rows = [
+        dict(zip(STAT_KEY_COLUMNS, key), annotation_count=count)
+        for key, count in deltas.items() if count
+    ]
+    if not rows:
+        return
+
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(AnnotationStat)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=list(STAT_KEY_COLUMNS),
+        set_={'annotation_count': AnnotationStat.annotation_count + statement.excluded.annotation_count},
+    ), rows)
+    db.session.execute(
+        delete(AnnotationStat)
+        .where(AnnotationStat.project_id.in_({row['project_id'] for row in rows}), AnnotationStat.annotation_count <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_project_stats(project_id):
+    db.session.execute(
+        delete(AnnotationStat).where(AnnotationStat.project_id == project_id).execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_statistics():
+    """Recomputes annotation_stats from annotations in one transaction. Returns the number of rollup rows."""
+    db.session.execute(delete(AnnotationStat).execution_options(synchronize_session=False))
+    db.session.execute(insert(AnnotationStat).from_select(
+        list(STAT_KEY_COLUMNS) + ['annotation_count'],
+        select(Annotation.project_id, Annotation.label_id, Annotation.annotated_by, func.count(Annotation.id))
+        .where(Annotation.label_id.isnot(None))
+        .group_by(Annotation.project_id, Annotation.label_id, Annotation.annotated_by)
+    ))
+    db.session.commit()
+    return db.session.query(func.count()).select_from(AnnotationStat).scalar()
+
+
+def get_statistics(project_id=None):
+    """
+    Annotation counts in total, per label and per annotator (and per project when
+    project_id is None), summed from the rollup rows instead of the annotations.
+    """
+    query = db.session.query(
+        AnnotationStat.project_id, AnnotationStat.label_id, AnnotationStat.annotated_by, AnnotationStat.annotation_count
+    )
+    if project_id is not None:
+        query = query.filter(AnnotationStat.project_id == project_id)
+
+    by_label, by_annotator, by_project = Counter(), Counter(), Counter()
+    for row_project_id, label_id, annotated_by, count in query:
+        by_label[label_id] += count
+        by_annotator[annotated_by] += count
+        by_project[row_project_id] += count
+
+    labels = Label.query.filter(Label.id.in_(by_label)).order_by(Label.type, Label.subtype).all() if by_label else []
+    statistics = {
+        'project_id': project_id,
+        'total_annotations': sum(by_label.values()),
+        'labels': [
+            {'label_id': label.id, 'label': label.name, 'type': label.type, 'subtype': label.subtype,
+             'count': by_label[label.id]}
+            for label in labels
+        ],
+        'annotators': [
+            {'annotated_by': annotated_by, 'count': count} for annotated_by, count in by_annotator.most_common()
+        ],
+    }
+    if project_id is None:
+        statistics['projects'] = [
+            {'project_id': row_project_id, 'count': count} for row_project_id, count in sorted(by_project.items())
+        ]
+    return statistics
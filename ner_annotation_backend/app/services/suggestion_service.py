@@ -0,0 +1,133 @@
+import datetime
+import time
+
+from flask import current_app
+from sqlalchemy import delete, insert
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.annotation_suggestion_model import AnnotationSuggestion
+from ..models.label_model import Label
+from ..models.project_model import Project
+from ..models.sentence_model import Sentence
+from .gazetteer import get_gazetteer
+
+SUGGESTION_COLUMNS = ('sentence_id', 'project_id', 'word_phrase', 'start_offset', 'end_offset', 'label_id', 'source', 'created_on')
+
+
+def suggestion_rows(gazetteer, sentence_id, project_id, content, created_on):
+    """annotation_suggestions rows for the gazetteer matches in one sentence."""
+    return [
+        {
+            'sentence_id': sentence_id,
+            'project_id': project_id,
+            'word_phrase': content[start:end],
+            'start_offset': start,
+            'end_offset': end,
+            'label_id': label_id,
+            'source': 'gazetteer',
+            'created_on': created_on,
+        }
+        for start, end, label_id in gazetteer.find(content)
+    ]
+
+
+def pre_annotate_project(project_id, sentence_ids=None, batch_size=None):
+    """
+    Runs the project language's gazetteer over the project's unannotated sentences
+    (or over sentence_ids), replacing their earlier gazetteer suggestions. Sentences
+    are read in keyset batches, one transaction each.
+    """
+    project = Project.query.get(project_id)
+    if not project:
+        return {'message': 'Project not found'}, 404
+
+    started = time.perf_counter()
+    gazetteer = get_gazetteer(project.language)
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+
+    query = db.session.query(Sentence.id, Sentence.content).filter(Sentence.project_id == project_id)
+    if sentence_ids is not None:
+        query = query.filter(Sentence.id.in_(sentence_ids))
+    else:
+        query = query.filter(Sentence.is_annotated.is_(False))
+
+    sentence_count = suggestion_count = 0
+    last_id = 0
+    while True:
+        batch = query.filter(Sentence.id > last_id).order_by(Sentence.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        now = datetime.datetime.now()
+        rows = []
+        for sentence_id, content in batch:
+            rows.extend(suggestion_rows(gazetteer, sentence_id, project_id, content, now))
+        db.session.execute(
+            delete(AnnotationSuggestion)
+            .where(AnnotationSuggestion.sentence_id.in_([sentence_id for sentence_id, _ in batch]),
+                   AnnotationSuggestion.source == 'gazetteer')
+            .execution_options(synchronize_session=False)
+        )
+        if rows:
+            db.session.execute(insert(AnnotationSuggestion), rows)
+        db.session.commit()
+
+        sentence_count += len(batch)
+        suggestion_count += len(rows)
+        last_id = batch[-1].id
+
+    elapsed = time.perf_counter() - started
+    return {
+        'message': 'Pre-annotation finished',
+        'project_id': project_id,
+        'language': project.language,
+        'dictionary_phrases': len(gazetteer.labels),
+        'sentences': sentence_count,
+        'suggestions': suggestion_count,
+        'seconds': round(elapsed, 3),
+        'sentences_per_minute': round(sentence_count * 60 / elapsed) if elapsed > 0 else sentence_count,
+    }, 200
+
+
+def get_sentence_suggestions(sentence_id):
+    """
+    Stored suggestions of a sentence with their label names. Suggestions the text no
+    longer matches (the sentence was edited) and spans that are already annotated
+    are left out.
+    """
+    sentence = Sentence.query.get(sentence_id)
+    if not sentence:
+        return None
+
+    annotated = {
+        (start, end) for start, end in db.session.query(Annotation.start_offset, Annotation.end_offset)
+        .filter(Annotation.sentence_id == sentence_id)
+    }
+    rows = db.session.query(AnnotationSuggestion, Label) \
+        .join(Label, AnnotationSuggestion.label_id == Label.id) \
+        .filter(AnnotationSuggestion.sentence_id == sentence_id) \
+        .order_by(AnnotationSuggestion.start_offset)
+    return [
+        {
+            'id': suggestion.id,
+            'sentence_id': suggestion.sentence_id,
+            'project_id': suggestion.project_id,
+            'word_phrase': suggestion.word_phrase,
+            'start_offset': suggestion.start_offset,
+            'end_offset': suggestion.end_offset,
+            'annotation': label.name,
+            'label_id': label.id,
+            'source': suggestion.source,
+        }
+        for suggestion, label in rows
+        if sentence.content[suggestion.start_offset:suggestion.end_offset] == suggestion.word_phrase
+        and (suggestion.start_offset, suggestion.end_offset) not in annotated
+    ]
+
+
+def delete_project_suggestions(project_id):
+    db.session.execute(
+        delete(AnnotationSuggestion).where(AnnotationSuggestion.project_id == project_id)
+        .execution_options(synchronize_session=False)
+    )
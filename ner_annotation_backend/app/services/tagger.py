@@ -0,0 +1,203 @@
+import gzip
+import json
+import re
+from collections import defaultdict
+
+from .search_index import WORD_CHARACTERS
+
+# Words (with their Indic vowel signs and viramas) or single punctuation marks
+TOKEN_PATTERN = re.compile(f'[{WORD_CHARACTERS}]+|[^\\s{WORD_CHARACTERS}]')
+OUTSIDE = 'O'
+
+
+def tokenize(text):
+    """[(start, end)] of the tokens of text."""
+    return [match.span() for match in TOKEN_PATTERN.finditer(text or '')]
+
+
+def bio_tags(tokens, spans):
+    """
+    BIO tags of tokens for (start, end, label id) spans. Tokens a span only partly
+    covers stay O; a span inside (or crossing) an earlier one is skipped.
+    """
+    tags = [OUTSIDE] * len(tokens)
+    covered_until = 0
+    for start, end, label_id in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if start < covered_until:
+            continue
+        inside = [index for index, (token_start, token_end) in enumerate(tokens)
+                  if token_start >= start and token_end <= end]
+        for position, index in enumerate(inside):
+            tags[index] = f"{'B' if position == 0 else 'I'}-{label_id}"
+        covered_until = end
+    return tags
+
+
+def tag_spans(tokens, tags):
+    """Inverse of bio_tags: (start, end, label id) of each B-/I- run (an I- without its B- starts a span)."""
+    spans = []
+    for (start, end), tag in zip(tokens, tags):
+        if tag == OUTSIDE:
+            continue
+        prefix, label_id = tag.split('-', 1)
+        if prefix == 'I' and spans and spans[-1][2] == int(label_id) and spans[-1][1] == previous_end:
+            spans[-1] = (spans[-1][0], end, spans[-1][2])
+        else:
+            spans.append((start, end, int(label_id)))
+        previous_end = end
+    return spans
+
+
+def align_spans(text, spans):
+    """spans trimmed to the tokens they cover (annotated spans often carry trailing spaces or punctuation)."""
+    tokens = tokenize(text)
+    return tag_spans(tokens, bio_tags(tokens, spans))
+
+
+def _shape(word):
+    if word.isdigit():
+        return 'digit'
+    if not word[0].isalnum():
+        return 'punct'
+    if word[0].isupper():
+        return 'upper'
+    return 'lower' if word.isascii() else 'script'
+
+
+def token_features(words, index, previous_tag, previous_tags):
+    original = words[index]
+    word = original.lower()
+    features = [
+        'bias',
+        f'w={word}',
+        f'p1={word[:1]}', f'p2={word[:2]}', f'p3={word[:3]}',
+        f's1={word[-1:]}', f's2={word[-2:]}', f's3={word[-3:]}',
+        f'shape={_shape(original)}',
+        f't-1={previous_tag}',
+        f't-2,t-1={previous_tags}',
+        f't-1,w={previous_tag} {word}',
+    ]
+    for offset in (-2, -1, 1, 2):
+        position = index + offset
+        neighbour = words[position].lower() if 0 <= position < len(words) else ('<s>' if position < 0 else '</s>')
+        features.append(f'w{offset:+d}={neighbour}')
+        if offset in (-1, 1):
+            features.append(f's3{offset:+d}={neighbour[-3:]}')
+    return features
+
+
+class AveragedPerceptron:
+    """
+    Multiclass perceptron with averaged weights (feature -> {class: weight}).
+    Averaging is done lazily: each weight remembers when it last changed.
+    """
+
+    def __init__(self, weights=None, classes=()):
+        self.weights = weights or {}
+        self.classes = sorted(classes)
+        self._totals = defaultdict(float)
+        self._timestamps = defaultdict(int)
+        self._instances = 0
+
+    def scores(self, features):
+        scores = dict.fromkeys(self.classes, 0.0)
+        for feature in features:
+            weights = self.weights.get(feature)
+            if weights:
+                for tag, weight in weights.items():
+                    scores[tag] += weight
+        return scores
+
+    def predict(self, features):
+        scores = self.scores(features)
+        return max(self.classes, key=lambda tag: (scores[tag], tag))
+
+    def update(self, truth, guess, features):
+        self._instances += 1
+        if truth == guess:
+            return
+        for feature in features:
+            weights = self.weights.setdefault(feature, {})
+            for tag, change in ((truth, 1.0), (guess, -1.0)):
+                key = (feature, tag)
+                weight = weights.get(tag, 0.0)
+                self._totals[key] += (self._instances - self._timestamps[key]) * weight
+                self._timestamps[key] = self._instances
+                weights[tag] = weight + change
+
+    def average(self):
+        for feature, weights in self.weights.items():
+            averaged = {}
+            for tag, weight in weights.items():
+                key = (feature, tag)
+                total = self._totals[key] + (self._instances - self._timestamps[key]) * weight
+                value = round(total / max(self._instances, 1), 4)
+                if value:
+                    averaged[tag] = value
+            self.weights[feature] = averaged
+        self.weights = {feature: weights for feature, weights in self.weights.items() if weights}
+        self._totals.clear()
+        self._timestamps.clear()
+
+
+class PerceptronTagger:
+    """
+    Greedy left-to-right BIO tagger over TOKEN_PATTERN tokens, with tags 'B-<label id>',
+    'I-<label id>' and 'O'. Trained sentence by sentence, so the training data can
+    be streamed; saved as gzip-compressed JSON.
+    """
+
+    def __init__(self, model=None, metadata=None):
+        self.model = model or AveragedPerceptron(classes=[OUTSIDE])
+        self.metadata = metadata or {}
+
+    def _decode(self, words, gold_tags=None):
+        tags = []
+        previous_tag, previous_tags = '<s>', '<s> <s>'
+        for index in range(len(words)):
+            features = token_features(words, index, previous_tag, previous_tags)
+            guess = self.model.predict(features)
+            if gold_tags is not None:
+                self.model.update(gold_tags[index], guess, features)
+                guess = gold_tags[index]  # condition the next token on the true history
+            tags.append(guess)
+            previous_tags = f'{previous_tag} {guess}'
+            previous_tag = guess
+        return tags
+
+    def add_classes(self, tags):
+        new = set(tags) - set(self.model.classes)
+        if new:
+            self.model.classes = sorted(set(self.model.classes) | new)
+
+    def train_sentence(self, text, spans):
+        tokens = tokenize(text)
+        if not tokens:
+            return 0
+        gold_tags = bio_tags(tokens, spans)
+        self.add_classes(gold_tags)
+        words = [text[start:end] for start, end in tokens]
+        self._decode(words, gold_tags)
+        return len(tokens)
+
+    def tag(self, text):
+        """[(start, end, label id)] predicted for text."""
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        words = [text[start:end] for start, end in tokens]
+        return tag_spans(tokens, self._decode(words))
+
+    def finish_training(self):
+        self.model.average()
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as model_file:
+            json.dump({'metadata': self.metadata, 'classes': self.model.classes, 'weights': self.model.weights},
+                      model_file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as model_file:
+            data = json.load(model_file)
+        return cls(AveragedPerceptron(data['weights'], data['classes']), data['metadata'])
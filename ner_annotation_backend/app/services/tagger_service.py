@@ -0,0 +1,244 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask import current_app
+
+from .. import db
+from ..models.annotation_model import Annotation
+from ..models.label_model import Label
+from ..models.project_model import Project
+from ..models.sentence_model import Sentence
+from .tagger import PerceptronTagger, align_spans
+
+# Every HELD_OUT_EVERY-th training sentence (in id order) is kept out of training to score the model
+HELD_OUT_EVERY = 10
+
+
+def model_path(language):
+    """The model file of a language under TAGGER_MODEL_DIR."""
+    name = re.sub(r'[^\w-]+', '_', language.strip().lower()) or '_'
+    return os.path.join(current_app.config['TAGGER_MODEL_DIR'], f'{name}.json.gz')
+
+
+def iter_training_sentences(language, batch_size):
+    """
+    Yields (sentence id, content, [(start, end, label id)]) for the annotated sentences
+    of the language's projects, read in keyset batches (one sentences query and one
+    annotations query per batch). Sentences with annotations that have no offsets or
+    no label are skipped: their gold tags would be incomplete.
+    """
+    query = db.session.query(Sentence.id, Sentence.content) \
+        .join(Project, Sentence.project_id == Project.id) \
+        .filter(Project.language == language, Sentence.is_annotated.is_(True))
+
+    last_id = 0
+    while True:
+        batch = query.filter(Sentence.id > last_id).order_by(Sentence.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        spans, incomplete = defaultdict(list), set()
+        rows = db.session.query(Annotation.sentence_id, Annotation.start_offset, Annotation.end_offset, Annotation.label_id) \
+            .filter(Annotation.sentence_id.in_([sentence_id for sentence_id, _ in batch]))
+        for sentence_id, start, end, label_id in rows:
+            if start is None or end is None or label_id is None:
+                incomplete.add(sentence_id)
+            else:
+                spans[sentence_id].append((start, end, label_id))
+
+        for sentence_id, content in batch:
+            if sentence_id in spans and sentence_id not in incomplete:
+                yield sentence_id, content, spans[sentence_id]
+
+
+def split_sentences(sentences, held_out):
+    """The training (held_out=False) or held-out sentences of an iter_training_sentences stream."""
+    for position, sentence in enumerate(sentences, 1):
+        if (position % HELD_OUT_EVERY == 0) == held_out:
+            yield sentence
+
+
+def evaluate(tagger, sentences):
+    """Exact-match span precision, recall and F1 of tagger on (id, content, spans) sentences, on token boundaries."""
+    true_positives = predicted = gold = 0
+    for _, content, spans in sentences:
+        expected = set(align_spans(content, spans))
+        found = set(tagger.tag(content))
+        true_positives += len(expected & found)
+        predicted += len(found)
+        gold += len(expected)
+    precision = true_positives / predicted if predicted else 0.0
+    recall = true_positives / gold if gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4), 'spans': gold}
+
+
+def train_tagger(language, epochs=None, batch_size=None, seed=7):
+    """
+    Trains the averaged-perceptron tagger of a language on its annotated sentences and
+    saves it to model_path(language). The training data is re-read from the database
+    each epoch, a batch at a time, so memory use does not grow with the corpus.
+    Returns a summary, or None when the language has no usable annotations.
+    """
+    epochs = epochs or current_app.config.get('TAGGER_EPOCHS', 5)
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    started = time.perf_counter()
+    rng = random.Random(seed)
+
+    tagger = PerceptronTagger()
+    sentence_count = token_count = 0
+    for epoch in range(epochs):
+        batch = []
+        for sentence in split_sentences(iter_training_sentences(language, batch_size), held_out=False):
+            batch.append(sentence)
+            if len(batch) >= batch_size:
+                token_count += _train_batch(tagger, batch, rng)
+                sentence_count += len(batch)
+                batch = []
+        token_count += _train_batch(tagger, batch, rng)
+        sentence_count += len(batch)
+        if not sentence_count:
+            return None
+        print(f"Epoch {epoch + 1}/{epochs}: {sentence_count // (epoch + 1)} sentences")  # Debugging
+    tagger.finish_training()
+
+    scores = evaluate(tagger, split_sentences(iter_training_sentences(language, batch_size), held_out=True))
+    label_ids = sorted({int(tag.split('-', 1)[1]) for tag in tagger.model.classes if '-' in tag})
+    tagger.metadata = {
+        'language': language,
+        'epochs': epochs,
+        'sentences': sentence_count // epochs,
+        'tokens': token_count // epochs,
+        'labels': {str(label.id): label.name for label in Label.query.filter(Label.id.in_(label_ids))},
+        'held_out': scores,
+        'trained_on': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+    path = model_path(language)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    tagger.save(temporary)
+    os.replace(temporary, path)  # loaded models are swapped only once the file is complete
+
+    summary = dict(tagger.metadata, path=path, features=len(tagger.model.weights),
+                   seconds=round(time.perf_counter() - started, 3))
+    return summary
+
+
+def _train_batch(tagger, batch, rng):
+    rng.shuffle(batch)
+    return sum(tagger.train_sentence(content, spans) for _, content, spans in batch)
+
+
+class LoadedModel:
+    """A tagger loaded from disk, with its predictions memoized by sentence content hash."""
+
+    def __init__(self, tagger, modified, memo_size):
+        self.tagger = tagger
+        self.modified = modified
+        self.memo_size = memo_size
+        self.predictions = OrderedDict()  # sha1 of the content -> spans, least recently used first
+        self.lock = threading.Lock()
+
+    def tag(self, content):
+        key = hashlib.sha1(content.encode('utf-8')).digest()
+        with self.lock:
+            spans = self.predictions.get(key)
+            if spans is not None:
+                self.predictions.move_to_end(key)
+                return spans
+        spans = self.tagger.tag(content)
+        with self.lock:
+            self.predictions[key] = spans
+            while len(self.predictions) > self.memo_size:
+                self.predictions.popitem(last=False)
+        return spans
+
+
+_models = OrderedDict()  # language -> LoadedModel, least recently used first
+_models_lock = threading.Lock()
+
+
+def get_model(language):
+    """
+    The LoadedModel of a language, or None when no model was trained. Models are
+    reloaded when their file changes and the least recently used one is evicted once
+    TAGGER_CACHE_SIZE languages are loaded.
+    """
+    path = model_path(language)
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        with _models_lock:
+            _models.pop(language, None)
+        return None
+
+    with _models_lock:
+        model = _models.get(language)
+        if model is not None and model.modified == modified:
+            _models.move_to_end(language)
+            return model
+
+    model = LoadedModel(PerceptronTagger.load(path), modified, current_app.config.get('TAGGER_MEMO_SIZE', 50000))
+    with _models_lock:
+        _models[language] = model
+        _models.move_to_end(language)
+        while len(_models) > current_app.config.get('TAGGER_CACHE_SIZE', 4):
+            _models.popitem(last=False)
+    return model
+
+
+def suggest_annotations(sentence_ids):
+    """
+    Model suggestions for a batch of sentences: {sentence id: [suggestion]}. Sentences
+    are grouped by project language so each model is looked up once, identical
+    contents are tagged once, and spans already annotated are left out.
+    """
+    rows = db.session.query(Sentence.id, Sentence.content, Project.language) \
+        .join(Project, Sentence.project_id == Project.id) \
+        .filter(Sentence.id.in_(sentence_ids)).all()
+
+    annotated = defaultdict(set)
+    for sentence_id, start, end in db.session.query(Annotation.sentence_id, Annotation.start_offset, Annotation.end_offset) \
+            .filter(Annotation.sentence_id.in_(sentence_ids)):
+        annotated[sentence_id].add((start, end))
+
+    by_language = defaultdict(list)
+    for sentence_id, content, language in rows:
+        by_language[language].append((sentence_id, content))
+
+    suggestions, missing_models = {}, []
+    for language, sentences in by_language.items():
+        model = get_model(language)
+        if model is None:
+            missing_models.append(language)
+            continue
+        labels = model.tagger.metadata.get('labels', {})
+        tagged = {}
+        for sentence_id, content in sentences:
+            if content not in tagged:
+                tagged[content] = model.tag(content)
+            suggestions[sentence_id] = [
+                {
+                    'word_phrase': content[start:end],
+                    'start_offset': start,
+                    'end_offset': end,
+                    'label_id': label_id,
+                    'annotation': labels.get(str(label_id)),
+                    'source': 'model',
+                }
+                for start, end, label_id in tagged[content]
+                if (start, end) not in annotated[sentence_id]
+            ]
+
+    return {
+        'suggestions': suggestions,
+        'not_found': sorted(set(sentence_ids) - {sentence_id for sentence_id, _, _ in rows}),
+        'languages_without_model': sorted(missing_models),
+    }
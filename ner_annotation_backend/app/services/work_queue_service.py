@@ -0,0 +1,109 @@
+import datetime
+
+from flask import current_app
+from sqlalchemy import and_, not_, or_, select, update
+
+from .. import db
+from ..models.sentence_model import Sentence
+
+# Claim rounds before giving up when other annotators keep taking the candidates (fallback path)
+MAX_CLAIM_ATTEMPTS = 5
+
+
+def _claimable(project_id, user_id, now):
+    """Unannotated sentences of the project, unassigned or assigned to the user, with no live lease."""
+    return and_(
+        Sentence.project_id == project_id,
+        not_(Sentence.is_annotated),  # as in the ix_sentences_unannotated partial index
+        or_(Sentence.user_id.is_(None), Sentence.user_id == user_id),
+        or_(Sentence.leased_to.is_(None), Sentence.lease_expires_at < now),
+    )
+
+
+def _renew_leases(project_id, user_id, now, expires_at):
+    """Extends the user's live leases in the project; returns their sentence ids."""
+    return db.session.execute(
+        update(Sentence)
+        .where(Sentence.project_id == project_id, Sentence.is_annotated.is_(False),
+               Sentence.leased_to == user_id, Sentence.lease_expires_at >= now)
+        .values(lease_expires_at=expires_at)
+        .returning(Sentence.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+
+def _claim(project_id, user_id, count, now, expires_at):
+    """
+    Leases up to count more claimable sentences to the user, lowest ids first.
+
+    On PostgreSQL the candidates are locked with FOR UPDATE SKIP LOCKED, so concurrent
+    requests take disjoint rows without waiting for each other. Elsewhere the UPDATE
+    re-checks the claim condition (compare and set) and the rows another request won
+    in between are replaced by the next candidates.
+    """
+    is_postgres = db.engine.dialect.name == 'postgresql'
+    claimed = []
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        wanted = count - len(claimed)
+        query = select(Sentence.id).where(_claimable(project_id, user_id, now)).order_by(Sentence.id).limit(wanted)
+        if is_postgres:
+            query = query.with_for_update(skip_locked=True)
+        candidates = db.session.execute(query).scalars().all()
+        if not candidates:
+            break
+
+        claimed += db.session.execute(
+            update(Sentence)
+            .where(Sentence.id.in_(candidates), _claimable(project_id, user_id, now))
+            .values(leased_to=user_id, lease_expires_at=expires_at)
+            .returning(Sentence.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if len(claimed) >= count or len(candidates) < wanted:
+            break  # done, or there were no more candidates anyway
+    return claimed
+
+
+def next_sentences(project_id, user_id, count=None):
+    """
+    The user's next sentences to annotate in a project, leased to them for
+    WORK_QUEUE_LEASE_SECONDS: the leases they still hold (renewed), topped up to
+    count (WORK_QUEUE_PREFETCH by default) with new ones. Expired leases are free
+    for anyone; nothing needs to clean them up.
+    """
+    count = count or current_app.config.get('WORK_QUEUE_PREFETCH', 10)
+    lease_seconds = current_app.config.get('WORK_QUEUE_LEASE_SECONDS', 900)
+    now = datetime.datetime.now()
+    expires_at = now + datetime.timedelta(seconds=lease_seconds)
+
+    held = _renew_leases(project_id, user_id, now, expires_at)
+    claimed = _claim(project_id, user_id, count - len(held), now, expires_at) if len(held) < count else []
+    db.session.commit()
+
+    sentence_ids = sorted(held + claimed)
+    rows = db.session.query(Sentence.id, Sentence.content, Sentence.sentence_number) \
+        .filter(Sentence.id.in_(sentence_ids)).order_by(Sentence.id).all() if sentence_ids else []
+    return {
+        "sentences": [
+            {"id": sentence_id, "content": content, "sentence_number": sentence_number}
+            for sentence_id, content, sentence_number in rows
+        ],
+        "renewed": len(held),
+        "claimed": len(claimed),
+        "lease_expires_at": expires_at.isoformat(),
+        "lease_seconds": lease_seconds,
+    }
+
+
+def release_sentences(user_id, sentence_ids=None, project_id=None):
+    """Gives up the user's leases on sentence_ids (or on all their sentences of project_id); returns how many."""
+    query = update(Sentence).where(Sentence.leased_to == user_id)
+    if sentence_ids is not None:
+        query = query.where(Sentence.id.in_(sentence_ids))
+    if project_id is not None:
+        query = query.where(Sentence.project_id == project_id)
+    released = db.session.execute(
+        query.values(leased_to=None, lease_expires_at=None).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return released
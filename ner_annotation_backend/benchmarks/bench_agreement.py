@@ -0,0 +1,125 @@
+"""
+Micro-benchmark: the NumPy agreement engine (agreement_service.compute_agreement) vs.
+the same statistics computed with Python dicts and loops, on a synthetic project.
+
+Every sentence gets a few gold spans; each annotator copies them, but drops, relabels
+or shifts some of them and adds a spurious one now and then.
+
+Run from ner_annotation_backend:  python -m benchmarks.bench_agreement [--sentences 100000] [--annotators 3]
+"""
+import argparse
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from app.services.agreement_service import compute_agreement
+
+
+def synthetic_annotations(sentence_count, annotator_count, label_count, seed):
+    rng = np.random.default_rng(seed)
+    spans_per_sentence = rng.integers(1, 6, sentence_count)
+    sentences = np.repeat(np.arange(sentence_count), spans_per_sentence)
+    starts = rng.integers(0, 40, len(sentences)) * 5
+    ends = starts + rng.integers(1, 5, len(sentences))
+    labels = rng.integers(0, label_count, len(sentences))
+
+    columns = []
+    for annotator in range(annotator_count):
+        keep = rng.random(len(sentences)) > 0.08
+        relabel = rng.random(len(sentences)) < 0.07
+        shift = rng.random(len(sentences)) < 0.05
+        annotator_labels = np.where(relabel, rng.integers(0, label_count, len(sentences)), labels)
+        annotator_ends = ends + shift
+        extra = rng.random(sentence_count) < 0.1
+        columns.append((
+            np.concatenate([sentences[keep], np.flatnonzero(extra)]),
+            np.full(keep.sum() + extra.sum(), annotator),
+            np.concatenate([annotator_labels[keep], rng.integers(0, label_count, extra.sum())]),
+            np.concatenate([starts[keep], np.full(extra.sum(), 300)]),
+            np.concatenate([annotator_ends[keep], np.full(extra.sum(), 303)]),
+        ))
+    return [np.concatenate(parts) for parts in zip(*columns)]
+
+
+def python_agreement(sentences, annotators, labels, starts, ends, annotator_count, label_count):
+    """Fleiss' kappa and per-pair Cohen's kappa / F1 with dicts and loops, as a reference."""
+    units = defaultdict(dict)
+    covered = defaultdict(set)
+    for sentence, annotator, label, start, end in zip(sentences.tolist(), annotators.tolist(), labels.tolist(),
+                                                      starts.tolist(), ends.tolist()):
+        units[(sentence, start, end)][annotator] = label + 1
+        covered[sentence].add(annotator)
+
+    ratings = []
+    for (sentence, _, _), labeled in units.items():
+        ratings.append({annotator: labeled.get(annotator, 0) for annotator in covered[sentence]})
+
+    category_count = label_count + 1
+    totals = [0] * category_count
+    agreement_sum, rated_units, rater_sum = 0.0, 0, 0
+    for unit in ratings:
+        if len(unit) < 2:
+            continue
+        counts = [0] * category_count
+        for category in unit.values():
+            counts[category] += 1
+        raters = len(unit)
+        agreement_sum += (sum(count * count for count in counts) - raters) / (raters * (raters - 1))
+        rated_units += 1
+        rater_sum += raters
+        for category, count in enumerate(counts):
+            totals[category] += count
+    expected = sum((total / rater_sum) ** 2 for total in totals)
+    fleiss = (agreement_sum / rated_units - expected) / (1 - expected)
+
+    pairs = []
+    for first in range(annotator_count):
+        for second in range(first + 1, annotator_count):
+            shared = [(unit[first], unit[second]) for unit in ratings
+                      if first in unit and second in unit and (unit[first] or unit[second])]
+            observed = sum(a == b for a, b in shared) / len(shared)
+            first_totals, second_totals = defaultdict(int), defaultdict(int)
+            for a, b in shared:
+                first_totals[a] += 1
+                second_totals[b] += 1
+            chance = sum(first_totals[category] * second_totals[category] for category in first_totals) / len(shared) ** 2
+            matched = sum(a == b and a > 0 for a, b in shared)
+            spans = sum(a > 0 for a, _ in shared) + sum(b > 0 for _, b in shared)
+            pairs.append(((observed - chance) / (1 - chance), 2 * matched / spans))
+    return fleiss, pairs
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', type=int, default=100000)
+    parser.add_argument('--annotators', type=int, default=3)
+    parser.add_argument('--labels', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    columns = synthetic_annotations(args.sentences, args.annotators, args.labels, args.seed)
+    vectorized, numpy_seconds = timed(lambda: compute_agreement(*columns, args.annotators, args.labels))
+    (fleiss, pairs), python_seconds = timed(lambda: python_agreement(*columns, args.annotators, args.labels))
+
+    difference = max([abs(vectorized['fleiss_kappa'] - fleiss)] + [
+        max(abs(pair['cohen_kappa'] - kappa), abs(pair['f1'] - f1))
+        for pair, (kappa, f1) in zip(vectorized['pairs'], pairs)
+    ])
+    print(f"{args.sentences} sentences, {len(columns[0])} annotations, {args.annotators} annotators, "
+          f"{vectorized['units']} units, fleiss kappa {vectorized['fleiss_kappa']:.4f}, "
+          f"max difference {difference:.2e}{'' if difference < 1e-9 and not math.isnan(difference) else ' MISMATCH'}")
+    for name, seconds in (('python', python_seconds), ('numpy', numpy_seconds)):
+        print(f"{name:<8} {seconds:6.2f}s | {len(columns[0]) / seconds:12.0f} annotations/s")
+    print(f"speedup x{python_seconds / numpy_seconds:.2f}")
+
+
+if __name__ == '__main__':
+    main()
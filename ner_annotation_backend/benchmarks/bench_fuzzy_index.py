@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: bigram-filtered fuzzy phrase lookup vs. a naive Levenshtein scan over the
+whole vocabulary (with the same early cut-off), which is what a fuzzy search without
+an index has to do.
+
+The vocabulary is the annotated phrases of 1_output.xml, filled up to --size with
+new phrases of one to three words taken from them, a tenth of which are spelling
+variants (one or two edits drawn from the phrases' own characters). Queries are
+sample phrases with up to --distance edits.
+
+Run from ner_annotation_backend:  python -m benchmarks.bench_fuzzy_index [--size 5000] [--distance 1]
+"""
+import argparse
+import os
+import random
+import time
+import xml.etree.ElementTree as ET
+
+from app.services.fuzzy_index import EditDistanceIndex, levenshtein, normalize_phrase
+from app.services.inline_markup import parse_inline_markup
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '1_output.xml')
+
+
+def load_phrases(path):
+    phrases = set()
+    for elem in ET.parse(path).getroot().iter('sentence'):
+        text, spans = parse_inline_markup(elem.get('text', '').strip())
+        phrases.update(normalize_phrase(text[span.start:span.end]) for span in spans)
+    phrases.discard('')
+    return sorted(phrases)
+
+
+def mutate(phrase, alphabet, rng, edits):
+    for _ in range(edits):
+        position = rng.randrange(len(phrase) + 1)
+        operation = rng.choice(('insert', 'delete', 'substitute')) if phrase else 'insert'
+        if operation == 'insert':
+            phrase = phrase[:position] + rng.choice(alphabet) + phrase[position:]
+        elif operation == 'delete' or position == len(phrase):
+            phrase = phrase[:max(position - 1, 0)] + phrase[position:]
+        else:
+            phrase = phrase[:position] + rng.choice(alphabet) + phrase[position + 1:]
+    return phrase
+
+
+def naive_search(vocabulary, query, max_distance):
+    return [(distance, term) for term in vocabulary
+            for distance in (levenshtein(query, term, max_distance),) if distance <= max_distance]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='vocabulary size (distinct phrases)')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--distance', type=int, default=1, help='maximum edit distance')
+    parser.add_argument('--file', default=SAMPLE_FILE, help='XML file to take phrases from')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sample = load_phrases(args.file)
+    alphabet = sorted({char for phrase in sample for char in phrase if not char.isspace()})
+    words = sorted({word for phrase in sample for word in phrase.split()})
+    vocabulary = set(sample)
+    while len(vocabulary) < args.size:
+        phrase = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.1:
+            phrase = mutate(phrase, alphabet, rng, rng.randint(1, 2))
+        vocabulary.add(phrase)
+    vocabulary = sorted(vocabulary)
+    queries = [mutate(rng.choice(sample), alphabet, rng, rng.randint(0, args.distance)) for _ in range(args.queries)]
+
+    index, build_seconds = timed(lambda: EditDistanceIndex(vocabulary))
+    naive, naive_seconds = timed(lambda: [naive_search(vocabulary, query, args.distance) for query in queries])
+    indexed, index_seconds = timed(lambda: [index.search(query, args.distance) for query in queries])
+
+    mismatches = sum(sorted(expected) != sorted(found) for expected, found in zip(naive, indexed))
+    matches = sum(len(found) for found in indexed)
+    print(f"{len(vocabulary)} phrases ({len(sample)} from the sample), {len(queries)} queries, "
+          f"distance <= {args.distance}, {matches} matches, {mismatches} queries differ")
+    print(f"index build   {build_seconds:6.2f}s")
+    for name, seconds in (('naive scan', naive_seconds), ('bigram index', index_seconds)):
+        print(f"{name:<13} {seconds:6.2f}s | {seconds / len(queries) * 1000:8.2f} ms/query")
+    print(f"speedup x{naive_seconds / index_seconds:.2f}")
+
+
+if __name__ == '__main__':
+    main()
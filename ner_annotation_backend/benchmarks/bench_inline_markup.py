@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: single-pass inline markup parser vs. the regex/closure extractor
+that create_project and upload_annotated_xml used before.
+
+Sentences are taken from 1_output.xml and repeated until the corpus reaches --mb.
+
+Run from ner_annotation_backend:  python -m benchmarks.bench_inline_markup [--mb 8]
+"""
+import argparse
+import html
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+from app.services.inline_markup import parse_inline_markup
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '1_output.xml')
+
+
+def legacy_extract(raw_text):
+    decoded_text = html.unescape(raw_text)
+    annotations = []
+
+    def annotation_extractor(match):
+        annotation_type = match.group(1)
+        attributes = match.group(2)
+        annotated_word = html.unescape(match.group(3))
+
+        annotation_attrs = dict(re.findall(r'(\w+)="(.*?)"', attributes))
+        annotations.append({
+            'type': annotation_type,
+            'text': annotated_word,
+            'attributes': annotation_attrs
+        })
+        return annotated_word
+
+    clean_text = re.sub(r'<(\w+)(.*?)>(.*?)</\1>', annotation_extractor, decoded_text)
+    return clean_text, annotations
+
+
+def load_sentences(path):
+    return [elem.get('text', '').strip() for elem in ET.parse(path).getroot().iter('sentence')]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=8, help='corpus size in MB')
+    parser.add_argument('--file', default=SAMPLE_FILE, help='XML file to take sentences from')
+    args = parser.parse_args()
+
+    sample = load_sentences(args.file)
+    sample_bytes = sum(len(text.encode('utf-8')) for text in sample)
+    sentences = sample * max(1, int(args.mb * 1024 * 1024 / sample_bytes))
+    size_mb = sample_bytes * (len(sentences) // len(sample)) / 1024 / 1024
+
+    legacy, legacy_seconds = timed(lambda: [legacy_extract(text) for text in sentences])
+    parsed, parser_seconds = timed(lambda: [parse_inline_markup(text) for text in sentences])
+
+    # Both should agree on the cleaned text and the annotated words; nested tags are the
+    # known exception, where the old regex left the inner tag in the text
+    mismatches = 0
+    for (legacy_text, annotations), (clean_text, spans) in zip(legacy[:len(sample)], parsed[:len(sample)]):
+        words = [clean_text[span.start:span.end] for span in spans]
+        if legacy_text != clean_text or words != [annotation['text'] for annotation in annotations]:
+            mismatches += 1
+
+    spans = sum(len(spans) for _, spans in parsed)
+    print(f"{len(sentences)} sentences, {size_mb:.1f} MB, {spans} spans, {mismatches} sample sentences differ")
+    for name, seconds in (('legacy', legacy_seconds), ('single-pass', parser_seconds)):
+        print(f"{name:<12} {seconds:6.2f}s | {len(sentences) / seconds:10.0f} sentences/s | {size_mb / seconds:6.1f} MB/s")
+    print(f"speedup x{legacy_seconds / parser_seconds:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: segmentation engine vs. the splitters create_project used before.
+
+Run from ner_annotation_backend:  python -m benchmarks.bench_segmentation [--mb 8]
+"""
+import argparse
+import io
+import re
+import time
+
+from app.services.segmentation import segment_stream, segment_text
+
+
+def legacy_split_manipuri_sentences(text):
+    delimiters = ['꯫', '!', '\\?', '।', '॥', '\n\n']
+    pattern = '([' + ''.join(delimiters) + ']+\\s*)'
+    parts = re.split(pattern, text)
+
+    sentences = []
+    current_sentence = ''
+    for part in parts:
+        if not part.strip():
+            continue
+        if re.fullmatch(pattern, part):
+            if current_sentence:
+                sentences.append(current_sentence.strip())
+                current_sentence = ''
+        else:
+            current_sentence += part
+
+    if current_sentence.strip():
+        sentences.append(current_sentence.strip())
+    return sentences
+
+
+def legacy_split(text):
+    if re.search(r'[ꯀ-꯿]', text):
+        return legacy_split_manipuri_sentences(text)
+    return [s.strip() for s in re.split(r'[।|॥|\.|\?|!]\s*', text) if s.strip()]
+
+
+CORPORA = {
+    'devanagari': 'भारतीय प्रौद्योगिकी संस्थान ने आज नई प्रयोगशाला का उद्घाटन किया। डॉ. राव ने कार्यक्रम में भाग लिया! क्या यह सही है? ',
+    'meitei': 'ꯑꯩꯅꯥ ꯂꯥꯏꯔꯤꯛ ꯄꯥꯔꯤ꯫ ꯃꯍꯥꯛ ꯌꯨꯝꯗꯥ ꯆꯠꯂꯦ꯫\nꯑꯗꯨ ꯑꯐꯕꯅꯤ! ',
+    'latin': 'Dr. Rao visited the campus on Monday. The budget was 3.5 crore! Was it approved? ',
+}
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=8, help='corpus size per script in MB')
+    args = parser.parse_args()
+
+    for name, unit in CORPORA.items():
+        repeat = int(args.mb * 1024 * 1024 / len(unit.encode('utf-8')))
+        text = unit * repeat
+        size_mb = len(text.encode('utf-8')) / 1024 / 1024
+
+        legacy, legacy_seconds = timed(lambda: legacy_split(text))
+        engine, engine_seconds = timed(lambda: list(segment_text(text, 'English' if name == 'latin' else None)))
+        streamed, stream_seconds = timed(
+            lambda: sum(1 for _ in segment_stream(io.BytesIO(text.encode('utf-8')), 'English' if name == 'latin' else None))
+        )
+
+        print(f"{name:<11} {size_mb:6.1f} MB | legacy {legacy_seconds:6.2f}s ({len(legacy)} sentences)"
+              f" | engine {engine_seconds:6.2f}s ({len(engine)})"
+              f" | stream {stream_seconds:6.2f}s ({streamed})"
+              f" | speedup x{legacy_seconds / engine_seconds:.2f}")
+
+
+if __name__ == '__main__':
+    main()